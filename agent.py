@@ -0,0 +1,223 @@
+"""
+Tool registry and multi-turn agent loop.
+
+The loop sends the conversation with every registered tool, executes all tool_use blocks of a
+response in parallel, appends the assistant turn and the tool_result blocks to the real
+conversation history, and repeats until the model ends its turn or the step or token budget
+runs out. Latency and token counts are recorded per step.
+"""
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt_builder import CACHE_BREAKPOINT, cache_usage
+from tools import TRANSACTION_ANALYSES, bribery_playbook, communication_network, transaction_analytics
+from tracing import in_current_context, span
+
+MAX_STEPS = 8
+MAX_OUTPUT_TOKENS = 4000
+TOOL_WORKERS = 8
+
+
+class ToolRegistry:
+    """
+    Named tools with their JSON input schemas.
+    """
+
+    def __init__(self):
+        self._tools = {}
+
+    def add(self, fn, name, description, input_schema):
+        self._tools[name] = (fn, {"name": name, "description": description, "input_schema": input_schema})
+        return fn
+
+    def register(self, name, description, input_schema):
+        """
+        Decorator form of add.
+        """
+        return lambda fn: self.add(fn, name, description, input_schema)
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def schemas(self):
+        """
+        Tool definitions for the API, with a cache breakpoint so the schemas are not re-billed each step.
+        """
+        definitions = [dict(definition) for _, definition in self._tools.values()]
+        if definitions:
+            definitions[-1]["cache_control"] = CACHE_BREAKPOINT
+        return definitions
+
+    def execute(self, tool_use):
+        """
+        Run one tool_use block and return its tool_result block.
+        """
+        result = {"type": "tool_result", "tool_use_id": tool_use.id}
+        if tool_use.name not in self._tools:
+            return {**result, "content": f"Unknown tool: {tool_use.name}", "is_error": True}
+        fn, _ = self._tools[tool_use.name]
+        with span(f"tool.{tool_use.name}") as current:
+            try:
+                output = fn(**tool_use.input)
+            except Exception as e:
+                current.set(error=f"{type(e).__name__}: {e}")
+                return {**result, "content": f"{type(e).__name__}: {e}", "is_error": True}
+            content = output if isinstance(output, str) else json.dumps(output, default=str)
+            current.set(result_bytes=len(content))
+        return {**result, "content": content}
+
+
+def default_registry():
+    """
+    Registry with the project's investigation tools.
+    """
+    registry = ToolRegistry()
+    registry.add(
+        bribery_playbook,
+        "bribery_playbook",
+        "Query the database for bribery related information on policy, transactions, and communications between two individuals of interest.",
+        {
+            "type": "object",
+            "properties": {
+                "user1": {"type": "string", "description": "The first user to query."},
+                "user2": {"type": "string", "description": "The second user to query."},
+                "collection_name": {"type": "string", "description": "The name of the collection to query."},
+            },
+            "required": ["user1", "user2"],
+        },
+    )
+    registry.add(
+        communication_network,
+        "communication_network",
+        "Look up a person's communication network from the full email corpus: their heaviest contacts with message counts each way, first and last contact dates and transaction volume, their centrality, how many people are reachable within a few hops, and days of unusually heavy email activity. Use it to find or check secondary people of interest.",
+        {
+            "type": "object",
+            "properties": {
+                "person": {"type": "string", "description": "Email address or name of the person."},
+                "limit": {"type": "integer", "description": "Maximum number of contacts to return."},
+                "hops": {"type": "integer", "description": "Neighbourhood radius to count reachable people in."},
+            },
+            "required": ["person"],
+        },
+    )
+    registry.add(
+        transaction_analytics,
+        "transaction_analytics",
+        "Run exact, structured queries over every financial transaction (not a semantic search). Filter by sender, receiver, a pair of parties in either direction, amount range, date range and label, then either list the matching transactions or run an analysis: totals per sender/receiver pair, 7-day rolling totals per pair, unusually large amounts for a pair, exact round amounts, or structuring (several payments kept just under a reporting threshold). Optionally attach the emails exchanged by the same parties within 3 days of each transaction.",
+        {
+            "type": "object",
+            "properties": {
+                "analysis": {"type": "string", "enum": list(TRANSACTION_ANALYSES), "description": "What to compute."},
+                "sender": {"type": "string", "description": "Only payments by this party."},
+                "receiver": {"type": "string", "description": "Only payments to this party."},
+                "between": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "minItems": 2,
+                    "maxItems": 2,
+                    "description": "Only payments between these two parties, in either direction.",
+                },
+                "min_amount": {"type": "number", "description": "Smallest amount to include."},
+                "max_amount": {"type": "number", "description": "Largest amount to include."},
+                "start": {"type": "string", "description": "Earliest date (ISO 8601)."},
+                "end": {"type": "string", "description": "Latest date (ISO 8601)."},
+                "label": {"type": "string", "description": "Only transactions with this label, e.g. suspicious."},
+                "threshold": {
+                    "type": "number",
+                    "description": "Reporting threshold for structuring, or minimum window total for rolling_totals.",
+                },
+                "limit": {"type": "integer", "description": "Maximum number of rows to return."},
+                "related_emails": {"type": "boolean", "description": "Attach emails between the parties near each transaction."},
+            },
+        },
+    )
+    return registry
+
+
+def run_agent(
+    client,
+    model,
+    messages,
+    registry,
+    system=None,
+    max_steps=MAX_STEPS,
+    max_tokens=MAX_OUTPUT_TOKENS,
+    token_budget=None,
+    **create_kwargs,
+):
+    """
+    Run the conversation until the model stops calling tools.
+
+    messages is extended in place with every assistant turn and tool result. Stops after
+    max_steps model calls, or once input plus output tokens reach token_budget. If tool results
+    are still pending then, one last call with tool_choice "none" asks the model to answer from
+    what it has, so the run always ends on a text turn. Returns the last response and a list of
+    per-step records.
+    """
+    steps = []
+    total_tokens = 0
+    system_kwargs = {"system": system} if system is not None else {}
+
+    def call(step, **kwargs):
+        started = time.perf_counter()
+        response = client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=messages,
+            tools=registry.schemas(),
+            **system_kwargs,
+            **{**create_kwargs, **kwargs},
+        )
+        record = {
+            "step": step,
+            "model_latency_s": time.perf_counter() - started,
+            "stop_reason": response.stop_reason,
+            **cache_usage(response.usage),
+        }
+        messages.append({"role": "assistant", "content": response.content})
+        steps.append(record)
+        return response, record
+
+    with ThreadPoolExecutor(max_workers=TOOL_WORKERS) as executor:
+        for step in range(max_steps):
+            response, record = call(step)
+            total_tokens += (
+                record["input_tokens"]
+                + record["cache_creation_input_tokens"]
+                + record["cache_read_input_tokens"]
+                + record["output_tokens"]
+            )
+
+            tool_uses = [block for block in response.content if block.type == "tool_use"]
+            if response.stop_reason != "tool_use" or not tool_uses:
+                break
+
+            started = time.perf_counter()
+            results = list(executor.map(in_current_context(registry.execute), tool_uses))
+            record["tool_latency_s"] = time.perf_counter() - started
+            record["tools"] = [tool_use.name for tool_use in tool_uses]
+            messages.append({"role": "user", "content": results})
+
+            if token_budget is not None and total_tokens >= token_budget:
+                break
+    if messages[-1]["role"] == "user":
+        # Out of steps or budget with tool results unanswered: the last turn has no text yet
+        response, record = call(len(steps), tool_choice={"type": "none"})
+        record["final"] = True
+    return response, steps
+
+
+def format_steps(steps):
+    """
+    One line per step: latency, tokens and tools called.
+    """
+    lines = []
+    for record in steps:
+        tools = f", tools {record['tools']} in {record['tool_latency_s']:.2f}s" if "tools" in record else ""
+        lines.append(
+            f"Step {record['step']}: model {record['model_latency_s']:.2f}s, "
+            f"{record['input_tokens']} in / {record['cache_read_input_tokens']} cached / "
+            f"{record['output_tokens']} out tokens, stop {record['stop_reason']}{tools}"
+        )
+    return "\n".join(lines)
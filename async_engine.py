@@ -0,0 +1,270 @@
+"""
+Asyncio investigation engine for running many POI investigations concurrently.
+
+Jobs are dicts with a "job_id", a "poi" and a "prompt". All requests share one AsyncAnthropic
+client (and so one connection pool), per-minute request and token budgets are enforced
+client-side, 429/529 responses are retried with jittered backoff, and each result is appended
+to a JSONL file as soon as it finishes.
+
+    python async_engine.py jobs.jsonl results.jsonl --rpm 50 --tpm 40000
+    python async_engine.py jobs.jsonl results.jsonl --fake   # offline, against fake_llm
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import anthropic
+import httpx
+from dotenv import load_dotenv
+
+from prompt_builder import build_request, cache_usage
+from prompt_format import restore_aliases
+from utils import count_tokens
+
+MODEL = "claude-4-sonnet-20250514"
+CONCURRENCY = 16
+REQUESTS_PER_MINUTE = 50
+TOKENS_PER_MINUTE = 40_000
+MAX_OUTPUT_TOKENS = 4000
+MAX_RETRIES = 6
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 529}
+
+
+def make_client(max_connections=CONCURRENCY):
+    """
+    Create one AsyncAnthropic client whose connection pool is sized for the engine.
+
+    SDK-level retries are disabled because the engine retries with its own rate limiter.
+    """
+    http_client = anthropic.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+    )
+    return anthropic.AsyncAnthropic(http_client=http_client, max_retries=0)
+
+
+class RateLimiter:
+    """
+    Token buckets for requests and input tokens per minute, refilled continuously.
+
+    Waiters are served in arrival order. Token estimates are reconciled with the real usage
+    once a response arrives.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.requests = float(requests_per_minute)
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        self.requests = min(self.requests_per_minute, self.requests + elapsed * self.requests_per_minute / 60)
+        self.tokens = min(self.tokens_per_minute, self.tokens + elapsed * self.tokens_per_minute / 60)
+
+    async def acquire(self, tokens):
+        tokens = min(tokens, self.tokens_per_minute)  # a request larger than the budget would wait forever
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                delay = max(
+                    (1 - self.requests) * 60 / self.requests_per_minute,
+                    (tokens - self.tokens) * 60 / self.tokens_per_minute,
+                )
+                self.waited += delay
+                await asyncio.sleep(delay)
+
+    def settle(self, estimated, actual):
+        self.tokens = min(self.tokens_per_minute, self.tokens + estimated - actual)
+
+
+class EngineStats:
+    def __init__(self):
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.started = time.perf_counter()
+
+    def report(self, limiter=None):
+        elapsed = time.perf_counter() - self.started
+        done = self.completed + self.failed
+        waited = f", {limiter.waited:.1f}s waiting on rate limits" if limiter else ""
+        return (
+            f"{self.completed} investigations completed, {self.failed} failed in {elapsed:.2f}s "
+            f"({done / elapsed:.2f} jobs/sec, {self.input_tokens} input / {self.output_tokens} output tokens, "
+            f"{self.retries} retries{waited})"
+        )
+
+
+def _is_retryable(error):
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (anthropic.APIConnectionError, anthropic.APITimeoutError))
+
+
+def _retry_delay(error, attempt, base_delay=1.0, max_delay=60.0):
+    retry_after = None
+    if isinstance(error, anthropic.APIStatusError):
+        retry_after = error.response.headers.get("retry-after")
+    if retry_after is not None:
+        return float(retry_after) + random.uniform(0, base_delay)
+    # Full jitter keeps concurrent workers from retrying in lockstep
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+def _error_result(job, error, stats, attempts):
+    stats.failed += 1
+    return {
+        "job_id": job.get("job_id"),
+        "poi": job.get("poi"),
+        "status": "error",
+        "error": repr(error),
+        "attempts": attempts,
+    }
+
+
+async def run_job(
+    job, client, limiter, stats, model=MODEL, emails_for=None, max_tokens=MAX_OUTPUT_TOKENS, max_retries=MAX_RETRIES
+):
+    """
+    Run one investigation, retrying rate-limit and overload errors. Returns a result dict.
+
+    Any failure, including one while gathering the job's emails, becomes an "error" result
+    rather than stopping the other jobs.
+    """
+    try:
+        # emails_for reads and filters the mailbox synchronously, so it runs off the event loop
+        emails = await asyncio.to_thread(emails_for, job["poi"]) if emails_for else job.get("emails")
+        request = build_request(job["prompt"], emails=emails, poi=job["poi"])
+        estimated = count_tokens(json.dumps(request, default=str))
+    except Exception as e:
+        return _error_result(job, e, stats, attempts=0)
+    started = time.perf_counter()
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(estimated)
+        try:
+            response = await client.messages.create(model=model, max_tokens=max_tokens, **request)
+        except Exception as e:
+            limiter.settle(estimated, 0)
+            if not _is_retryable(e) or attempt == max_retries:
+                return _error_result(job, e, stats, attempts=attempt + 1)
+            stats.retries += 1
+            await asyncio.sleep(_retry_delay(e, attempt))
+            continue
+        usage = cache_usage(response.usage)
+        limiter.settle(estimated, usage["input_tokens"] + usage["cache_creation_input_tokens"])
+        stats.completed += 1
+        stats.input_tokens += (
+            usage["input_tokens"] + usage["cache_creation_input_tokens"] + usage["cache_read_input_tokens"]
+        )
+        stats.output_tokens += usage["output_tokens"]
+        return {
+            "job_id": job["job_id"],
+            "poi": job["poi"],
+            "status": "ok",
+            "text": restore_aliases("".join(block.text for block in response.content if block.type == "text"), emails),
+            "usage": usage,
+            "latency_s": time.perf_counter() - started,
+            "attempts": attempt + 1,
+        }
+
+
+async def run_investigations(
+    jobs,
+    client,
+    output_path,
+    model=MODEL,
+    emails_for=None,
+    concurrency=CONCURRENCY,
+    requests_per_minute=REQUESTS_PER_MINUTE,
+    tokens_per_minute=TOKENS_PER_MINUTE,
+    max_tokens=MAX_OUTPUT_TOKENS,
+):
+    """
+    Run a stream of jobs (sync or async iterable) with bounded concurrency, appending results to output_path.
+
+    emails_for(poi) supplies each job's emails; otherwise a job may carry its own "emails".
+    """
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    stats = EngineStats()
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def produce():
+        if hasattr(jobs, "__aiter__"):
+            async for job in jobs:
+                await queue.put(job)
+        else:
+            for job in jobs:
+                await queue.put(job)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    with open(output_path, "a") as out:
+
+        async def work():
+            while (job := await queue.get()) is not None:
+                result = await run_job(job, client, limiter, stats, model, emails_for, max_tokens)
+                out.write(json.dumps(result, default=str) + "\n")
+                out.flush()
+
+        await asyncio.gather(produce(), *(work() for _ in range(concurrency)))
+
+    print(stats.report(limiter))
+    return stats
+
+
+def read_jobs(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("jobs", help="JSONL file of {job_id, poi, prompt}")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--model", default=MODEL)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE)
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE)
+    parser.add_argument("--fake", action="store_true", help="Use the offline fake client instead of the API")
+    args = parser.parse_args()
+
+    from email_index import ParticipantIndex
+    from tools import filter_emails_by_person, load_all_emails, load_participant_descriptions
+
+    load_dotenv()
+    all_emails = load_all_emails()
+    index = ParticipantIndex.load_or_build(participant_descriptions=load_participant_descriptions())
+
+    if args.fake:
+        from fake_llm import FakeAsyncAnthropic
+
+        client = FakeAsyncAnthropic(latency=0.5, jitter=0.5, requests_per_minute=args.rpm)
+    else:
+        client = make_client(args.concurrency)
+
+    asyncio.run(
+        run_investigations(
+            read_jobs(args.jobs),
+            client,
+            args.output,
+            model=args.model,
+            emails_for=lambda poi: filter_emails_by_person(all_emails, poi, index),
+            concurrency=args.concurrency,
+            requests_per_minute=args.rpm,
+            tokens_per_minute=args.tpm,
+        )
+    )
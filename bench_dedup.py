@@ -0,0 +1,131 @@
+"""
+Benchmark thread reconstruction and near-duplicate collapsing on a synthetic mailbox.
+
+    python bench_dedup.py --count 100000
+
+The mailbox repeats itself the way real ones do: every original message has replies that
+quote it, some are stored once per recipient (with a different footer), and some are
+forwarded. The benchmark times each stage, checks that every per-recipient copy was collapsed
+into its original and that no distinct messages (forwards included, since they have their own
+sender and date) were merged, and reports the token reduction.
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from bench_email_store import NAMES
+from comm_graph import email_date, to_epochs
+from email_dedup import (
+    assign_threads,
+    clean_bodies,
+    collapse_emails,
+    format_report,
+    minhash_signatures,
+    near_duplicate_clusters,
+    shingle_hashes,
+)
+from email_store import ID_OFFSET, email_label
+
+VOCABULARY = [f"w{i}" for i in range(5000)]
+START = pd.Timestamp("2012-01-01")
+
+
+def synthetic_mailbox(count, seed=0):
+    """
+    About count emails, and for each the number of the distinct message it carries.
+    """
+    rng = random.Random(seed)
+    emails, messages = [], []
+    message = -1
+    while len(emails) < count:
+        message += 1
+        sender, *recipients = rng.sample(NAMES, 4)
+        subject = " ".join(rng.choices(VOCABULARY, k=4))
+        sent = START + pd.Timedelta(minutes=rng.randrange(500_000))
+        body = " ".join(rng.choices(VOCABULARY, k=rng.randint(30, 300)))
+        original = {
+            "sender": f"{sender}@enron.com",
+            "recipients": f"{recipients[0]}@enron.com",
+            "subject": subject,
+            "date": str(sent),
+            "body": body,
+        }
+        emails.append(original)
+        messages.append(message)
+        if rng.random() < 0.3:
+            # The same message stored in each recipient's mailbox
+            for recipient in recipients[1:]:
+                emails.append({**original, "recipients": f"{recipient}@enron.com", "body": f"{body}\n--\n{recipient}"})
+                messages.append(message)
+        if rng.random() < 0.2:
+            message += 1
+            emails.append(
+                {
+                    **original,
+                    "sender": f"{recipients[0]}@enron.com",
+                    "subject": f"Fwd: {subject}",
+                    "date": str(sent + pd.Timedelta(hours=2)),
+                    "body": f"FYI\n\n---------- Forwarded message ----------\n{body}",
+                }
+            )
+            messages.append(message)
+        quoted = "\n".join(f"> {line}" for line in body.split(". "))
+        for reply in range(rng.randint(0, 3)):
+            message += 1
+            text = " ".join(rng.choices(VOCABULARY, k=rng.randint(10, 60)))
+            emails.append(
+                {
+                    "sender": f"{recipients[0]}@enron.com",
+                    "recipients": f"{sender}@enron.com",
+                    "subject": f"Re: {subject}",
+                    "date": str(sent + pd.Timedelta(hours=reply + 1)),
+                    "body": f"{text}\n\nOn {sent}, {sender} wrote:\n{quoted}",
+                }
+            )
+            messages.append(message)
+    for position, email in enumerate(emails[:count]):
+        email["email_id"] = email_label(position + ID_OFFSET)
+    return emails[:count], np.array(messages[:count])
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    emails, messages = synthetic_mailbox(args.count)
+    print(f"{len(emails):,} emails carrying {len(np.unique(messages)):,} distinct messages")
+
+    epochs, ms = timed(lambda: to_epochs([email_date(email) for email in emails]))
+    print(f"  {'parse dates':<20} {ms:10.0f}ms")
+    cleaned, ms = timed(lambda: clean_bodies(pa.array([email["body"] for email in emails], type=pa.large_string())))
+    print(f"  {'clean bodies':<20} {ms:10.0f}ms")
+    threads, ms = timed(lambda: assign_threads(emails, epochs))
+    print(f"  {'assign threads':<20} {ms:10.0f}ms {len(np.unique(threads)):>10,} threads")
+    (hashes, docs), ms = timed(lambda: shingle_hashes(cleaned))
+    print(f"  {'shingle':<20} {ms:10.0f}ms {len(hashes):>10,} shingles")
+    signatures, ms = timed(lambda: minhash_signatures(hashes, docs, len(emails)))
+    print(f"  {'minhash':<20} {ms:10.0f}ms")
+    clusters, ms = timed(lambda: near_duplicate_clusters(signatures))
+    print(f"  {'lsh clusters':<20} {ms:10.0f}ms {len(np.unique(clusters)):>10,} clusters")
+
+    # Every copy of a message should share its body cluster (forwards may too; headers separate them)
+    pairs = pd.DataFrame({"message": messages, "cluster": clusters})
+    split = (pairs.groupby("message")["cluster"].nunique() > 1).sum()
+    print(f"  messages split across body clusters: {split:,}")
+
+    (reduced, report), ms = timed(lambda: collapse_emails(emails))
+    kept = len(reduced) == len(np.unique(messages))
+    print(f"\ncollapse_emails end to end: {ms:,.0f}ms")
+    print(format_report(report))
+    print(f"One email kept per distinct message: {kept}")
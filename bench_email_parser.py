@@ -0,0 +1,68 @@
+"""
+Benchmark utils.parse_email against the bulk email_parser.parse_emails.
+
+    python bench_email_parser.py --count 100000
+    python bench_email_parser.py --csv personal_financial_all_nohit.csv
+"""
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from email_parser import parse_emails
+from utils import parse_email
+
+NAMES = ["phillip.allen", "john.arnold", "sally.beck", "jeff.dasovich", "vince.kaminski", "kay.mann"]
+DATES = [
+    "Mon, 14 May 2001 16:39:00 -0700 (PDT)",
+    "Fri, 4 May 2001 13:51:00 -0700 (PDT)",
+    "Wed, 18 Oct 2000 03:00:00 -0700 (PDT)",
+    "2001-05-14 16:39:00",
+]
+
+
+def synthetic_message(i, rng=random):
+    sender, *recipients = rng.sample(NAMES, 4)
+    to = ",\n\t".join(f"{name}@enron.com" for name in recipients[: rng.randint(1, 3)])
+    body = " ".join(rng.choice(["please", "review", "the", "gas", "deal", "attached", "thanks"]) for _ in range(60))
+    return (
+        f"Message-ID: <{i}.JavaMail.evans@thyme>\n"
+        f"Date: {rng.choice(DATES)}\n"
+        f"From: {sender}@enron.com\n"
+        f"To: {to}\n"
+        f"Cc: {recipients[-1]}@enron.com\n"
+        f"Subject: Re: deal {i}\n"
+        f"X-From: {sender}\n\n"
+        f"{body}\n"
+    )
+
+
+def bench(label, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:8.2f}s")
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--csv", help="Use the 'message' column of this CSV instead of synthetic messages")
+    args = parser.parse_args()
+
+    if args.csv:
+        messages = pd.read_csv(args.csv, usecols=["message"])["message"].tolist()
+    else:
+        rng = random.Random(0)
+        messages = [synthetic_message(i, rng) for i in range(args.count)]
+    print(f"Parsing {len(messages)} messages")
+
+    baseline = bench("utils.parse_email over iterrows", lambda: [
+        parse_email(row["message"]) for _, row in pd.DataFrame({"message": messages}).iterrows()
+    ])
+    loop = bench("utils.parse_email over a list", lambda: [parse_email(message) for message in messages])
+    single = bench("parse_emails (1 process)", lambda: parse_emails(messages, processes=1))
+    pooled = bench("parse_emails (process pool)", lambda: parse_emails(messages))
+    print(f"Speed-up vs iterrows baseline: {baseline / single:.1f}x single process, {baseline / pooled:.1f}x pooled")
@@ -0,0 +1,73 @@
+"""
+Benchmark memory of a list of email dicts against the columnar EmailStore.
+
+    python bench_email_store.py --count 200000
+    python bench_email_store.py --path generated_emails_with_background_7.xlsx
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from email_loader import iter_emails
+from email_store import EmailStore
+from tools import filter_emails_by_person
+
+NAMES = ["phillip.allen", "john.arnold", "sally.beck", "jeff.dasovich", "vince.kaminski", "kay.mann", "jho.low"]
+WORDS = ["please", "review", "the", "gas", "deal", "attached", "thanks", "transfer", "account", "meeting"]
+
+
+def synthetic_emails(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        sender, *recipients = rng.sample(NAMES, 4)
+        # Built per row, like the strings a spreadsheet or Parquet reader returns
+        yield {
+            "sender": f"{sender}@enron.com",
+            "recipients": ", ".join(f"{name}@enron.com" for name in recipients[: rng.randint(1, 3)]),
+            "cc": f"{recipients[-1]}@enron.com" if rng.random() < 0.3 else None,
+            "bcc": None,
+            "subject": f"Re: deal {rng.randrange(count // 20 + 1)}",
+            "date": f"2001-05-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00",
+            "body": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 200))),
+        }
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--path", help="Load this email file instead of synthetic emails")
+    parser.add_argument("--poi", default="jho.low@enron.com")
+    args = parser.parse_args()
+
+    records = (lambda: iter_emails(args.path)) if args.path else (lambda: synthetic_emails(args.count))
+    mb = 1024**2
+
+    emails, current, peak, elapsed = measure(lambda: list(records()))
+    for i, email in enumerate(emails):
+        email["email_id"] = f"EMAIL_{i + 2}"
+    print(f"list of dicts: {current / mb:8.1f}MB held, {peak / mb:8.1f}MB peak, loaded in {elapsed:.2f}s")
+    start = time.perf_counter()
+    matches = len(filter_emails_by_person(emails, args.poi))
+    print(f"  scan for {args.poi}: {matches} emails in {time.perf_counter() - start:.2f}s")
+    del emails
+    gc.collect()
+
+    store, current, peak, elapsed = measure(lambda: EmailStore.from_records(records()))
+    print(f"EmailStore:    {current / mb:8.1f}MB held, {peak / mb:8.1f}MB peak, loaded in {elapsed:.2f}s")
+    print(f"  {store.nbytes() / mb:.1f}MB in arrays and text buffer, {len(store.strings)} interned values")
+    start = time.perf_counter()
+    matches = len(filter_emails_by_person(store, args.poi))
+    print(f"  scan for {args.poi}: {matches} emails in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,116 @@
+"""
+Benchmark filtered versus unfiltered vector search as the collection grows.
+
+    python bench_filtered_search.py --url http://localhost:6333 --sizes 1000,10000,100000
+    python bench_filtered_search.py   # embedded local Qdrant, which ignores payload indexes
+
+Points are random vectors with synthetic transaction payloads. For each size the script times
+an unfiltered search, the same search with a structured filter applied by Qdrant, and the
+client-side alternative of over-fetching unfiltered results and filtering them in Python.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from qdrant_store import ensure_payload_indexes, normalize_party, normalize_payload, search, to_epoch
+from utils import PARTICIPANTS
+
+COLLECTION_NAME = "bench_filtered_search"
+FILTERS = {
+    "type": "transaction",
+    "sender": "Charlie",
+    "receiver": "Maxwell",
+    "min_amount": 10_000,
+    "start": "2025-03-01",
+    "end": "2025-03-31T23:59:59",
+}
+
+
+def synthetic_payload(rng):
+    sender, receiver = rng.sample(PARTICIPANTS, 2)
+    timestamp = datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(365 * 24 * 60))
+    return normalize_payload(
+        {
+            "type": rng.choice(["transaction", "transaction", "email"]),
+            "sender": sender,
+            "receiver": receiver,
+            "amount": round(rng.uniform(10, 50_000), 2),
+            "timestamp": timestamp,
+        }
+    )
+
+
+def matches(payload, start=to_epoch(FILTERS["start"]), end=to_epoch(FILTERS["end"])):
+    return (
+        payload["type"] == FILTERS["type"]
+        and payload["sender"] == normalize_party(FILTERS["sender"])
+        and normalize_party(FILTERS["receiver"]) in payload["receivers"]
+        and payload["amount"] >= FILTERS["min_amount"]
+        and payload["timestamp"] is not None
+        and start <= payload["timestamp"] <= end
+    )
+
+
+def percentiles(latencies):
+    latencies = np.array(latencies) * 1000
+    return f"p50 {np.percentile(latencies, 50):7.2f}ms  p99 {np.percentile(latencies, 99):7.2f}ms"
+
+
+def timed(fn, queries):
+    latencies, results = [], None
+    for query in queries:
+        start = time.perf_counter()
+        results = fn(query)
+        latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Qdrant server URL; defaults to an embedded in-memory instance")
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    qdrant = QdrantClient(args.url) if args.url else QdrantClient(":memory:")
+    rng = random.Random(0)
+    np_rng = np.random.default_rng(0)
+    queries = np_rng.standard_normal((args.queries, args.dim)).astype(np.float32).tolist()
+
+    if qdrant.collection_exists(COLLECTION_NAME):
+        qdrant.delete_collection(COLLECTION_NAME)
+    qdrant.create_collection(
+        COLLECTION_NAME, vectors_config=models.VectorParams(size=args.dim, distance=models.Distance.COSINE)
+    )
+    ensure_payload_indexes(qdrant, COLLECTION_NAME)
+
+    size = 0
+    for target in sorted(int(value) for value in args.sizes.split(",")):
+        while size < target:
+            count = min(1000, target - size)
+            vectors = np_rng.standard_normal((count, args.dim)).astype(np.float32)
+            qdrant.upsert(
+                COLLECTION_NAME,
+                points=[
+                    models.PointStruct(id=size + i, vector=vectors[i].tolist(), payload=synthetic_payload(rng))
+                    for i in range(count)
+                ],
+            )
+            size += count
+
+        unfiltered, _ = timed(lambda q: search(qdrant, COLLECTION_NAME, q, args.limit), queries)
+        filtered, hits = timed(lambda q: search(qdrant, COLLECTION_NAME, q, args.limit, **FILTERS), queries)
+        client_side, _ = timed(
+            lambda q: [p for p in search(qdrant, COLLECTION_NAME, q, args.limit * 100) if matches(p.payload)][: args.limit],
+            queries,
+        )
+        print(f"{size:>9} points")
+        print(f"  unfiltered             {percentiles(unfiltered)}")
+        print(f"  filtered in Qdrant     {percentiles(filtered)}  ({len(hits)} hits)")
+        print(f"  client-side filtering  {percentiles(client_side)}")
@@ -0,0 +1,266 @@
+"""
+Offline end-to-end benchmark of the investigation pipeline.
+
+    python bench_pipeline.py --sizes 100,1000,10000 --output bench_results.json
+    python bench_pipeline.py --sizes 1000000 --llm-latency 2.0 --baseline bench_results.json
+    python bench_pipeline.py --replay recorded_responses.jsonl
+
+For each corpus size a synthetic mailbox is generated and every stage is timed: email load,
+participant index build and POI filter, raw message parsing, prompt building, embedding,
+Qdrant upsert and search, the LLM call and JSON extraction. Nothing touches the network:
+embeddings come from fake_llm.FakeEmbedder, Qdrant runs embedded in memory and the model is
+fake_llm.FakeAnthropic with a configurable latency, or ReplayAnthropic replaying responses
+recorded with RecordingAnthropic. Each size runs in a fresh process so its peak RSS is its own.
+
+Results are written as JSON ({"meta": ..., "results": {size: {stage: metrics}}}); pass an
+earlier file as --baseline to print the change per stage.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from qdrant_client import QdrantClient, models
+
+from bench_email_parser import synthetic_message
+from bench_email_store import NAMES, synthetic_emails
+from email_index import ParticipantIndex
+from email_parser import parse_emails
+from email_store import EmailStore
+from fake_llm import FakeAnthropic, FakeEmbedder, ReplayAnthropic
+from ingest import UPSERT_BATCH_SIZE, batch_by_tokens
+from map_reduce import BATCH_TOKEN_BUDGET, RESULTS_TOOL, batch_emails
+from prompt_builder import build_request
+from qdrant_store import create_collection, search
+from streaming import parse_investigation_results
+from tools import filter_emails_by_person
+
+QUESTION = "List the secondary people of interest, key events, suspicious activities and entities of note."
+POI = "jho.low@enron.com"
+SEARCH_QUERIES = 50
+WRITE_CHUNK = 50_000
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def metrics(seconds, items, latencies=None):
+    result = {
+        "seconds": round(seconds, 4),
+        "items": items,
+        "throughput_per_s": round(items / seconds, 1) if seconds else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    if latencies:
+        latencies_ms = np.array(latencies) * 1000
+        result["p50_ms"] = round(float(np.percentile(latencies_ms, 50)), 3)
+        result["p99_ms"] = round(float(np.percentile(latencies_ms, 99)), 3)
+    return result
+
+
+def run_stage(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def run_ops(fn, inputs):
+    """
+    Call fn on each input, returning the outputs, total seconds and per-call latencies.
+    """
+    outputs, latencies = [], []
+    start = time.perf_counter()
+    for value in inputs:
+        op_start = time.perf_counter()
+        outputs.append(fn(value))
+        latencies.append(time.perf_counter() - op_start)
+    return outputs, time.perf_counter() - start, latencies
+
+
+def synthetic_reply(kwargs):
+    """
+    A fenced InvestigationResults reply of typical size, citing a few of the request's emails.
+    """
+    rng = random.Random(len(json.dumps(kwargs["messages"], default=str)))
+    reference = {
+        "email_id": f"EMAIL_{rng.randrange(2, 10_000)}",
+        "email_subject": "Re: deal",
+        "quotes": "transfer",
+        "description": "cited",
+    }
+    item = {"description": "d", "references": [reference]}
+    results = {
+        "secondary_poi": [
+            {**item, "name": name, "email_address": f"{name}@enron.com", "reasoning": "r"}
+            for name in rng.sample(NAMES, 3)
+        ],
+        "key_events": [
+            {"event": f"meeting {i}", "date": "2001-05-14", "location": "KL", "references": [reference]}
+            for i in range(5)
+        ],
+        "sus_activities": [{**item, "short_title": f"transfer {i}", "date": "2001-05-14"} for i in range(5)],
+        "entities_of_note": [{**item, "name": f"Company {i}", "type": "company"} for i in range(5)],
+    }
+    return f"Findings:\n```json\n{json.dumps(results, indent=2)}\n```"
+
+
+def write_corpus(path, size):
+    writer = None
+    records = synthetic_emails(size)
+    try:
+        while True:
+            chunk = [record for _, record in zip(range(WRITE_CHUNK), records)]
+            if not chunk:
+                break
+            table = pa.Table.from_pandas(pd.DataFrame.from_records(chunk), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def bench_size(size, args):
+    """
+    Run every stage on a corpus of size emails and return {stage: metrics}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "emails.parquet")
+        write_corpus(path, size)
+
+        store, seconds = run_stage(lambda: EmailStore.load(path))
+        results["load"] = metrics(seconds, size)
+
+    index, seconds = run_stage(lambda: ParticipantIndex.build(store))
+    results["index_build"] = metrics(seconds, size)
+    people = [f"{name}@enron.com" for name in NAMES]
+    subsets, seconds, latencies = run_ops(lambda person: filter_emails_by_person(store, person, index), people)
+    results["filter"] = metrics(seconds, len(people), latencies)
+    poi_emails = subsets[people.index(POI)][: args.max_llm_emails]
+
+    rng = random.Random(0)
+    messages = [synthetic_message(i, rng) for i in range(size)]
+    _, seconds = run_stage(lambda: parse_emails(messages))
+    results["parse"] = metrics(seconds, size)
+    del messages
+
+    batches, seconds = run_stage(lambda: batch_emails(poi_emails, BATCH_TOKEN_BUDGET))
+    requests, build_seconds, latencies = run_ops(lambda batch: build_request(QUESTION, emails=batch, poi=POI), batches)
+    results["prompt_build"] = metrics(seconds + build_seconds, len(poi_emails), latencies)
+
+    embed = FakeEmbedder(args.dimensions, latency=args.embed_latency)
+    documents = [{"text": f"{email['subject']}\n{email['body']}"} for email in store[: args.max_embed]]
+    embedded, seconds, latencies = run_ops(
+        lambda batch: embed([document["text"] for document in batch[0]]), batch_by_tokens(documents)
+    )
+    vectors = [vector for batch in embedded for vector in batch]
+    results["embedding"] = metrics(seconds, len(vectors), latencies)
+
+    qdrant = QdrantClient(":memory:")
+    create_collection(qdrant, "bench_pipeline", args.dimensions)
+    upserts = [
+        [
+            models.PointStruct(id=i, vector=vectors[i], payload={"type": "email", "sender": store[i]["sender"]})
+            for i in range(start, min(start + UPSERT_BATCH_SIZE, len(vectors)))
+        ]
+        for start in range(0, len(vectors), UPSERT_BATCH_SIZE)
+    ]
+    _, seconds, latencies = run_ops(lambda points: qdrant.upsert("bench_pipeline", points=points), upserts)
+    results["qdrant_upsert"] = metrics(seconds, len(vectors), latencies)
+    queries = embed([f"query {i}" for i in range(SEARCH_QUERIES)])
+    _, seconds, latencies = run_ops(lambda query: search(qdrant, "bench_pipeline", query, 10), queries)
+    results["qdrant_search"] = metrics(seconds, len(queries), latencies)
+
+    if args.replay:
+        client = ReplayAnthropic(args.replay, responder=synthetic_reply, latency=args.llm_latency)
+    else:
+        client = FakeAnthropic(responder=synthetic_reply, latency=args.llm_latency)
+    responses, seconds, latencies = run_ops(
+        lambda request: client.messages.create(model="fake-claude", max_tokens=8000, tools=[RESULTS_TOOL], **request),
+        requests,
+    )
+    results["llm_call"] = metrics(seconds, len(requests), latencies)
+
+    replies = ["".join(block.text for block in response.content if block.type == "text") for response in responses]
+    _, seconds, latencies = run_ops(parse_investigation_results, replies)
+    results["json_extraction"] = metrics(seconds, len(replies), latencies)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(size, results, baseline=None):
+    print(f"\n{size} emails")
+    for stage, result in results.items():
+        latency = f"p50 {result['p50_ms']:9.2f}ms p99 {result['p99_ms']:9.2f}ms" if "p50_ms" in result else " " * 34
+        change = ""
+        if baseline and stage in baseline and baseline[stage]["seconds"]:
+            change = f"  {result['seconds'] / baseline[stage]['seconds']:5.2f}x baseline"
+        print(
+            f"  {stage:<16} {result['seconds']:9.3f}s {result['throughput_per_s'] or 0:>12,.0f}/s  {latency}"
+            f"  peak {result['peak_rss_mb']:8.1f}MB{change}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma-separated corpus sizes, up to 1000000")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--replay", help="JSONL of responses recorded with fake_llm.RecordingAnthropic")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Seconds per fake model call")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Seconds per fake embeddings request")
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--max-embed", type=int, default=20_000, help="Emails embedded and upserted per size")
+    parser.add_argument("--max-llm-emails", type=int, default=5_000, help="POI emails sent to the model per size")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+    for size in (int(value) for value in args.sizes.split(",")):
+        # A fresh process per size keeps each peak RSS independent of the previous sizes
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            results = executor.submit(bench_size, size, args).result()
+        output["results"][str(size)] = results
+        print_results(size, results, baseline.get(str(size)))
+
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nResults written to {args.output}")
@@ -0,0 +1,89 @@
+"""
+Compare prompt serializations of a mailbox by size and speed.
+
+    python bench_prompt_format.py
+    python bench_prompt_format.py --poi jho.low@example.com --anthropic claude-4-sonnet-20250514
+
+The corpus is the email spreadsheet (EMAILS_PATH), optionally filtered to one address; if it
+is missing, a synthetic mailbox is used. For every format the benchmark reports the tokens of
+the serialized emails, the median serialization time and, for the compact formats, the time
+to build the alias map used to restore the reply. Tokens are counted with tiktoken, and with
+--anthropic also by the Messages API's count_tokens endpoint for that model, which uses
+Claude's own tokenizer.
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from bench_email_store import synthetic_emails
+from email_loader import EMAILS_PATH
+from email_store import ID_OFFSET, email_label
+from prompt_format import CompactSerializer, JsonSerializer
+from tools import filter_emails_by_person, load_all_emails
+from utils import count_tokens
+
+FORMATS = {
+    "json": JsonSerializer(),
+    "repr": lambda emails: f"Context: {[dict(email) for email in emails]}",  # what main.py used to interpolate
+    "compact": CompactSerializer(),
+    "compact, projected": CompactSerializer(fields=("email_id", "date", "sender", "recipients", "subject", "body")),
+}
+
+
+def load_corpus(path, poi=None, synthetic=1000):
+    if os.path.exists(path):
+        emails = load_all_emails(path, as_store=True)
+        return filter_emails_by_person(emails, poi) if poi else emails, path
+    emails = [
+        {"email_id": email_label(position + ID_OFFSET), **email, "attachments": float("nan")}
+        for position, email in enumerate(synthetic_emails(synthetic))
+    ]
+    return emails, f"synthetic ({synthetic} emails)"
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+    return result, np.median(latencies) * 1000
+
+
+def anthropic_tokens(client, model, text):
+    message = {"role": "user", "content": text}
+    return client.messages.count_tokens(model=model, messages=[message]).input_tokens
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", default=EMAILS_PATH)
+    parser.add_argument("--poi", help="Only the emails to or from this address")
+    parser.add_argument("--synthetic", type=int, default=1000, help="Synthetic emails if the spreadsheet is missing")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--anthropic", metavar="MODEL", help="Also count tokens with the API for this model")
+    args = parser.parse_args()
+
+    emails, source = load_corpus(args.path, args.poi, args.synthetic)
+    baseline = None
+    print(f"{source}: {len(emails)} emails")
+    client = None
+    if args.anthropic:
+        from anthropic import Anthropic
+
+        client = Anthropic()
+
+    header = f"  {'format':<20} {'tokens':>10} {'vs json':>8} {'serialize':>10} {'alias map':>10}"
+    print(header + (f" {'api tokens':>11}" if client else ""))
+    for name, serialize in FORMATS.items():
+        text, serialize_ms = timed(lambda: serialize(emails), args.repeat)
+        tokens = count_tokens(text)
+        baseline = baseline or tokens
+        aliases = getattr(serialize, "aliases", None)
+        alias_ms = f"{timed(lambda: aliases(emails), args.repeat)[1]:8.1f}ms" if aliases else f"{'-':>10}"
+        line = f"  {name:<20} {tokens:>10,} {tokens / baseline:>8.0%} {serialize_ms:8.1f}ms {alias_ms}"
+        if client:
+            line += f" {anthropic_tokens(client, args.anthropic, text):>11,}"
+        print(line)
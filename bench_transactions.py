@@ -0,0 +1,78 @@
+"""
+Benchmark the columnar transaction store's queries on a synthetic ledger.
+
+    python bench_transactions.py --count 1000000 --parties 5000
+
+Prints the build time and the latency of each filter and analytic over the whole ledger.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from transaction_store import TransactionStore
+
+START = pd.Timestamp("2025-01-01", tz="UTC").timestamp()
+YEAR_S = 365 * 86400
+
+
+def synthetic_ledger(count, parties, seed=0):
+    """
+    A DataFrame of count payments between parties, with log-normal amounts over one year.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array([f"party{i}" for i in range(parties)], dtype=object)
+    # A few parties do most of the paying, as in real ledgers
+    senders = np.minimum(rng.zipf(1.5, count) - 1, parties - 1)
+    receivers = (senders + rng.integers(1, parties, count)) % parties
+    amounts = np.round(rng.lognormal(6, 1.5, count), 2)
+    round_amounts = rng.random(count) < 0.01
+    amounts[round_amounts] = rng.integers(1, 50, round_amounts.sum()) * 1000
+    return pd.DataFrame(
+        {
+            "sender": names[senders],
+            "receiver": names[receivers],
+            "amount": amounts,
+            "timestamp": (START + rng.integers(0, YEAR_S, count)).astype(np.int64),
+            "label": np.where(rng.random(count) < 0.001, "suspicious", "normal"),
+        }
+    )
+
+
+def timed(fn, repeat):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - start)
+    return result, np.median(latencies) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--parties", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    ledger = synthetic_ledger(args.count, args.parties)
+    store, build_ms = timed(lambda: TransactionStore.from_frame(ledger), 1)
+    print(f"{len(store):,} transactions between {len(store.parties):,} parties, built in {build_ms:,.0f}ms")
+
+    queries = {
+        "pair over $10k": lambda: store.select(sender="party0", receiver="party1", min_amount=10_000),
+        "either way, one week": lambda: store.select(
+            between=("party0", "party2"), start="2025-03-01", end="2025-03-07"
+        ),
+        "label": lambda: store.select(label="suspicious"),
+        "pair totals": lambda: store.pair_totals(),
+        "top 100 pair totals": lambda: store.pair_totals(limit=100),
+        "rolling 7d per pair >= $50k": lambda: store.rolling_totals(min_total=50_000),
+        "outliers per pair": lambda: store.outliers(),
+        "round amounts": lambda: store.round_amounts(),
+        "structuring": lambda: store.structuring(),
+    }
+    for name, query in queries.items():
+        result, ms = timed(query, args.repeat)
+        print(f"  {name:<30} {ms:10.2f}ms {len(result):>10,} rows")
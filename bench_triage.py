@@ -0,0 +1,129 @@
+"""
+Offline recall benchmark for the triage stage.
+
+    python bench_triage.py
+    python bench_triage.py --keep 0.01,0.05,0.1 --thread-context 0
+    python bench_triage.py --synthetic 100000
+
+The corpus is the routine personal_financial_all_nohit_100.csv mailbox plus the known bribery
+emails (bribery_email_*.txt). If those files are missing, or with --synthetic N, a synthetic
+mailbox is used instead: N routine emails, some deliberately mentioning payments, invoices and
+deadlines, with bribery emails written in several registers (explicit, euphemistic and terse)
+mixed in. For every cutoff the benchmark reports how many of the bribery emails would still
+reach the model (recall), how many emails and tokens would be sent, and the tokens saved.
+"""
+import argparse
+import glob
+import os
+import random
+import time
+
+import numpy as np
+
+from bench_email_store import NAMES, synthetic_emails
+from email_parser import email_bodies, parse_email_file, parse_emails
+from prompt_builder import format_emails
+from triage import email_budget, score_emails, select_positions, with_thread_context
+from utils import count_tokens
+
+ROUTINE_PATH = "personal_financial_all_nohit_100.csv"
+BRIBERY_GLOB = "bribery_email_*.txt"
+
+ROUTINE_TEMPLATES = [
+    "Attached is the invoice for ${amount} for last month's consulting work, due by Friday.",
+    "Please approve the expense report ({amount} dollars) today so finance can close the quarter.",
+    "Reminder: the gas deal review is urgent, we need comments before the deadline.",
+    "Thanks for lunch. The charity golf day raised ${amount} this year.",
+]
+BRIBERY_TEMPLATES = [
+    "We can offer the official a ${amount} commission in exchange for awarding us the contract. Keep this between us.",
+    "The intermediary will pass on the cash once the licence is approved. Delete this after reading.",
+    "Our friend at the ministry needs a small gift to expedite the permit. Call my cell, not over email.",
+    "Book the luxury trip for the procurement head; the invoice will be inflated to cover it.",
+    "Wire {amount} USD to the offshore account before Monday, he will take care of the bid.",
+    "He expects something for his trouble. Talk in person.",
+]
+
+
+def synthetic_corpus(count, positives, seed=0):
+    """
+    count routine emails with positives bribery emails mixed in; returns the emails and the
+    positions of the bribery ones.
+    """
+    rng = random.Random(seed)
+    emails = list(synthetic_emails(count, seed))
+    for email in emails[:: max(count // 200, 1)]:
+        email["body"] = f"{rng.choice(ROUTINE_TEMPLATES).format(amount=rng.randrange(100, 90_000))} {email['body']}"
+    labels = sorted(rng.sample(range(count), positives))
+    for position in labels:
+        sender, recipient = rng.sample(NAMES, 2)
+        template = BRIBERY_TEMPLATES[position % len(BRIBERY_TEMPLATES)]
+        emails[position] = {
+            **emails[position],
+            "sender": f"{sender}@enron.com",
+            "recipients": f"{recipient}@enron.com",
+            "body": f"{template.format(amount=rng.randrange(10_000, 500_000))} {emails[position]['body'][:200]}",
+        }
+    return emails, np.array(labels, dtype=np.int64)
+
+
+def raw_emails(messages):
+    parsed = parse_emails(messages)
+    parsed["body"] = email_bodies(messages, parsed)
+    return parsed.rename(columns={"receivers": "recipients"}).to_dict(orient="records")
+
+
+def labeled_corpus():
+    """
+    The routine mailbox followed by the known bribery emails, and the bribery emails' positions.
+    """
+    routine = parse_email_file(ROUTINE_PATH).rename(columns={"receivers": "recipients"}).to_dict(orient="records")
+    bribery = []
+    for path in sorted(glob.glob(BRIBERY_GLOB)):
+        with open(path) as f:
+            bribery.extend(raw_emails([f.read()]))
+    return routine + bribery, np.arange(len(routine), len(routine) + len(bribery))
+
+
+def evaluate(emails, labels, scores, keep, context):
+    positions = with_thread_context(emails, select_positions(scores, keep), context, email_budget(len(emails), keep))
+    kept = [emails[position] for position in positions]
+    return {
+        "keep": keep,
+        "emails": len(kept),
+        "recall": np.isin(labels, positions).mean() if len(labels) else float("nan"),
+        "tokens": count_tokens(format_emails(kept)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep", default="0.01,0.02,0.05,0.1,0.2,0.5", help="Comma-separated fractions to keep")
+    parser.add_argument("--thread-context", type=int, default=2, help="Earlier thread emails added per kept email")
+    parser.add_argument("--synthetic", type=int, help="Use a synthetic mailbox of this many emails")
+    parser.add_argument("--positives", type=int, default=30, help="Bribery emails in the synthetic mailbox")
+    args = parser.parse_args()
+
+    if args.synthetic or not (os.path.exists(ROUTINE_PATH) and glob.glob(BRIBERY_GLOB)):
+        emails, labels = synthetic_corpus(args.synthetic or 10_000, args.positives)
+        print(f"Synthetic mailbox: {len(emails)} emails, {len(labels)} bribery emails")
+    else:
+        emails, labels = labeled_corpus()
+        print(f"{ROUTINE_PATH} + {BRIBERY_GLOB}: {len(emails)} emails, {len(labels)} bribery emails")
+
+    start = time.perf_counter()
+    scores = score_emails(emails)
+    seconds = time.perf_counter() - start
+    print(f"Scored in {seconds:.3f}s ({len(emails) / seconds:,.0f} emails/s)")
+    ranks = (-scores["score"].to_numpy()).argsort(kind="stable").argsort()[labels] + 1
+    print(f"Bribery email ranks: {sorted(ranks.tolist())}")
+
+    total_tokens = count_tokens(format_emails(emails))
+    print(f"\n  {'keep':>6} {'emails':>8} {'recall':>7} {'tokens':>10} {'saved':>7}")
+    print(f"  {'all':>6} {len(emails):>8} {1:>7.0%} {total_tokens:>10,} {0:>7.0%}")
+    for keep in (float(value) for value in args.keep.split(",")):
+        result = evaluate(emails, labels, scores, keep, args.thread_context)
+        print(
+            f"  {keep:>6.0%} {result['emails']:>8} {result['recall']:>7.0%} {result['tokens']:>10,} "
+            f"{1 - result['tokens'] / total_tokens:>7.0%}"
+        )
@@ -0,0 +1,101 @@
+"""
+Benchmark recall, latency and memory of vector storage settings.
+
+    python bench_vector_storage.py --url http://localhost:6333
+    python bench_vector_storage.py --synthetic 20000 --dimensions 3072,1024,256
+
+Embeds the populate_qdrant_db corpus at full size (through the embedding cache, so reruns are
+free), holds out some documents as queries, and loads the rest into one collection per setting:
+each Matryoshka dimension with no, scalar and binary quantization. Recall@k is measured against
+exact full-size cosine search. --synthetic uses random vectors instead of the corpus, which is
+only meaningful for latency and memory. The embedded local Qdrant searches exactly and ignores
+quantization, so use --url against a server for representative recall and latency.
+"""
+import argparse
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from embedding_cache import MODEL_DIMENSIONS
+from ingest import EMBEDDING_MODEL, batch_by_tokens, shorten_embeddings
+from qdrant_store import QUANTIZATION, create_collection, search_params, vector_memory
+
+COLLECTION_PREFIX = "bench_vector_storage"
+
+
+def corpus_vectors():
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    from embedding_cache import get_embedder
+    from populate_qdrant_db import build_documents
+
+    load_dotenv()
+    embed = get_embedder(OpenAI())
+    vectors = []
+    for batch, _ in batch_by_tokens(build_documents()):
+        vectors.extend(embed([document["text"] for document in batch]))
+    return np.array(vectors, dtype=np.float32)
+
+
+def synthetic_vectors(count, dimension, seed=0):
+    rng = np.random.default_rng(seed)
+    return shorten_embeddings(rng.standard_normal((count, dimension)), dimension)
+
+
+def exact_top_k(vectors, queries, k):
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Qdrant server URL; defaults to an embedded in-memory instance")
+    parser.add_argument("--synthetic", type=int, help="Use this many random vectors instead of the corpus")
+    parser.add_argument("--dimensions", default="3072,1024,256")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--on-disk", action="store_true", help="Keep original vectors on disk in quantized collections")
+    parser.add_argument("--scale", type=int, default=10_000_000, help="Collection size for the projected RAM column")
+    args = parser.parse_args()
+
+    full = MODEL_DIMENSIONS[EMBEDDING_MODEL]
+    vectors = synthetic_vectors(args.synthetic, full) if args.synthetic else shorten_embeddings(corpus_vectors(), full)
+    vectors, queries = vectors[: -args.queries], vectors[-args.queries :]
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"{len(vectors)} points, {len(queries)} queries, recall@{args.k} against exact {full}-d search\n")
+
+    qdrant = QdrantClient(args.url) if args.url else QdrantClient(":memory:")
+    print(f"{'dims':>5} {'quantization':<12} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'RAM @ scale':>12}")
+    for dimension in (int(value) for value in args.dimensions.split(",")):
+        points, query_vectors = shorten_embeddings(vectors, dimension), shorten_embeddings(queries, dimension)
+        for quantization in QUANTIZATION:
+            on_disk = args.on_disk and quantization is not None
+            collection_name = f"{COLLECTION_PREFIX}_{dimension}_{quantization or 'none'}"
+            if qdrant.collection_exists(collection_name):
+                qdrant.delete_collection(collection_name)
+            create_collection(qdrant, collection_name, dimension, quantization=quantization, on_disk=on_disk)
+            qdrant.upload_points(
+                collection_name,
+                (models.PointStruct(id=i, vector=vector.tolist()) for i, vector in enumerate(points)),
+                batch_size=256,
+                wait=True,
+            )
+
+            params = search_params(quantization)
+            latencies, recalls = [], []
+            for query, expected in zip(query_vectors, truth):
+                start = time.perf_counter()
+                hits = qdrant.query_points(
+                    collection_name, query=query.tolist(), search_params=params, limit=args.k
+                ).points
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len({hit.id for hit in hits} & set(expected.tolist())) / args.k)
+            qdrant.delete_collection(collection_name)
+
+            latencies = np.array(latencies) * 1000
+            memory = vector_memory(args.scale, dimension, quantization, on_disk) / 1024**3
+            print(
+                f"{dimension:>5} {quantization or 'none':<12} {np.mean(recalls):>7.3f} "
+                f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f} {memory:>10.1f}GB"
+            )
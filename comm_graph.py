@@ -0,0 +1,487 @@
+"""
+Precomputed communication graph over the email corpus.
+
+Every address is a node; a directed edge from sender to each To/CC/BCC recipient carries the
+number of messages, the first and last time one was sent and, from the transaction payloads
+in Qdrant, how many payments went the same way and their total amount. Edges are held in CSR
+order (one row per sender, recipients sorted within the row) as flat NumPy arrays.
+
+At build time each node's ego network (its contacts ranked by traffic in either direction),
+degree, weighted degree and PageRank centrality, and its activity bursts (days with far more
+messages than the address usually has) are precomputed, so "who talks to Jho Low" and k-hop
+neighbourhood queries are array slices rather than scans or LLM calls. The graph is pickled
+next to the email file so it is built once per corpus.
+"""
+import hashlib
+import json
+import os
+import pickle as p
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from email_index import RECIPIENT_FIELDS, normalize_address, normalize_name, parse_addresses
+from email_loader import EMAILS_PATH, iter_emails
+
+DATE_FIELDS = ("date", "timestamp")
+GRAPH_VERSION = 2
+MISSING = -1
+DAMPING = 0.85
+PAGERANK_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-10
+BURST_ZSCORE = 3.0
+BURST_MIN_MESSAGES = 3
+DAY_S = 86400
+
+
+def to_epochs(values):
+    """
+    Whole seconds since the epoch for a sequence of dates (MISSING where absent or unparseable).
+    """
+    timestamps = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce", utc=True, format="mixed")
+    seconds = timestamps.dt.as_unit("s").astype("int64").to_numpy()
+    return np.where(timestamps.isna().to_numpy(), MISSING, seconds)
+
+
+def email_date(email):
+    return next((email.get(field) for field in DATE_FIELDS if email.get(field) is not None), None)
+
+
+def _date(timestamp):
+    return None if timestamp == MISSING else datetime.fromtimestamp(int(timestamp), timezone.utc).isoformat()
+
+
+def _row_order(indptr, weights):
+    """
+    Permutation sorting each CSR row by descending weight (stable, so ties keep column order).
+    """
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    return np.lexsort((-weights, rows))
+
+
+class CommunicationGraph:
+    """
+    Directed, weighted communication graph in CSR form with precomputed per-address statistics.
+    """
+
+    def __init__(self, addresses, aliases, names, edges, activity, start_day):
+        """
+        edges is a (sources, targets, messages, first_seen, last_seen, transactions, volume) tuple
+        of arrays, one entry per distinct directed edge sorted by (source, target); activity is a
+        sparse node x day matrix of message counts, with day 0 at start_day (days since the epoch).
+        """
+        self.addresses = addresses
+        self.node_ids = {address: node for node, address in enumerate(addresses)}
+        self.aliases = aliases
+        self.names = names
+        sources, targets, messages, first_seen, last_seen, transactions, volume = edges
+        n = len(addresses)
+
+        # Out-edges: sources are sorted, so the edge arrays are already in CSR order
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=n))))
+        self.indices = targets
+        self.messages = messages
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.transactions = transactions
+        self.volume = volume
+
+        # Ego networks: contacts in either direction, heaviest first
+        weight = (messages + transactions).astype(np.float64)
+        undirected = sparse.csr_matrix((weight, (sources, targets)), shape=(n, n))
+        undirected = (undirected + undirected.T).tocsr()
+        undirected.sum_duplicates()
+        order = _row_order(undirected.indptr, undirected.data)
+        self.ego_indptr = undirected.indptr
+        self.ego_contacts = undirected.indices[order]
+        self.ego_weights = undirected.data[order]
+
+        # Centrality
+        self.degree = np.diff(self.ego_indptr)
+        self.sent = np.bincount(sources, weights=messages, minlength=n).astype(np.int64)
+        self.received = np.bincount(targets, weights=messages, minlength=n).astype(np.int64)
+        adjacency = sparse.csr_matrix((messages.astype(np.float64), (sources, targets)), shape=(n, n))
+        self.pagerank = self._pagerank(adjacency)
+        self.pagerank_rank = np.empty(n, dtype=np.int64)
+        self.pagerank_rank[np.argsort(-self.pagerank, kind="stable")] = np.arange(1, n + 1)
+
+        self.start_day = start_day
+        self._detect_bursts(activity)
+
+    @staticmethod
+    def _pagerank(adjacency):
+        n = adjacency.shape[0]
+        if n == 0:
+            return np.zeros(0)
+        out_weight = np.asarray(adjacency.sum(axis=1)).ravel()
+        dangling = out_weight == 0
+        transition = sparse.diags(np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)) @ adjacency
+        transition_t = transition.T.tocsr()
+        rank = np.full(n, 1.0 / n)
+        for _ in range(PAGERANK_ITERATIONS):
+            updated = DAMPING * (transition_t @ rank + rank[dangling].sum() / n) + (1 - DAMPING) / n
+            converged = np.abs(updated - rank).sum() < PAGERANK_TOLERANCE
+            rank = updated
+            if converged:
+                break
+        return rank
+
+    def _detect_bursts(self, activity):
+        """
+        Flag days whose message count is BURST_ZSCORE deviations above the address's daily mean,
+        taken over every day from its first to its last active day.
+        """
+        activity = activity.tocsr()
+        activity.sum_duplicates()
+        activity.sort_indices()
+        rows = np.repeat(np.arange(activity.shape[0]), np.diff(activity.indptr))
+        counts = activity.data.astype(np.float64)
+        has_days = np.diff(activity.indptr) > 0
+        first_day = np.zeros(activity.shape[0], dtype=np.int64)
+        last_day = np.zeros(activity.shape[0], dtype=np.int64)
+        first_day[has_days] = activity.indices[activity.indptr[:-1][has_days]]
+        last_day[has_days] = activity.indices[activity.indptr[1:][has_days] - 1]
+        span = (last_day - first_day + 1).astype(np.float64)
+        mean = np.bincount(rows, weights=counts, minlength=activity.shape[0]) / span
+        variance = np.bincount(rows, weights=counts**2, minlength=activity.shape[0]) / span - mean**2
+        std = np.sqrt(np.maximum(variance, 0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            zscore = (counts - mean[rows]) / std[rows]
+        burst = (std[rows] > 0) & (zscore >= BURST_ZSCORE) & (counts >= BURST_MIN_MESSAGES)
+        self.burst_indptr = np.concatenate(([0], np.cumsum(np.bincount(rows[burst], minlength=activity.shape[0]))))
+        self.burst_days = activity.indices[burst]
+        self.burst_counts = activity.data[burst]
+        self.burst_zscores = zscore[burst]
+        self.active_days = np.diff(activity.indptr)
+
+    @classmethod
+    def build(cls, emails, participant_descriptions=(), transactions=()):
+        """
+        Build the graph from email rows and, optionally, transaction payloads.
+
+        Transaction parties that are not addresses are resolved through the display-name
+        aliases; parties matching no address become nodes of their own.
+        """
+        node_ids = {}
+        aliases = defaultdict(set)
+        names = {}
+        sources, targets, edge_emails, dates = [], [], [], []
+        involved_nodes, involved_emails = [], []
+
+        def node(address):
+            return node_ids.setdefault(address, len(node_ids))
+
+        for email_number, email in enumerate(emails):
+            senders = parse_addresses(email.get("sender"))
+            recipients = {}
+            for field in RECIPIENT_FIELDS:
+                for name, address in parse_addresses(email.get(field)):
+                    recipients.setdefault(address, name)
+            for name, address in [*senders, *((name, address) for address, name in recipients.items())]:
+                if name:
+                    aliases[normalize_name(name)].add(address)
+                    names.setdefault(address, name)
+            dates.append(email_date(email))
+            if not senders:
+                continue
+            sender_address = senders[0][1]
+            sender = node(sender_address)
+            involved = {sender}
+            for address in recipients:
+                if address != sender_address:
+                    target = node(address)
+                    sources.append(sender)
+                    targets.append(target)
+                    edge_emails.append(email_number)
+                    involved.add(target)
+            involved_nodes.extend(involved)
+            involved_emails.extend([email_number] * len(involved))
+
+        for entry in participant_descriptions:
+            address = normalize_address(entry["email_address"])
+            aliases[normalize_name(entry["participant"])].add(address)
+            names[address] = entry["participant"]
+        aliases = {name: frozenset(addresses) for name, addresses in aliases.items()}
+
+        def party(value):
+            value = normalize_address(value)
+            resolved = aliases.get(normalize_name(value), ()) if "@" not in value else ()
+            return node(next(iter(resolved)) if len(resolved) == 1 else value)
+
+        tx_sources, tx_targets, amounts = [], [], []
+        for payload in transactions:
+            receivers = payload.get("receivers") or [payload.get("receiver")]
+            if not payload.get("sender") or not receivers[0]:
+                continue
+            tx_sources.append(party(payload["sender"]))
+            tx_targets.append(party(receivers[0]))
+            amounts.append(float(payload.get("amount") or 0.0))
+
+        epochs = to_epochs(dates)
+        n = len(node_ids)
+        email_keys = np.array(sources, dtype=np.int64) * n + np.array(targets, dtype=np.int64)
+        tx_keys = np.array(tx_sources, dtype=np.int64) * n + np.array(tx_targets, dtype=np.int64)
+        keys, inverse = np.unique(np.concatenate((email_keys, tx_keys)), return_inverse=True)
+        email_edges, tx_edges = inverse[: len(email_keys)], inverse[len(email_keys) :]
+
+        edge_times = epochs[np.array(edge_emails, dtype=np.int64)]
+        dated = edge_times != MISSING
+        first_seen = np.full(len(keys), np.iinfo(np.int64).max)
+        last_seen = np.full(len(keys), MISSING, dtype=np.int64)
+        np.minimum.at(first_seen, email_edges[dated], edge_times[dated])
+        np.maximum.at(last_seen, email_edges[dated], edge_times[dated])
+        first_seen[first_seen == np.iinfo(np.int64).max] = MISSING
+        edges = (
+            keys // max(n, 1),
+            keys % max(n, 1),
+            np.bincount(email_edges, minlength=len(keys)),
+            first_seen,
+            last_seen,
+            np.bincount(tx_edges, minlength=len(keys)),
+            np.bincount(tx_edges, weights=np.array(amounts), minlength=len(keys)),
+        )
+
+        involved_times = epochs[np.array(involved_emails, dtype=np.int64)]
+        dated = involved_times != MISSING
+        days = involved_times[dated] // DAY_S
+        start_day = int(days.min()) if len(days) else 0
+        activity = sparse.coo_matrix(
+            (np.ones(len(days), dtype=np.int64), (np.array(involved_nodes, dtype=np.int64)[dated], days - start_day)),
+            shape=(n, int(days.max()) - start_day + 1 if len(days) else 1),
+        )
+
+        addresses = np.empty(n, dtype=object)
+        addresses[list(node_ids.values())] = list(node_ids)
+        return cls(addresses, aliases, names, edges, activity, start_day)
+
+    @classmethod
+    def load_or_build(
+        cls, path=EMAILS_PATH, participant_descriptions=(), transactions=(), graph_path=None, transactions_key=None
+    ):
+        """
+        Load the pickled graph for an email file, rebuilding it when the file is newer or the
+        participant descriptions or transactions changed.
+
+        transactions_key (e.g. the number of transaction points) stands in for the transactions
+        in the cache check, so a lazy transactions iterable is only read when the graph is rebuilt.
+        """
+        graph_path = graph_path or os.path.splitext(path)[0] + ".graph.pkl"
+        participant_descriptions = list(participant_descriptions)
+        if transactions_key is None:
+            transactions = transactions_key = list(transactions)
+        inputs = [participant_descriptions, transactions_key]
+        digest = hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+        if os.path.exists(graph_path) and os.path.getmtime(graph_path) >= os.path.getmtime(path):
+            with open(graph_path, "rb") as f:
+                version, cached_digest, graph = p.load(f)
+            if version == GRAPH_VERSION and cached_digest == digest:
+                return graph
+        columns = ("sender",) + RECIPIENT_FIELDS + DATE_FIELDS
+        graph = cls.build(iter_emails(path, columns=columns), participant_descriptions, transactions)
+        with open(graph_path, "wb") as f:
+            p.dump((GRAPH_VERSION, digest, graph), f)
+        return graph
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def resolve(self, person):
+        """
+        Node IDs for an address, display name or transaction party name.
+        """
+        if "@" in person:
+            addresses = {normalize_address(person)}
+        else:
+            addresses = set(self.aliases.get(normalize_name(person), ())) | {normalize_address(person)}
+        nodes = sorted(self.node_ids[address] for address in addresses if address in self.node_ids)
+        return np.array(nodes, dtype=np.int64)
+
+    def _edge(self, source, target):
+        """
+        Index of the directed edge source -> target, or None.
+        """
+        start, end = self.indptr[source], self.indptr[source + 1]
+        position = start + np.searchsorted(self.indices[start:end], target)
+        return position if position < end and self.indices[position] == target else None
+
+    def messages_between(self, addresses_a, addresses_b):
+        """
+        Messages exchanged in either direction between each pair of addresses (0 for unknown ones).
+        """
+        a = np.array([self.node_ids.get(normalize_address(address), -1) for address in addresses_a], dtype=np.int64)
+        b = np.array([self.node_ids.get(normalize_address(address), -1) for address in addresses_b], dtype=np.int64)
+        n = len(self)
+        keys = np.repeat(np.arange(n), np.diff(self.indptr)) * n + self.indices
+        counts = np.zeros(len(a), dtype=np.int64)
+        known = (a >= 0) & (b >= 0)
+        for source, target in ((a, b), (b, a)):
+            wanted = source[known] * n + target[known]
+            position = np.minimum(np.searchsorted(keys, wanted), max(len(keys) - 1, 0))
+            found = keys[position] == wanted if len(keys) else np.zeros(len(wanted), dtype=bool)
+            counts[np.flatnonzero(known)[found]] += self.messages[position[found]]
+        return counts
+
+    def _describe(self, node):
+        return {"address": self.addresses[node], "name": self.names.get(self.addresses[node])}
+
+    def contacts(self, person, limit=20):
+        """
+        The person's contacts, heaviest first, with message counts both ways, first and last
+        contact dates and transaction volume both ways.
+        """
+        nodes = self.resolve(person)
+        if len(nodes) == 0:
+            return []
+        slices = [np.arange(self.ego_indptr[node], self.ego_indptr[node + 1]) for node in nodes]
+        positions = np.concatenate(slices)
+        contacts, weights = self.ego_contacts[positions], self.ego_weights[positions]
+        if len(nodes) > 1:  # merge the same contact across several addresses of one person
+            contacts, inverse = np.unique(contacts, return_inverse=True)
+            weights = np.bincount(inverse, weights=weights)
+            order = np.argsort(-weights, kind="stable")
+            contacts, weights = contacts[order], weights[order]
+        own = set(nodes.tolist())
+        results = []
+        for contact in contacts[: limit + len(own)].tolist():
+            if contact in own:
+                continue
+            record = {**self._describe(contact), "sent": 0, "received": 0, "transactions": 0, "volume": 0.0}
+            first, last = [], []
+            for node in nodes.tolist():
+                for edge, direction in ((self._edge(node, contact), "sent"), (self._edge(contact, node), "received")):
+                    if edge is None:
+                        continue
+                    record[direction] += int(self.messages[edge])
+                    record["transactions"] += int(self.transactions[edge])
+                    record["volume"] += float(self.volume[edge])
+                    if self.first_seen[edge] != MISSING:
+                        first.append(self.first_seen[edge])
+                        last.append(self.last_seen[edge])
+            record["first_contact"] = _date(min(first)) if first else None
+            record["last_contact"] = _date(max(last)) if last else None
+            results.append(record)
+            if len(results) == limit:
+                break
+        return results
+
+    def k_hop(self, person, k=2):
+        """
+        Every node within k hops of the person (in either direction), as {address: hops}.
+        """
+        nodes = self.resolve(person)
+        hops = np.full(len(self), -1, dtype=np.int64)
+        hops[nodes] = 0
+        frontier = nodes
+        for hop in range(1, k + 1):
+            if len(frontier) == 0:
+                break
+            reached = np.concatenate(
+                [self.ego_contacts[self.ego_indptr[node] : self.ego_indptr[node + 1]] for node in frontier]
+            )
+            frontier = np.unique(reached[hops[reached] < 0])
+            hops[frontier] = hop
+        found = np.flatnonzero(hops > 0)
+        found = found[np.argsort(hops[found], kind="stable")]
+        return {self.addresses[node]: int(hops[node]) for node in found}
+
+    def centrality(self, person):
+        """
+        Distinct contacts, messages sent and received, and PageRank (with its rank) for the person.
+        """
+        nodes = self.resolve(person)
+        if len(nodes) == 0:
+            return None
+        best = nodes[np.argmax(self.pagerank[nodes])]
+        return {
+            "contacts": int(self.degree[nodes].sum()),
+            "sent": int(self.sent[nodes].sum()),
+            "received": int(self.received[nodes].sum()),
+            "pagerank": float(self.pagerank[nodes].sum()),
+            "pagerank_rank": int(self.pagerank_rank[best]),
+            "nodes": len(self),
+        }
+
+    def most_central(self, limit=20):
+        """
+        The highest-PageRank addresses.
+        """
+        order = np.argsort(-self.pagerank, kind="stable")[:limit]
+        return [{**self._describe(node), "pagerank": float(self.pagerank[node])} for node in order.tolist()]
+
+    def bursts(self, person):
+        """
+        Days on which the person was involved in unusually many messages, by date.
+        """
+        found = []
+        for node in self.resolve(person).tolist():
+            start, end = self.burst_indptr[node], self.burst_indptr[node + 1]
+            for day, count, zscore in zip(
+                self.burst_days[start:end].tolist(),
+                self.burst_counts[start:end].tolist(),
+                self.burst_zscores[start:end].tolist(),
+            ):
+                found.append(
+                    {
+                        "address": self.addresses[node],
+                        "date": _date((self.start_day + day) * DAY_S)[:10],
+                        "messages": count,
+                        "zscore": round(zscore, 1),
+                    }
+                )
+        return sorted(found, key=lambda burst: burst["date"])
+
+    def ego_network(self, person, limit=20, hops=2):
+        """
+        Everything the graph knows about one person, for the LLM tool.
+        """
+        nodes = self.resolve(person)
+        neighbourhood = self.k_hop(person, hops)
+        return {
+            "person": person,
+            "addresses": [self.addresses[node] for node in nodes.tolist()],
+            "centrality": self.centrality(person),
+            "contacts": self.contacts(person, limit),
+            "reachable_by_hops": {hop: list(neighbourhood.values()).count(hop) for hop in range(1, hops + 1)},
+            "bursts": self.bursts(person),
+        }
+
+    def validate_secondary_poi(self, results, poi, hops=2, top=10):
+        """
+        Check a model's secondary_poi list against the graph.
+
+        confirmed are named people within hops of the POI, unconnected are named people the graph
+        does not link to the POI (possible hallucinations, or links only visible in the text), and
+        missed are the POI's heaviest direct contacts that the model did not name.
+        """
+        neighbourhood = self.k_hop(poi, hops)
+        confirmed, unconnected, named = [], [], set()
+        for secondary in results.secondary_poi:
+            addresses = set()
+            for key in (secondary.email_address, secondary.name):
+                if key:
+                    addresses.update(self.addresses[node] for node in self.resolve(key).tolist())
+            named.update(addresses)
+            reached = [neighbourhood[address] for address in addresses if address in neighbourhood]
+            if reached:
+                confirmed.append({"name": secondary.name, "hops": min(reached)})
+            else:
+                unconnected.append(secondary.name)
+        missed = [contact for contact in self.contacts(poi, top) if contact["address"] not in named]
+        return {"confirmed": confirmed, "unconnected": unconnected, "missed": missed}
+
+
+def format_validation(validation):
+    confirmed = ", ".join(f"{item['name']} ({item['hops']} hop)" for item in validation["confirmed"])
+    lines = [f"Graph-confirmed secondary POIs: {confirmed or 'none'}"]
+    if validation["unconnected"]:
+        lines.append(f"Not connected to the POI in the email graph: {', '.join(validation['unconnected'])}")
+    if validation["missed"]:
+        missed = ", ".join(
+            f"{contact['name'] or contact['address']} ({contact['sent'] + contact['received']} messages)"
+            for contact in validation["missed"]
+        )
+        lines.append(f"Frequent contacts not named: {missed}")
+    return "\n".join(lines)
@@ -0,0 +1,343 @@
+"""
+Thread reconstruction and near-duplicate collapsing to shrink what the model reads.
+
+Mail corpora repeat themselves: replies quote the whole history, the same message is stored
+once per recipient, and forwards copy messages in. Before emails are sent to the model:
+
+- quoted history (">" lines, "-----Original Message-----" and "On ... wrote:" blocks, Outlook
+  From:/Sent: headers) and signatures are stripped from each body. Forwards (Fw:/Fwd:
+  subjects) are left whole, since the forward may be the only copy of what it forwards;
+- emails are grouped into threads by Message-ID/In-Reply-To/References where the corpus has
+  them, and otherwise by subject (without Re:/Fwd: prefixes) and time proximity;
+- near-duplicate bodies are clustered with MinHash signatures and banded LSH, so the cost is
+  linear in the number of emails rather than quadratic. Only copies of one message collapse:
+  the same sender, subject and date as well as a near-identical body. Each group is replaced
+  by one canonical email that lists every recipient of the copies and the email_ids of the
+  others as aliases, so no header reaches the model less complete and every reference stays
+  traceable. Emails passed as a list must carry their corpus email_id for this.
+
+Text cleanup and tokenization run through pyarrow.compute (RE2) over the whole column, and the
+hashing is NumPy, so the stage scales to millions of messages.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from comm_graph import MISSING, email_date, to_epochs
+from email_index import RECIPIENT_FIELDS, parse_addresses
+from email_store import EmailStore
+from prompt_builder import format_emails
+from tracing import traced
+from utils import count_tokens
+
+QUOTED_HISTORY = [
+    r"(?is)\n[ \t]*-{2,}[ \t]*original message[ \t]*-{2,}.*$",
+    r"(?ims)\n^[^\n]{0,200}\bwrote:[ \t]*$.*",
+    r"(?is)\n[ \t]*from:[^\n]*\n[ \t]*sent:[^\n]*\n.*$",
+    r"(?m)^[ \t]*>[^\n]*(?:\n|$)",
+]
+SIGNATURES = [
+    r"(?s)\n--[ \t]?\n.*$",
+    r"(?im)^[ \t]*sent from my [^\n]*$",
+]
+FORWARD_SUBJECT = r"(?i)^\s*(?:re\s*(?:\[\d+\])?\s*:\s*)*fwd?\s*(?:\[\d+\])?\s*:"
+THREAD_PREFIX = re.compile(r"^(?:\s*(?:re|fw|fwd)\s*(?:\[\d+\])?\s*:\s*)+", re.IGNORECASE)
+THREAD_GAP_S = 14 * 86400  # same subject, but this long apart, is a new conversation
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+BANDS = 16  # 16 bands of 4 rows: pairs above ~0.5 Jaccard become candidates
+SIMILARITY_THRESHOLD = 0.8  # candidates are kept if their signatures agree this much
+EMPTY = np.iinfo(np.uint32).max
+HASH_CHUNK = 1 << 12  # shingles hashed per step; a (NUM_PERM, chunk) block stays in cache
+REPORT_COUNTS = (
+    "emails",
+    "threads",
+    "kept",
+    "duplicates_collapsed",
+    "body_chars_before",
+    "body_chars_after",
+    "tokens_before",
+    "tokens_after",
+)
+
+
+def thread_key(subject):
+    if not isinstance(subject, str):
+        return ""
+    return " ".join(THREAD_PREFIX.sub("", subject).lower().split())
+
+
+def _column(emails, field):
+    if isinstance(emails, EmailStore):
+        values = emails.column(field) if field in emails.keys else [None] * len(emails)
+    else:
+        values = [email.get(field) for email in emails]
+    return pd.Series(values, dtype=object)
+
+
+def _strings(values):
+    return pa.array([value if isinstance(value, str) else "" for value in values], type=pa.large_string())
+
+
+def is_forward(subjects):
+    """
+    Whether each subject (a pyarrow string array) marks a forward.
+    """
+    return pc.fill_null(pc.match_substring_regex(subjects, FORWARD_SUBJECT), False)
+
+
+def clean_bodies(bodies, strip_signatures=True, keep=None):
+    """
+    Bodies (a pyarrow string array) without quoted history and, optionally, signatures.
+
+    Bodies where the boolean array keep is true (e.g. is_forward) are only trimmed.
+    """
+    cleaned = bodies
+    for pattern in QUOTED_HISTORY + (SIGNATURES if strip_signatures else []):
+        cleaned = pc.replace_substring_regex(cleaned, pattern, "")
+    if keep is not None:
+        cleaned = pc.if_else(keep, bodies, cleaned)
+    return pc.utf8_trim_whitespace(cleaned)
+
+
+def assign_threads(emails, epochs=None, gap_s=THREAD_GAP_S):
+    """
+    Thread number for each email.
+
+    Replies are joined to the messages they name in In-Reply-To/References; emails with the
+    same normalized subject are joined to the previous one unless gap_s or more apart.
+    """
+    count = len(emails)
+    if epochs is None:
+        epochs = to_epochs([email_date(email) for email in emails])
+    sources, targets = [], []
+
+    message_ids = _column(emails, "message_id")
+    positions = {message_id: position for position, message_id in message_ids.items() if isinstance(message_id, str)}
+    if positions:
+        for field in ("in_reply_to", "references"):
+            for position, parents in _column(emails, field).items():
+                for parent in parents if isinstance(parents, (list, tuple, np.ndarray)) else [parents]:
+                    if isinstance(parent, str) and parent in positions:
+                        sources.append(position)
+                        targets.append(positions[parent])
+
+    subjects = _column(emails, "subject").map(thread_key).to_numpy()
+    keys, _ = pd.factorize(subjects)
+    order = np.lexsort((epochs, keys))
+    ordered_keys, ordered_epochs = keys[order], epochs[order]
+    # Undated emails sort first within their subject and join the next one
+    link = (ordered_keys[1:] == ordered_keys[:-1]) & (subjects[order][1:] != "")
+    undated = (ordered_epochs[1:] == MISSING) | (ordered_epochs[:-1] == MISSING)
+    link &= undated | (np.diff(ordered_epochs) < gap_s)
+    sources = np.concatenate((np.array(sources, dtype=np.int64), order[:-1][link]))
+    targets = np.concatenate((np.array(targets, dtype=np.int64), order[1:][link]))
+    graph = sparse.coo_matrix((np.ones(len(sources)), (sources, targets)), shape=(count, count))
+    return connected_components(graph, directed=False)[1]
+
+
+def _mix(values):
+    """
+    The splitmix64 finalizer: spreads any 64-bit values over the whole range.
+    """
+    values = values ^ (values >> np.uint64(33))
+    values = values * np.uint64(0xFF51AFD7ED558CCD)
+    return values ^ (values >> np.uint64(33))
+
+
+def shingle_hashes(texts, k=SHINGLE_WORDS):
+    """
+    64-bit hashes of every k-word shingle of each text in a pyarrow string array, with the
+    index of the text each comes from, ordered by text. Texts shorter than k words contribute
+    their words instead.
+    """
+    # Blanking punctuation and splitting on whitespace is a few times faster than splitting on \W+
+    tokens = pc.utf8_split_whitespace(pc.replace_substring_regex(pc.utf8_lower(texts), r"[^\w\s]+", " "))
+    words = pc.list_flatten(tokens)
+    parents = pc.list_parent_indices(tokens).to_numpy()
+    nonempty = pc.not_equal(words, "")
+    words = words.filter(nonempty)
+    parents = parents[nonempty.to_numpy(zero_copy_only=False)]
+    word_hashes = _mix(pc.dictionary_encode(words).indices.to_numpy().astype(np.uint64) + np.uint64(1))
+
+    short = np.bincount(parents, minlength=len(texts)) < k
+    hashes, docs = [word_hashes[short[parents]]], [parents[short[parents]]]
+    if len(word_hashes) >= k:
+        count = len(word_hashes) - k + 1
+        shingles = word_hashes[:count].copy()
+        for offset in range(1, k):
+            shingles = _mix(shingles * np.uint64(0x100000001B3) + word_hashes[offset : offset + count])
+        within = parents[:count] == parents[k - 1 :]
+        hashes.append(shingles[within])
+        docs.append(parents[:count][within])
+    hashes, docs = np.concatenate(hashes), np.concatenate(docs)
+    order = np.argsort(docs, kind="stable")
+    return hashes[order], docs[order]
+
+
+def minhash_signatures(hashes, docs, count, num_perm=NUM_PERM, seed=0):
+    """
+    MinHash signature per document from its shingle hashes (docs gives each hash's document,
+    sorted). Documents without shingles get all-EMPTY signatures.
+
+    Each permutation is a multiply-add-shift hash (the high 32 bits of a * hash + b modulo
+    2**64, a odd), which needs no division and so runs an order of magnitude faster than
+    (a * hash + b) mod prime.
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 63, (num_perm, 1), dtype=np.uint64) | np.uint64(1)
+    b = rng.integers(0, 1 << 63, (num_perm, 1), dtype=np.uint64)
+    signatures = np.full((count, num_perm), EMPTY, dtype=np.uint32)
+    for start in range(0, len(hashes), HASH_CHUNK):
+        chunk_docs = docs[start : start + HASH_CHUNK]
+        permuted = a * hashes[start : start + HASH_CHUNK]
+        permuted += b
+        permuted >>= np.uint64(32)
+        bounds = np.flatnonzero(np.concatenate(([True], chunk_docs[1:] != chunk_docs[:-1])))
+        minima = np.minimum.reduceat(permuted.astype(np.uint32), bounds, axis=1).T
+        rows = chunk_docs[bounds]  # a document split across chunks is merged with its earlier minima
+        signatures[rows] = np.minimum(signatures[rows], minima)
+    return signatures
+
+
+def near_duplicate_clusters(signatures, bands=BANDS, threshold=SIMILARITY_THRESHOLD):
+    """
+    Cluster number for each document.
+
+    Documents sharing any LSH band bucket are candidates; a candidate pair is linked when
+    their signatures agree on at least threshold of the positions (an estimate of Jaccard
+    similarity), and clusters are the connected components.
+    """
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    candidates = np.flatnonzero(signatures[:, 0] != EMPTY)
+    sources, targets = [], []
+    for band in range(bands):
+        keys = np.zeros(len(candidates), dtype=np.uint64)
+        for column in signatures[candidates, band * rows : (band + 1) * rows].T:
+            keys = _mix(keys ^ column.astype(np.uint64))
+        order = np.argsort(keys, kind="stable")
+        ordered = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], ordered[1:] != ordered[:-1])))
+        # Link every member of a bucket to its first member rather than enumerating all pairs
+        first = order[np.repeat(starts, np.diff(np.append(starts, len(order))))]
+        linked = first != order
+        sources.append(candidates[order[linked]])
+        targets.append(candidates[first[linked]])
+    pairs = np.unique(np.stack((np.concatenate(sources), np.concatenate(targets)), axis=1), axis=0)
+    if len(pairs):
+        agreement = (signatures[pairs[:, 0]] == signatures[pairs[:, 1]]).mean(axis=1)
+        pairs = pairs[agreement >= threshold]
+    graph = sparse.coo_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(count, count))
+    return connected_components(graph, directed=False)[1]
+
+
+def _address_lists(emails, field):
+    """
+    Normalized addresses per email for one header, parsing each distinct value once.
+    """
+    column = _column(emails, field).map(lambda value: ", ".join(value) if isinstance(value, list) else value)
+    parsed = {value: [address for _, address in parse_addresses(value)] for value in column.dropna().unique()}
+    return [parsed.get(value, []) if isinstance(value, str) else [] for value in column]
+
+
+def _collapse_whitespace(value):
+    return " ".join(value.split()) if isinstance(value, str) else ""
+
+
+def _email_ids(emails):
+    """
+    Every email's corpus email_id. A position in an already filtered list is not one, so list
+    input has to carry them.
+    """
+    if isinstance(emails, EmailStore):
+        return emails.column("email_id")
+    ids = [email.get("email_id") for email in emails]
+    missing = [position for position, email_id in enumerate(ids) if not email_id]
+    if missing:
+        raise ValueError(f"Emails without an email_id at positions {missing[:10]}; aliases could not be traced")
+    return ids
+
+
+@traced()
+def collapse_emails(emails, threshold=SIMILARITY_THRESHOLD, strip_signatures=True):
+    """
+    Emails reduced for the prompt, as dicts in their original order, and a report.
+
+    Bodies lose their quoted history (and signatures) unless they are forwards, and every email
+    gets a "thread" label. Emails given as a list must each have an email_id (ValueError otherwise).
+    Copies of one message (near-duplicate bodies with the same sender, subject and date) are
+    replaced by the earliest, whose recipients become the union of the copies' recipients and
+    whose "aliases" list the email_ids of the others.
+    """
+    count = len(emails)
+    if count == 0:
+        return [], {**dict.fromkeys(REPORT_COUNTS, 0), "token_reduction": 0.0}
+    ids = _email_ids(emails)
+    epochs = to_epochs([email_date(email) for email in emails])
+    bodies = _strings(_column(emails, "body"))
+    cleaned = clean_bodies(bodies, strip_signatures, keep=is_forward(_strings(_column(emails, "subject"))))
+    threads = assign_threads(emails, epochs)
+
+    # Near-duplicates are judged on the cleaned text, so replies differing only in what they quote do not match
+    texts = pc.if_else(pc.equal(cleaned, ""), _strings(_column(emails, "subject")), cleaned)
+    hashes, docs = shingle_hashes(texts)
+    clusters = near_duplicate_clusters(minhash_signatures(hashes, docs, count), threshold=threshold)
+    # A similar body alone does not make a copy: "Approved, send it." from two people is two pieces of evidence
+    subjects = _column(emails, "subject").map(_collapse_whitespace)
+    senders = [",".join(addresses) for addresses in _address_lists(emails, "sender")]
+    headers = pd.DataFrame({"cluster": clusters, "sender": senders, "subject": subjects, "date": epochs})
+    clusters = headers.groupby(list(headers), sort=False).ngroup().to_numpy()
+
+    # The canonical email of a cluster is its earliest (undated ones last), then the first in order
+    order = np.lexsort((np.arange(count), np.where(epochs == MISSING, np.iinfo(np.int64).max, epochs), clusters))
+    starts = np.flatnonzero(np.concatenate(([True], clusters[order][1:] != clusters[order][:-1])))
+    canonical_of = np.empty(count, dtype=np.int64)
+    canonical_of[order] = np.repeat(order[starts], np.diff(np.append(starts, count)))
+    copies = {}
+    for position in np.flatnonzero(canonical_of != np.arange(count)).tolist():
+        copies.setdefault(int(canonical_of[position]), []).append(position)
+    recipients = {field: _address_lists(emails, field) for field in RECIPIENT_FIELDS} if copies else {}
+
+    cleaned = cleaned.to_pylist()
+    reduced = []
+    for position in np.sort(order[starts]).tolist():
+        email = {**dict(emails[position]), "email_id": ids[position], "body": cleaned[position]}
+        email["thread"] = f"THREAD_{threads[position]}"
+        if position in copies:
+            email["aliases"] = [ids[copy] for copy in copies[position]]
+            # Copies differ only in who received them, so the kept email lists every recipient
+            for field, lists in recipients.items():
+                members = [position, *copies[position]]
+                union = list(dict.fromkeys(address for member in members for address in lists[member]))
+                if union != lists[position]:
+                    email[field] = ", ".join(union)
+        reduced.append(email)
+
+    tokens_before = count_tokens(format_emails(emails))
+    tokens_after = count_tokens(format_emails(reduced))
+    report = {
+        "emails": count,
+        "threads": len(np.unique(threads)),
+        "kept": len(reduced),
+        "duplicates_collapsed": count - len(reduced),
+        "body_chars_before": int(pc.sum(pc.utf8_length(bodies)).as_py() or 0),
+        "body_chars_after": sum(len(email["body"]) for email in reduced),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "token_reduction": 1 - tokens_after / tokens_before if tokens_before else 0.0,
+    }
+    return reduced, report
+
+
+def format_report(report):
+    return (
+        f"{report['emails']} emails in {report['threads']} threads -> {report['kept']} kept "
+        f"({report['duplicates_collapsed']} near-duplicates collapsed); "
+        f"{report['tokens_before']:,} -> {report['tokens_after']:,} tokens ({report['token_reduction']:.0%} fewer)"
+    )
@@ -0,0 +1,150 @@
+"""
+Inverted index from normalized email address to email IDs.
+
+Email IDs are positions in the corpus as returned by load_all_emails. The index covers the
+sender, every parsed To/CC/BCC address and display-name aliases (from the address headers and
+participant_descriptions.pkl), and is pickled next to the email file so it is built once per
+corpus.
+"""
+import hashlib
+import json
+import os
+import pickle as p
+from collections import defaultdict
+from email.utils import getaddresses
+from functools import reduce
+
+import numpy as np
+
+from email_loader import EMAILS_PATH, iter_emails
+
+RECIPIENT_FIELDS = ("recipients", "cc", "bcc")
+ADDRESS_FIELDS = ("sender",) + RECIPIENT_FIELDS
+INDEX_VERSION = 1
+
+
+def normalize_address(address):
+    return address.strip().strip("<>").lower()
+
+
+def normalize_name(name):
+    return " ".join(name.lower().split())
+
+
+def parse_addresses(value):
+    """
+    Parse a raw address header (or list of addresses) into (display name, normalized address) pairs.
+    """
+    if value is None or isinstance(value, float):  # missing cells come through as None or NaN
+        return []
+    if not isinstance(value, str):
+        value = ", ".join(map(str, value))
+    return [(name, normalize_address(address)) for name, address in getaddresses([value]) if address]
+
+
+def email_addresses(email):
+    """
+    Return every normalized address involved in an email.
+    """
+    return {address for field in ADDRESS_FIELDS for _, address in parse_addresses(email.get(field))}
+
+
+class ParticipantIndex:
+    """
+    Maps addresses to sorted arrays of email IDs for O(matches) lookups and set queries.
+    """
+
+    def __init__(self, involved, sent, aliases):
+        self.involved = involved
+        self.sent = sent
+        self.aliases = aliases
+
+    @classmethod
+    def build(cls, emails, participant_descriptions=()):
+        involved = defaultdict(list)
+        sent = defaultdict(list)
+        aliases = defaultdict(set)
+        for email_id, email in enumerate(emails):
+            addresses = set()
+            for field in ADDRESS_FIELDS:
+                for name, address in parse_addresses(email.get(field)):
+                    addresses.add(address)
+                    if field == "sender":
+                        sent[address].append(email_id)
+                    if name:
+                        aliases[normalize_name(name)].add(address)
+            for address in addresses:
+                involved[address].append(email_id)
+        for entry in participant_descriptions:
+            aliases[normalize_name(entry["participant"])].add(normalize_address(entry["email_address"]))
+
+        def to_arrays(postings):
+            return {address: np.unique(np.array(ids, dtype=np.int64)) for address, ids in postings.items()}
+
+        return cls(to_arrays(involved), to_arrays(sent), {name: frozenset(addrs) for name, addrs in aliases.items()})
+
+    @classmethod
+    def load_or_build(cls, path=EMAILS_PATH, participant_descriptions=(), index_path=None):
+        """
+        Load the pickled index for an email file, rebuilding it when the file is newer or the
+        participant descriptions changed.
+        """
+        index_path = index_path or os.path.splitext(path)[0] + ".participants.pkl"
+        participant_descriptions = list(participant_descriptions)
+        digest = hashlib.sha256(json.dumps(participant_descriptions, sort_keys=True, default=str).encode()).hexdigest()
+        # The key is (version, digest); indexes pickled before the digest was kept have a bare version
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(path):
+            with open(index_path, "rb") as f:
+                key, index = p.load(f)
+            if key == (INDEX_VERSION, digest):
+                return index
+        # Only the address columns are read; for xlsx this also primes the Parquet cache
+        index = cls.build(iter_emails(path, columns=ADDRESS_FIELDS), participant_descriptions)
+        with open(index_path, "wb") as f:
+            p.dump(((INDEX_VERSION, digest), index), f)
+        return index
+
+    def resolve(self, person):
+        """
+        Resolve an address or display name to the set of addresses it refers to.
+        """
+        if "@" in person:
+            return {normalize_address(person)}
+        return set(self.aliases.get(normalize_name(person), ()))
+
+    def _postings(self, postings, person):
+        arrays = [postings[address] for address in self.resolve(person) if address in postings]
+        return reduce(np.union1d, arrays, np.array([], dtype=np.int64))
+
+    def emails_involving(self, person):
+        """
+        IDs of emails the person sent or received.
+        """
+        return self._postings(self.involved, person)
+
+    def emails_sent_by(self, person):
+        return self._postings(self.sent, person)
+
+    def emails_involving_any(self, people):
+        """
+        IDs of emails involving at least one of the people.
+        """
+        return reduce(np.union1d, (self.emails_involving(person) for person in people), np.array([], dtype=np.int64))
+
+    def emails_involving_all(self, people):
+        """
+        IDs of emails involving every one of the people (none when people is empty).
+        """
+        people = list(people)
+        if not people:
+            return np.array([], dtype=np.int64)
+        return reduce(np.intersect1d, (self.emails_involving(person) for person in people))
+
+    def emails_between(self, a, b):
+        """
+        IDs of emails sent by one of a or b to the other.
+        """
+        return np.union1d(
+            np.intersect1d(self.emails_sent_by(a), self.emails_involving(b)),
+            np.intersect1d(self.emails_sent_by(b), self.emails_involving(a)),
+        )
@@ -0,0 +1,152 @@
+"""
+Streaming email loader.
+
+Emails are read in bounded-memory chunks from xlsx, CSV or Parquet. The first time an xlsx
+file is loaded it is converted to a Parquet file next to it, and later loads read the Parquet
+copy instead, which is orders of magnitude faster than parsing the workbook with openpyxl.
+Columns can be selected so callers that only need addresses never read the bodies; requested
+columns a file does not have are skipped.
+"""
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import load_workbook
+
+EMAILS_PATH = "generated_emails_with_background_7.xlsx"
+CHUNK_SIZE = 10_000
+
+
+def columnar_cache_path(path):
+    return os.path.splitext(path)[0] + ".parquet"
+
+
+def _iter_xlsx_chunks(path, columns=None, chunksize=CHUNK_SIZE):
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name) for name in next(rows)]
+        wanted = [i for i, name in enumerate(header) if columns is None or name in columns]
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            chunk.append({header[i]: row[i] for i in wanted})
+            if len(chunk) >= chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+def _iter_csv_chunks(path, columns=None, chunksize=CHUNK_SIZE):
+    usecols = None if columns is None else (lambda name: name in columns)
+    for frame in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+        yield frame.to_dict(orient="records")
+
+
+def _iter_parquet_chunks(path, columns=None, chunksize=CHUNK_SIZE):
+    parquet_file = pq.ParquetFile(path)
+    if columns is not None:
+        columns = [name for name in columns if name in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+        yield batch.to_pylist()
+
+
+def _widen_schema(schema, other):
+    """
+    A schema both schemas cast to: null columns take the other type, int64 and double give
+    double, and columns with otherwise incompatible types become strings.
+    """
+    fields = []
+    for field in schema:
+        pair = [pa.schema([field]), pa.schema([other.field(field.name)])]
+        try:
+            fields.append(pa.unify_schemas(pair, promote_options="permissive")[0])
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            fields.append(pa.field(field.name, pa.string()))
+    return pa.schema(fields)
+
+
+def _rewrite(path, schema):
+    """
+    Copy the rows written to path so far into a new file with a wider schema, batch by batch,
+    and return the open writer, so later chunks are appended to it.
+    """
+    old_path = path + ".old"
+    os.replace(path, old_path)
+    writer = pq.ParquetWriter(path, schema)
+    for batch in pq.ParquetFile(old_path).iter_batches():
+        writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+    os.remove(old_path)
+    return writer
+
+
+def convert_to_parquet(path, cache_path=None, chunksize=CHUNK_SIZE):
+    """
+    Stream an xlsx or CSV file into a Parquet file and return its path.
+    """
+    cache_path = cache_path or columnar_cache_path(path)
+    read_chunks = _iter_csv_chunks if path.endswith(".csv") else _iter_xlsx_chunks
+    chunks = read_chunks(path, chunksize=chunksize)
+    tmp_path = cache_path + ".tmp"
+    writer = None
+    try:
+        for chunk in chunks:
+            frame = pd.DataFrame.from_records(chunk)
+            # Mixed-type object columns (e.g. empty attachments) are stored as strings
+            for column in frame.columns[frame.dtypes == object]:
+                frame[column] = frame[column].map(lambda value: None if pd.isna(value) else str(value))
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            elif not table.schema.equals(writer.schema):
+                # Types are inferred per chunk (a column may be empty, or int, in the first one), so
+                # widen the file's schema whenever a chunk does not fit it
+                schema = _widen_schema(writer.schema, table.schema)
+                if not schema.equals(writer.schema):
+                    writer.close()
+                    writer = _rewrite(tmp_path, schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"No rows found in {path}")
+    os.replace(tmp_path, cache_path)
+    return cache_path
+
+
+def iter_email_chunks(path=EMAILS_PATH, columns=None, chunksize=CHUNK_SIZE, use_cache=True):
+    """
+    Yield emails as lists of at most chunksize dicts.
+
+    xlsx input is converted to a Parquet cache on first use (and again whenever the xlsx is
+    newer than the cache) unless use_cache is False.
+    """
+    columns = list(columns) if columns is not None else None
+    if path.endswith(".parquet"):
+        yield from _iter_parquet_chunks(path, columns, chunksize)
+    elif path.endswith(".csv"):
+        yield from _iter_csv_chunks(path, columns, chunksize)
+    elif path.endswith(".xlsx"):
+        if not use_cache:
+            yield from _iter_xlsx_chunks(path, columns, chunksize)
+            return
+        cache_path = columnar_cache_path(path)
+        if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+            convert_to_parquet(path, cache_path, chunksize)
+        yield from _iter_parquet_chunks(cache_path, columns, chunksize)
+    else:
+        raise ValueError(f"Unsupported email file format: {path}")
+
+
+def iter_emails(path=EMAILS_PATH, columns=None, chunksize=CHUNK_SIZE, use_cache=True):
+    """
+    Yield emails one at a time as dicts.
+    """
+    for chunk in iter_email_chunks(path, columns, chunksize, use_cache):
+        yield from chunk
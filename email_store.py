@@ -0,0 +1,212 @@
+"""
+Compact columnar in-memory email store.
+
+Instead of one dict per email, every column is held once for the whole corpus: short fields
+(addresses, subjects, dates, ...) as integer codes into a shared table of interned values, and
+long text fields (the bodies) as UTF-8 in one contiguous buffer with start/end offsets. Each
+email gets a stable integer ID when it is loaded, so subsets keep their IDs and the
+"EMAIL_<id>" labels the prompts reference never shift. Rows are read through lightweight
+read-only EmailRecord views that behave like the dicts the rest of the code expects.
+"""
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+from email_loader import EMAILS_PATH, iter_emails
+
+TEXT_COLUMNS = ("body",)
+ID_OFFSET = 2  # IDs match the email's row number in the spreadsheet (row 1 is the header)
+MISSING = -1
+
+
+def email_label(email_id):
+    return f"EMAIL_{email_id}"
+
+
+class StringTable:
+    """
+    Interns values so each distinct value is stored once and referred to by an integer code.
+    """
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        if value is None:
+            return MISSING
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class EmailRecord(Mapping):
+    """
+    Read-only view of one email in an EmailStore; supports the dict read API (get, items, ...).
+    """
+
+    __slots__ = ("store", "position")
+
+    def __init__(self, store, position):
+        self.store = store
+        self.position = position
+
+    @property
+    def id(self):
+        return int(self.store.ids[self.position])
+
+    def __getitem__(self, key):
+        return self.store.value(self.position, key)
+
+    def __iter__(self):
+        return iter(self.store.keys)
+
+    def __len__(self):
+        return len(self.store.keys)
+
+    def to_dict(self):
+        return {key: self[key] for key in self.store.keys}
+
+    def __repr__(self):
+        return f"EmailRecord({self.to_dict()!r})"
+
+
+class EmailStore:
+    """
+    Columnar storage for a list of emails, indexed by position like the list it replaces.
+
+    store[i] returns an EmailRecord, and store[positions] or store.take(positions) returns a
+    subset store that shares the interned values and the text buffer with this one.
+    """
+
+    def __init__(self, ids, codes, text, strings, buffer):
+        self.ids = ids
+        self.codes = codes  # column -> int32 codes into strings
+        self.text = text  # column -> (starts, ends) int64 offsets into buffer, MISSING when absent
+        self.strings = strings
+        self.buffer = buffer
+        self.keys = (*codes, *text, "email_id")
+
+    @classmethod
+    def from_records(cls, records, text_columns=TEXT_COLUMNS, first_id=ID_OFFSET):
+        """
+        Build a store from an iterable of dicts, assigning consecutive IDs from first_id.
+
+        Records may be streamed; none are kept after their values have been copied in.
+        """
+        strings = StringTable()
+        buffer = bytearray()
+        codes, starts, ends = {}, {}, {}
+        count = 0
+        for record in records:
+            for key in record:
+                if key in codes or key in starts or key == "email_id":
+                    continue
+                # Columns first seen part-way through are missing for the earlier rows
+                if key in text_columns:
+                    starts[key] = array("q", [MISSING] * count)
+                    ends[key] = array("q", [MISSING] * count)
+                else:
+                    codes[key] = array("i", [MISSING] * count)
+            for key, column in codes.items():
+                column.append(strings.code(_present(record.get(key))))
+            for key in starts:
+                value = _present(record.get(key))
+                if value is None:
+                    starts[key].append(MISSING)
+                    ends[key].append(MISSING)
+                    continue
+                starts[key].append(len(buffer))
+                buffer += str(value).encode("utf-8")
+                ends[key].append(len(buffer))
+            count += 1
+
+        return cls(
+            np.arange(first_id, first_id + count, dtype=np.int64),
+            {key: np.frombuffer(column, dtype=np.int32) for key, column in codes.items()},
+            {
+                key: (np.frombuffer(starts[key], dtype=np.int64), np.frombuffer(ends[key], dtype=np.int64))
+                for key in starts
+            },
+            strings,
+            buffer,
+        )
+
+    @classmethod
+    def load(cls, path=EMAILS_PATH, columns=None, text_columns=TEXT_COLUMNS):
+        """
+        Stream an email file (see email_loader) into a store.
+        """
+        return cls.from_records(iter_emails(path, columns=columns), text_columns=text_columns)
+
+    def value(self, position, key):
+        if key in self.codes:
+            code = self.codes[key][position]
+            return None if code == MISSING else self.strings.values[code]
+        if key in self.text:
+            starts, ends = self.text[key]
+            start = starts[position]
+            return None if start == MISSING else self.buffer[start : ends[position]].decode("utf-8")
+        if key == "email_id":
+            return email_label(self.ids[position])
+        raise KeyError(key)
+
+    def column(self, key):
+        """
+        All values of one column as a list.
+        """
+        if key in self.codes:
+            values = self.strings.values
+            return [None if code == MISSING else values[code] for code in self.codes[key].tolist()]
+        return [self.value(position, key) for position in range(len(self))]
+
+    def take(self, positions):
+        """
+        Subset store holding the emails at the given positions, in that order.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        return EmailStore(
+            self.ids[positions],
+            {key: column[positions] for key, column in self.codes.items()},
+            {key: (starts[positions], ends[positions]) for key, (starts, ends) in self.text.items()},
+            self.strings,
+            self.buffer,
+        )
+
+    def to_records(self):
+        return [record.to_dict() for record in self]
+
+    def nbytes(self):
+        """
+        Approximate memory held by the arrays and the text buffer (interned values excluded).
+        """
+        arrays = [self.ids, *self.codes.values(), *(offsets for pair in self.text.values() for offsets in pair)]
+        return sum(offsets.nbytes for offsets in arrays) + len(self.buffer)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            if item < 0:
+                item += len(self)
+            if not 0 <= item < len(self):
+                raise IndexError(item)
+            return EmailRecord(self, int(item))
+        if isinstance(item, slice):
+            return self.take(np.arange(len(self))[item])
+        return self.take(item)
+
+    def __iter__(self):
+        return (EmailRecord(self, position) for position in range(len(self)))
+
+
+def _present(value):
+    # Missing spreadsheet cells arrive as None or NaN
+    return None if value is None or (isinstance(value, float) and value != value) else value
@@ -0,0 +1,209 @@
+"""
+Persistent on-disk embedding cache.
+
+Vectors are stored as float32 rows in one memory-mapped file per (model, dimension), and a
+small SQLite index maps sha256(text) to a row. When the file is full the least recently used
+rows are evicted and their slots reused. Every code path that embeds text should go through
+get_embedder() so they all share the same cache.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from ingest import EMBEDDING_MODEL, OpenAIEmbedder
+
+CACHE_DIR = "embedding_cache"
+MAX_CACHE_BYTES = 2 * 1024**3  # vector file size bound per (model, dimension)
+EVICT_FRACTION = 0.05  # share of slots freed at once when the cache is full
+
+MODEL_DIMENSIONS = {
+    "text-embedding-3-large": 3072,
+    "text-embedding-3-small": 1536,
+    "text-embedding-ada-002": 1536,
+}
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Size-bounded LRU cache of embeddings keyed by (model, dimension, sha256 of text).
+    """
+
+    def __init__(self, model, dimension, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.model = model
+        self.dimension = dimension
+        self.capacity = max(1, max_bytes // (dimension * 4))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "model TEXT NOT NULL, dimension INTEGER NOT NULL, text_hash TEXT NOT NULL, "
+            "slot INTEGER NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (model, dimension, text_hash))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (model, dimension, last_used)")
+        self.conn.commit()
+
+        vectors_path = os.path.join(cache_dir, f"{model}-{dimension}.f32")
+        size = self.capacity * dimension * 4
+        exists = os.path.exists(vectors_path)
+        if not exists or os.path.getsize(vectors_path) != size:
+            # Opened with a different max_bytes, or the file is missing or truncated: only the
+            # entries whose rows are both in the file and within capacity still hold their vectors
+            rows = os.path.getsize(vectors_path) // (dimension * 4) if exists else 0
+            with self.conn:
+                self.conn.execute(
+                    "DELETE FROM entries WHERE model = ? AND dimension = ? AND slot >= ?",
+                    (model, dimension, min(rows, self.capacity)),
+                )
+            if exists:
+                with open(vectors_path, "r+b") as f:
+                    f.truncate(size)
+        mode = "r+" if exists else "w+"
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, dimension))
+        used = {row[0] for row in self._select("SELECT slot FROM entries WHERE model = ? AND dimension = ?")}
+        self._free_slots = [slot for slot in range(self.capacity - 1, -1, -1) if slot not in used]
+
+    def _select(self, query, *params):
+        return self.conn.execute(query, (self.model, self.dimension, *params)).fetchall()
+
+    def get_many(self, texts):
+        """
+        Return a cached vector for each text, or None where the text is not cached.
+        """
+        hashes = [text_hash(text) for text in texts]
+        with self._lock:
+            slots = {}
+            unique = list(set(hashes))
+            for start in range(0, len(unique), 500):
+                chunk = unique[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                slots.update(
+                    self._select(
+                        f"SELECT text_hash, slot FROM entries WHERE model = ? AND dimension = ? "
+                        f"AND text_hash IN ({placeholders})",
+                        *chunk,
+                    )
+                )
+            now = time.time()
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE model = ? AND dimension = ? AND text_hash = ?",
+                    [(now, self.model, self.dimension, h) for h in slots],
+                )
+            results = [np.array(self.vectors[slots[h]]) if h in slots else None for h in hashes]
+            found = sum(result is not None for result in results)
+            self.hits += found
+            self.misses += len(results) - found
+        return results
+
+    def put_many(self, texts, vectors):
+        """
+        Store vectors for texts, evicting least recently used entries when full.
+
+        Each entry is written to the index as soon as it has a slot, so an eviction later in the
+        same call sees it: a slot is never handed out while an entry still points at it.
+        """
+        with self._lock, self.conn:
+            now = time.time()
+            for text, vector in zip(texts, vectors):
+                h = text_hash(text)
+                existing = self._select(
+                    "SELECT slot FROM entries WHERE model = ? AND dimension = ? AND text_hash = ?", h
+                )
+                if existing:
+                    slot = existing[0][0]
+                else:
+                    if not self._free_slots:
+                        self._evict()
+                    slot = self._free_slots.pop()
+                self.vectors[slot] = vector
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (self.model, self.dimension, h, slot, now)
+                )
+            self.vectors.flush()
+
+    def _evict(self):
+        count = max(1, int(self.capacity * EVICT_FRACTION))
+        victims = self._select(
+            "SELECT text_hash, slot FROM entries WHERE model = ? AND dimension = ? ORDER BY last_used LIMIT ?", count
+        )
+        self.conn.executemany(
+            "DELETE FROM entries WHERE model = ? AND dimension = ? AND text_hash = ?",
+            [(self.model, self.dimension, h) for h, _ in victims],
+        )
+        self._free_slots.extend(slot for _, slot in victims)
+        self.evictions += len(victims)
+
+    def __len__(self):
+        return self._select("SELECT COUNT(*) FROM entries WHERE model = ? AND dimension = ?")[0][0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "dimension": self.dimension,
+            "entries": len(self),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedEmbedder:
+    """
+    Wraps an embedder so only texts missing from the cache are sent to it.
+    """
+
+    def __init__(self, embedder, cache):
+        self.embedder = embedder
+        self.cache = cache
+
+    def __call__(self, texts):
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            new_vectors = self.embedder(missing)
+            self.cache.put_many(missing, new_vectors)
+            by_text = dict(zip(missing, new_vectors))
+            vectors = [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+        return [list(map(float, vector)) for vector in vectors]
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(model=EMBEDDING_MODEL, dimension=None, cache_dir=CACHE_DIR):
+    """
+    Return the process-wide cache for a model and dimension.
+    """
+    if not dimension and model not in MODEL_DIMENSIONS:
+        raise ValueError(f"Unknown embedding model {model!r}: pass its dimension or add it to MODEL_DIMENSIONS")
+    dimension = dimension or MODEL_DIMENSIONS[model]
+    with _caches_lock:
+        key = (model, dimension, cache_dir)
+        if key not in _caches:
+            _caches[key] = EmbeddingCache(model, dimension, cache_dir=cache_dir)
+        return _caches[key]
+
+
+def get_embedder(client, model=EMBEDDING_MODEL, dimensions=None):
+    """
+    Return an OpenAI embedder backed by the shared on-disk cache.
+    """
+    return CachedEmbedder(OpenAIEmbedder(client, model, dimensions), get_cache(model, dimensions))
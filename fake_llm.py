@@ -0,0 +1,283 @@
+"""
+Fake Anthropic clients for exercising the pipeline without network access.
+
+The fakes return real anthropic.types.Message objects after a configurable latency and can
+enforce their own per-minute request limit, answering with 429s the way the API does, so rate
+limiting and retries can be tested offline.
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import time
+from collections import deque
+
+import anthropic
+import httpx
+import numpy as np
+from anthropic.types import (
+    InputJSONDelta,
+    Message,
+    MessageDeltaUsage,
+    RawContentBlockDeltaEvent,
+    RawContentBlockStartEvent,
+    RawContentBlockStopEvent,
+    RawMessageDeltaEvent,
+    RawMessageStartEvent,
+    RawMessageStopEvent,
+    TextBlock,
+    TextDelta,
+    Usage,
+)
+
+from utils import count_tokens
+
+FAKE_MODEL = "fake-claude"
+STREAM_CHUNK_CHARS = 16
+DEFAULT_REPLY = json.dumps({"secondary_poi": [], "key_events": [], "sus_activities": [], "entities_of_note": []})
+
+_ids = itertools.count()
+
+
+def make_message(
+    text=DEFAULT_REPLY, model=FAKE_MODEL, input_tokens=0, output_tokens=None, content=None, stop_reason="end_turn"
+):
+    """
+    Build a Message as the Messages API would return it.
+    """
+    return Message(
+        id=f"msg_fake_{next(_ids)}",
+        type="message",
+        role="assistant",
+        model=model,
+        content=content if content is not None else [TextBlock(type="text", text=text)],
+        stop_reason=stop_reason,
+        stop_sequence=None,
+        usage=Usage(
+            input_tokens=input_tokens,
+            output_tokens=count_tokens(text) if output_tokens is None else output_tokens,
+            cache_creation_input_tokens=0,
+            cache_read_input_tokens=0,
+        ),
+    )
+
+
+def message_events(message, chunk_chars=STREAM_CHUNK_CHARS):
+    """
+    Yield the raw stream events the API would send for a Message.
+    """
+    start = message.model_copy(update={"content": [], "stop_reason": None})
+    yield RawMessageStartEvent(type="message_start", message=start)
+    for index, block in enumerate(message.content):
+        if block.type == "tool_use":
+            text = json.dumps(block.input)
+            yield RawContentBlockStartEvent(
+                type="content_block_start", index=index, content_block=block.model_copy(update={"input": {}})
+            )
+        else:
+            text = block.text
+            yield RawContentBlockStartEvent(
+                type="content_block_start", index=index, content_block=TextBlock(type="text", text="")
+            )
+        for offset in range(0, len(text), chunk_chars):
+            chunk = text[offset : offset + chunk_chars]
+            delta = (
+                InputJSONDelta(type="input_json_delta", partial_json=chunk)
+                if block.type == "tool_use"
+                else TextDelta(type="text_delta", text=chunk)
+            )
+            yield RawContentBlockDeltaEvent(type="content_block_delta", index=index, delta=delta)
+        yield RawContentBlockStopEvent(type="content_block_stop", index=index)
+    yield RawMessageDeltaEvent(
+        type="message_delta",
+        delta={"stop_reason": message.stop_reason, "stop_sequence": None},
+        usage=MessageDeltaUsage(output_tokens=message.usage.output_tokens),
+    )
+    yield RawMessageStopEvent(type="message_stop")
+
+
+def api_error(status_code, retry_after=None):
+    """
+    Build the APIStatusError subclass the SDK raises for a status code.
+    """
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    response = httpx.Response(status_code, headers=headers, request=httpx.Request("POST", "https://fake/v1/messages"))
+    error_class = {429: anthropic.RateLimitError}.get(status_code, anthropic.InternalServerError)
+    return error_class(f"Fake error {status_code}", response=response, body=None)
+
+
+def request_key(kwargs):
+    """
+    Hash identifying a request, ignoring whether it was streamed.
+    """
+    request = {key: value for key, value in kwargs.items() if key != "stream"}
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def request_tokens(kwargs):
+    return count_tokens(json.dumps([kwargs.get("system"), kwargs.get("messages"), kwargs.get("tools")], default=str))
+
+
+class _FakeMessages:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, **kwargs):
+        return self.owner._create(kwargs)
+
+
+class FakeAnthropic:
+    """
+    Stands in for Anthropic: client.messages.create(**kwargs) returns a Message.
+
+    responder(kwargs) returns the reply text or a full Message; by default an empty
+    InvestigationResults JSON is returned. requests_per_minute makes the fake reject calls over
+    the limit with 429s, and overloaded_rate makes a share of calls fail with 529s. Streamed
+    replies wait chunk_latency between events after the initial latency.
+    """
+
+    def __init__(
+        self,
+        responder=None,
+        latency=0.05,
+        jitter=0.0,
+        requests_per_minute=None,
+        overloaded_rate=0.0,
+        seed=0,
+        chunk_latency=0.0,
+    ):
+        self.responder = responder
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.jitter = jitter
+        self.requests_per_minute = requests_per_minute
+        self.overloaded_rate = overloaded_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.rejected = 0
+        self._window = deque()
+        self.messages = _FakeMessages(self)
+
+    def _admit(self):
+        now = time.monotonic()
+        while self._window and now - self._window[0] > 60:
+            self._window.popleft()
+        if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+            self.rejected += 1
+            raise api_error(429, retry_after=max(0.0, 60 - (now - self._window[0])))
+        if self.overloaded_rate and self.random.random() < self.overloaded_rate:
+            self.rejected += 1
+            raise api_error(529)
+        self._window.append(now)
+
+    def _reply(self, kwargs):
+        reply = self.responder(kwargs) if self.responder else DEFAULT_REPLY
+        if isinstance(reply, Message):
+            return reply
+        return make_message(reply, model=kwargs.get("model", FAKE_MODEL), input_tokens=request_tokens(kwargs))
+
+    def _create(self, kwargs):
+        self.calls += 1
+        self._admit()
+        time.sleep(self.latency + self.random.uniform(0, self.jitter))
+        if kwargs.get("stream"):
+            return self._stream(self._reply(kwargs))
+        return self._reply(kwargs)
+
+    def _stream(self, message):
+        for event in message_events(message):
+            time.sleep(self.chunk_latency)
+            yield event
+
+
+class FakeAsyncAnthropic(FakeAnthropic):
+    """
+    Stands in for AsyncAnthropic; see FakeAnthropic.
+    """
+
+    async def _create(self, kwargs):
+        self.calls += 1
+        self._admit()
+        await asyncio.sleep(self.latency + self.random.uniform(0, self.jitter))
+        if kwargs.get("stream"):
+            return self._stream(self._reply(kwargs))
+        return self._reply(kwargs)
+
+    async def _stream(self, message):
+        for event in message_events(message):
+            await asyncio.sleep(self.chunk_latency)
+            yield event
+
+
+class RecordingAnthropic:
+    """
+    Wraps a real client and appends every (request key, response) pair to a JSONL file.
+    """
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.messages = _FakeMessages(self)
+
+    def _create(self, kwargs):
+        response = self.client.messages.create(**kwargs)
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"key": request_key(kwargs), "response": response.model_dump(mode="json")}) + "\n")
+        return response
+
+
+def load_recordings(path):
+    recordings = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                record = json.loads(line)
+                recordings[record["key"]] = Message.model_validate(record["response"])
+    return recordings
+
+
+class ReplayAnthropic(FakeAnthropic):
+    """
+    Replays responses recorded by RecordingAnthropic.
+
+    Requests that were not recorded fall back to responder (or the default reply), unless
+    strict is set, in which case they raise KeyError.
+    """
+
+    def __init__(self, path, responder=None, strict=False, **kwargs):
+        super().__init__(responder=responder, **kwargs)
+        self.recordings = load_recordings(path)
+        self.strict = strict
+        self.replayed = 0
+
+    def _reply(self, kwargs):
+        key = request_key(kwargs)
+        if key in self.recordings:
+            self.replayed += 1
+            return self.recordings[key]
+        if self.strict:
+            raise KeyError(f"No recorded response for request {key[:12]}")
+        return super()._reply(kwargs)
+
+
+class FakeEmbedder:
+    """
+    Deterministic stand-in for ingest.OpenAIEmbedder: unit vectors seeded by a hash of each text.
+    """
+
+    def __init__(self, dimensions=256, latency=0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        time.sleep(self.latency)
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dimensions)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        return vectors
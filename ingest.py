@@ -0,0 +1,179 @@
+"""
+Batched, concurrent embedding ingestion into Qdrant.
+
+Documents are dicts with a "text" to embed and a "payload" to store, plus an optional "id".
+Texts are grouped into token-bounded embedding requests, a bounded pool of requests runs
+concurrently, and the resulting vectors are written to Qdrant in large non-blocking upserts.
+"""
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import openai
+from qdrant_client import models
+
+from utils import count_tokens, retry_with_backoff, truncate_to_tokens
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+MAX_INPUT_TOKENS = 8191  # per-text limit of the OpenAI embedding models
+MAX_BATCH_TOKENS = 250_000  # stay under the 300k tokens-per-request limit
+MAX_BATCH_ITEMS = 2048  # max inputs per embeddings request
+UPSERT_BATCH_SIZE = 512
+CONCURRENCY = 4
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+class OpenAIEmbedder:
+    """
+    Embeds a list of texts with one OpenAI embeddings request.
+    """
+
+    def __init__(self, client, model=EMBEDDING_MODEL, dimensions=None):
+        self.client = client
+        self.model = model
+        self.dimensions = dimensions
+
+    def __call__(self, texts):
+        kwargs = {"dimensions": self.dimensions} if self.dimensions else {}
+        response = self.client.embeddings.create(input=texts, model=self.model, **kwargs)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def shorten_embeddings(vectors, dimensions):
+    """
+    Truncate text-embedding-3 vectors to their first dimensions and re-normalize them.
+
+    The models are trained so that a prefix of the vector is itself a usable embedding; this
+    matches what the API's "dimensions" parameter returns, without another request.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)[:, :dimensions]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class IngestStats:
+    """
+    Counters and throughput for an ingestion run.
+    """
+
+    def __init__(self):
+        self.docs = 0
+        self.tokens = 0
+        self.batches = 0
+        self.upserts = 0
+        self.retries = 0
+        self.skipped = 0
+        self.deleted = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def report(self):
+        elapsed = self.elapsed or (time.perf_counter() - self.started)
+        return (
+            f"Ingested {self.docs} docs ({self.tokens} tokens) in {elapsed:.2f}s "
+            f"across {self.batches} embedding batches and {self.upserts} upserts, {self.retries} retries: "
+            f"{self.docs / elapsed:.1f} docs/sec, {self.tokens / elapsed:.1f} tokens/sec; "
+            f"{self.skipped} unchanged docs skipped, {self.deleted} removed"
+        )
+
+
+def batch_by_tokens(documents, max_batch_tokens=MAX_BATCH_TOKENS, max_batch_items=MAX_BATCH_ITEMS):
+    """
+    Group documents into batches bounded by total tokens and item count.
+
+    Texts longer than the model's input limit are truncated. Yields (batch, batch_tokens).
+    """
+    batch, batch_tokens = [], 0
+    for document in documents:
+        tokens = count_tokens(document["text"])
+        if tokens > MAX_INPUT_TOKENS:
+            document = {**document, "text": truncate_to_tokens(document["text"], MAX_INPUT_TOKENS)}
+            tokens = MAX_INPUT_TOKENS
+        if batch and (batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_items):
+            yield batch, batch_tokens
+            batch, batch_tokens = [], 0
+        batch.append(document)
+        batch_tokens += tokens
+    if batch:
+        yield batch, batch_tokens
+
+
+def _to_points(batch, vectors):
+    return [
+        models.PointStruct(id=document.get("id") or str(uuid.uuid4()), vector=vector, payload=document["payload"])
+        for document, vector in zip(batch, vectors)
+    ]
+
+
+def ingest(
+    documents,
+    embed,
+    qdrant,
+    collection_name,
+    max_batch_tokens=MAX_BATCH_TOKENS,
+    max_batch_items=MAX_BATCH_ITEMS,
+    concurrency=CONCURRENCY,
+    upsert_batch_size=UPSERT_BATCH_SIZE,
+    retry_on=RETRYABLE_ERRORS,
+    on_upsert=None,
+):
+    """
+    Embed documents and upsert them into a Qdrant collection.
+
+    embed is any callable mapping a list of texts to a list of vectors, so a stub can stand in
+    for the OpenAI client. At most `concurrency` embedding requests are in flight at once.
+    on_upsert, if given, is called with the point IDs of each batch once Qdrant acknowledges it.
+    """
+    stats = IngestStats()
+
+    def on_retry(error, delay):
+        stats.retries += 1
+        print(f"Embedding request failed ({type(error).__name__}), retrying in {delay:.1f}s")
+
+    def embed_batch(batch):
+        texts = [document["text"] for document in batch]
+        return batch, retry_with_backoff(lambda: embed(texts), retry_on, on_retry=on_retry)
+
+    pending_points = []
+
+    def flush(final=False):
+        while pending_points and (final or len(pending_points) >= upsert_batch_size):
+            chunk = pending_points[:upsert_batch_size]
+            del pending_points[:upsert_batch_size]
+            # Only the last upsert waits, so Qdrant indexing overlaps with embedding
+            qdrant.upsert(collection_name=collection_name, points=chunk, wait=final and not pending_points)
+            stats.upserts += 1
+            if on_upsert is not None:
+                on_upsert([point.id for point in chunk])
+
+    def collect(done):
+        for future in done:
+            batch, vectors = future.result()
+            pending_points.extend(_to_points(batch, vectors))
+            stats.docs += len(batch)
+        flush()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight = set()
+        for batch, batch_tokens in batch_by_tokens(documents, max_batch_tokens, max_batch_items):
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight.add(executor.submit(embed_batch, batch))
+            stats.batches += 1
+            stats.tokens += batch_tokens
+        collect(wait(in_flight).done)
+    flush(final=True)
+
+    return stats.finish()
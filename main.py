@@ -1,8 +1,23 @@
 from anthropic import Anthropic, HUMAN_PROMPT, AI_PROMPT
-from tools import load_all_emails, load_participant_descriptions, filter_emails_by_person
+from tools import filter_emails_by_person, get_communication_graph, load_all_emails, load_participant_descriptions
+from email_index import ParticipantIndex
+from comm_graph import format_validation
+from email_dedup import collapse_emails, format_report
+from triage import KEEP_FRACTION, triage_emails
+from prompt_builder import build_request, format_cache_usage, format_emails
+from prompt_format import restore_aliases
+from map_reduce import BATCH_TOKEN_BUDGET, AnthropicExtractor, run_map_reduce
+from utils import count_tokens
+from agent import default_registry, format_steps, run_agent
+from retrieval import retrieve_relevant_emails
+from streaming import IncrementalResultsParser, InvestigationStream, format_finding
+from semantic_cache import SemanticCache, cache_scope
+from tracing import TracedClient, configure as configure_tracing, span
+from embedding_cache import get_embedder
+from openai import OpenAI
 from dotenv import load_dotenv
 import streamlit as st
-import json
+import argparse
 from datetime import datetime
 import time
 
@@ -10,83 +25,64 @@ MODEL = "claude-4-sonnet-20250514"  # Default model
 
 load_dotenv()
 
-client = Anthropic()
+client = TracedClient(Anthropic())
+
+
+TOOLS = default_registry()
+
+# Stop reasons of a reply the model finished; anything else (max_tokens, tool_use) is cut short
+COMPLETE_STOP_REASONS = ("end_turn", "stop_sequence")
 
 
 def handle_model_response(response):
-    # Check if the response contains tool use
-    if hasattr(response, 'content'):
-        for content_block in response.content:
-            if content_block.type == "tool_use":
-                function_call = content_block.name
-                arguments = content_block.input
-                if function_call == "bribery_playbook":
-                    db_results = bribery_playbook(**arguments)
-
-                    # Continue the conversation with the tool result
-                    follow_up_response = client.messages.create(
-                        model=MODEL,
-                        max_tokens=4000,
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": "Please analyze the bribery-related information I'm about to provide.",
-                            },
-                            {"role": "assistant", "content": response.content},
-                            {
-                                "role": "user",
-                                "content": [
-                                    {
-                                        "type": "tool_result",
-                                        "tool_use_id": content_block.id,
-                                        "content": json.dumps(db_results),
-                                    }
-                                ],
-                            },
-                        ],
-                        tools=[
-                            {
-                                "name": "bribery_playbook",
-                                "description": (
-                                    "Query the database for bribery related information on policy, transactions, and communications between two individuals of interest."
-                                ),
-                                "input_schema": {
-                                    "type": "object",
-                                    "properties": {
-                                        "user1": {"type": "string", "description": "The first user to query."},
-                                        "user2": {"type": "string", "description": "The second user to query."},
-                                        "collection_name": {
-                                            "type": "string",
-                                            "description": "The name of the collection to query.",
-                                        },
-                                    },
-                                    "required": ["user1", "user2", "collection_name"],
-                                },
-                            }
-                        ],
-                    )
-                    return follow_up_response
-
-            elif content_block.type == "text":
-                print("Model Response: ", content_block.text)
-                return content_block.text
-
-    # If no tool use, return the text content
-    if hasattr(response, 'content') and response.content:
-        for content_block in response.content:
-            if content_block.type == "text":
-                return content_block.text
-
-    return response
-
-
-def main(input_query, context=None):
-    response = client.messages.create(
-        model=MODEL,
-        max_tokens=4000,
-        system="You are an expert investigator specializing in financial misconduct such as bribery, money laundering and corruption. Your task is to analyze communications for signs of illicit activities and extract necessary information such as secondary people of interest, entities, and events that are necessary to build a case.",
-        messages=[{"role": "user", "content": input_query}], 
-    )
+    """
+    Return the text of a model response, or a notice saying why there is none.
+    """
+    content = getattr(response, 'content', None) or []
+    texts = [content_block.text for content_block in content if content_block.type == "text"]
+    if texts:
+        return "\n".join(texts)
+    return f"[No answer: the model stopped ({response.stop_reason}) before writing one]"
+
+
+def main(input_query, context=None, poi=None, top_k=None, embed=None, response_cache=None, use_cache=True):
+    """
+    Ask the model input_query about the emails in context.
+
+    The system prompt, reference documents, schema and emails form a cached prefix, so repeat
+    questions about the same person of interest reuse it. With top_k, only the top_k emails
+    from hybrid BM25 + vector retrieval are sent instead of the whole mailbox.
+
+    With a response_cache (semantic_cache.SemanticCache), an earlier answer to the same or a
+    near-identical question about the same emails is returned without calling the model.
+    Pass use_cache=False to bypass it, e.g. for audit runs.
+    """
+    if response_cache is not None and use_cache:
+        scope = cache_scope(MODEL, context, poi, top_k=top_k)
+        cached = response_cache.get(input_query, scope)
+        if cached is not None:
+            print(f"Response cache hit: {response_cache.stats()}")
+            return cached
+        started = time.perf_counter()
+        reply, complete = investigate(input_query, context=context, poi=poi, top_k=top_k, embed=embed)
+        if complete:
+            # A truncated reply would be served for every similar question, so only whole answers are kept
+            response_cache.put(input_query, scope, reply, latency_s=time.perf_counter() - started)
+        return reply
+    return investigate(input_query, context=context, poi=poi, top_k=top_k, embed=embed)[0]
+
+
+def investigate(input_query, context=None, poi=None, top_k=None, embed=None):
+    """
+    Run the tool-using agent on input_query; returns the reply and whether the model finished it.
+    """
+    if top_k is not None and context is not None:
+        context = retrieve_relevant_emails(context, input_query, k=top_k, embed=embed)
+    request = build_request(input_query, emails=context, poi=poi)
+    # Tool calls are executed and fed back until the model ends its turn
+    response, steps = run_agent(client, MODEL, request["messages"], TOOLS, system=request["system"], max_tokens=4000)
+    print(format_steps(steps))
+    print(format_cache_usage(response.usage))
     # TODO: Dial down temperature to 0.2-0.3 for more factual responses
     # TODO: Can make system prompt more instructive. Can add delimiters - only the text between "start, end".
     # Can force it ot rank things - oneshot examples. Based on how likely you think it is to be connected. For example: ex.
@@ -105,20 +101,49 @@ def main(input_query, context=None):
     # TODO: In the financial industry, the definition of these things (bribery, money laundering, corruption), and give these definition to the model.
 
 
-    next_response = handle_model_response(response)
+    reply = restore_aliases(handle_model_response(response), context)
+    return reply, response.stop_reason in COMPLETE_STOP_REASONS
 
-    # Handle different response types
-    if isinstance(next_response, str):
-        return next_response
-    elif hasattr(next_response, 'content'):
-        for content_block in next_response.content:
-            if content_block.type == "text":
-                return content_block.text
 
-    return str(next_response)
+def stream_main(input_query, context=None, poi=None):
+    """
+    Ask for InvestigationResults as a stream, printing each finding as soon as it is complete.
+
+    Returns the results as JSON; if the response is cut short, the findings completed so far.
+    """
+    stream = InvestigationStream(client, MODEL, input_query, emails=context, poi=poi)
+    for section, item in stream:
+        print(format_finding(section, item), flush=True)
+    if stream.first_item_s is not None:
+        print(f"First finding after {stream.first_item_s:.2f}s of {stream.elapsed_s:.2f}s")
+    if stream.truncated:
+        print(f"Response was cut short (stop reason {stream.stop_reason}); keeping the findings completed so far")
+    return stream.results.model_dump_json(indent=2)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stream", action="store_true", help="Stream findings as they are produced")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model (e.g. for audit runs)")
+    parser.add_argument("--trace", metavar="PATH", help="Append tracing spans to this JSONL file")
+    parser.add_argument("--dedup", action="store_true", help="Strip quoted history and collapse near-duplicate emails")
+    parser.add_argument(
+        "--triage",
+        type=float,
+        nargs="?",
+        const=KEEP_FRACTION,
+        metavar="FRACTION",
+        help="Only send this fraction of emails: the top scorers and their thread context",
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        metavar="K",
+        help="Only send the K emails most relevant to the question (hybrid BM25 + vector retrieval)",
+    )
+    args = parser.parse_args()
+    if args.trace:
+        configure_tracing(args.trace)
 
     user_prompt = """ 
             You are investigating Jho Low's communications for suspicious financial activity.
@@ -128,119 +153,70 @@ if __name__ == "__main__":
             - Suspicious activities
             - Entities of note (such as companies, organizations, or other entities involved in the communications).
             
-            Return what you find as a JSON response with this structure: 
-            {
-                "secondary_poi": {
-                    "name": "John Doe",
-                    "email_address": "john.doe@example.com",
-                    "description": "Description of the person and relationship to Jho Low",
-                    "reasoning": "Description of why this person is of interest",
-                    "references": [{
-                        "email_id": "Unique identifier ID for the email where this person was mentioned. Under key 'id'.",
-                        "email_subject": "List of email subjects where this person was mentioned.",
-                        "quotes": "List of quotes from the email where this person was mentioned.",
-                        "description": "Couple sentence description of why this email is relevant to the case.",
-                        },
-                    ],
-                },
-                "key_events": {
-                    "event": "Description of the event",
-                    "date": "Date of the event",
-                    "location": "Location of the event",
-                    "references": [{
-                        "email_id": "Unique identifier ID for the email where this event was mentioned. Under key 'id'.",
-                        "email_subject": "List of email subjects where this event was mentioned.",
-                        "quotes": "List of quotes from the email where this event was mentioned.",
-                        "description": "Couple sentence description of why this email is relevant to the case.",
-                        },
-                    ],
-                },
-                "sus_activities": {
-                    "short_title": "Short title of the activity",
-                    "description": "Description of the activity",
-                    "date": "Date of the activity",
-                    "references": [{
-                        "email_id": "Unique identifier ID for the email where this activity was mentioned. Under key 'id'.",
-                        "email_subject": "List of email subjects where this activity was mentioned.",
-                        "quotes": "List of quotes from the email where this activity was mentioned.",
-                        "description": "Couple sentence description of why this email is relevant to the case.",
-                        },
-                    ],
-                },
-                "entities_of_note": [
-                    {
-                        "name": "Company Name",
-                        "type": "Type of entity (e.g., company, organization)",
-                        "description": "Description of the entity and its relevance to the case",
-                        "references": [{
-                            "email_id": "Unique identifier ID for the email where this entity was mentioned. Under key 'id'.",
-                            "email_subject": "List of email subjects where this entity was mentioned.",
-                            "quotes": "List of quotes from the email where this entity was mentioned.",
-                            "description": "Couple sentence description of why this email is relevant to the case.",
-                            },
-                        ],
-                    }
-                ]
-            }
-
             After your analysis, please answer these verification questions:
             1. How many emails did I provide for analysis? List their email ID numbers.
             3. What specific time was mentioned in the 'Request for Transfer from GS' email?
             4. If I ask about information not in these emails, what should your response be?
             """
-    emails = load_all_emails()
-    participant_descriptions = load_participant_descriptions()
-
-    jlow_email_address = [
-        entry['email_address'] for entry in participant_descriptions if entry['participant'] == "Jho Low"
-    ][0]
-    for i, email in enumerate(emails):
-        email['email_id'] = f'EMAIL_{i+2}'
-    emails = filter_emails_by_person(emails, jlow_email_address)
-    # TODO: Play around with batch size, start at one at a time, etc
-
-    # Add unique IDs to emails
-    import ipdb; ipdb.set_trace()
-    combined_prompt = f"""
-    Prompt: {user_prompt}\n
-    Context: {emails}
-    """
-    start_time = time.time()
-    reply = main(combined_prompt)
+    with span("investigation", poi="Jho Low"):
+        emails = load_all_emails(as_store=True)  # rows carry their stable email_id
+        participant_descriptions = load_participant_descriptions()
+
+        jlow_email_address = [
+            entry['email_address'] for entry in participant_descriptions if entry['participant'] == "Jho Low"
+        ][0]
+        index = ParticipantIndex.load_or_build(participant_descriptions=participant_descriptions)
+        emails = filter_emails_by_person(emails, jlow_email_address, index)
+        if args.dedup:
+            emails, report = collapse_emails(emails)
+            print(format_report(report))
+        if args.triage:
+            emails = triage_emails(emails, keep=args.triage, graph=get_communication_graph())
+        if args.top_k:
+            # Retrieval runs here rather than in main so the streaming and map-reduce paths use it too
+            emails = retrieve_relevant_emails(emails, user_prompt, k=args.top_k, embed=get_embedder(OpenAI()))
+
+        start_time = time.time()
+        if count_tokens(format_emails(emails)) > BATCH_TOKEN_BUDGET:
+            # Mailbox too large for one request: extract from token-budgeted batches concurrently and merge
+            extractor = AnthropicExtractor(client, MODEL, user_prompt, poi="Jho Low")
+            reply = run_map_reduce(emails, extractor).model_dump_json(indent=2)
+        elif args.stream:
+            reply = stream_main(user_prompt, context=emails, poi="Jho Low")
+        else:
+            # The cache embeds queries with OpenAI, so it is only built (and the key only needed) when used
+            response_cache = None if args.no_cache else SemanticCache(embed=get_embedder(OpenAI()))
+            reply = main(user_prompt, context=emails, poi="Jho Low", response_cache=response_cache)
+            if response_cache is not None:
+                print(f"Response cache: {response_cache.stats()}")
     end_time = time.time()
     print(f"LLM processing time: {end_time - start_time:.2f} seconds")
+    if args.trace:
+        print(f"Trace written to {args.trace}; summarize it with: python tracing.py {args.trace}")
 
     print("Final Response: ", reply)
 
-    # Save the response as a JSON file
-    try:
-        # Extract JSON from markdown code blocks if present
-        json_content = reply
-        if "```json" in reply:
-            # Find JSON content
-            start_marker = "```json"
-            end_marker = "```"
-            start_index = reply.find(start_marker) + len(start_marker)
-            end_index = reply.find(end_marker, start_index)
-            if end_index != -1:
-                json_content = reply[start_index:end_index].strip()
-        elif "```" in reply:
-            # Handle generic code blocks
-            start_index = reply.find("```") + 3
-            end_index = reply.find("```", start_index)
-            if end_index != -1:
-                json_content = reply[start_index:end_index].strip()
-
-        # Parse and save
-        reply_json = json.loads(json_content)
-        with open(f"investigation_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json", "w") as f:
-            json.dump(reply_json, f, indent=2)
-        print(f"Results saved to investigation_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-    except json.JSONDecodeError as e:
-        print(f"JSON parsing error: {e}")
-        # If the reply isn't valid JSON, save it as a text file instead
-        with open(f"investigation_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt", "w") as f:
+    # Save the response as a JSON file, recovering complete findings from a fenced or truncated reply
+    parser = IncrementalResultsParser()
+    parser.feed(reply)
+    results = parser.results()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if any(results.model_dump().values()):
+        with open(f"investigation_results_{timestamp}.json", "w") as f:
+            f.write(results.model_dump_json(indent=2))
+        print(f"Results saved to investigation_results_{timestamp}.json")
+    if parser.errors or not any(results.model_dump().values()):
+        # Findings that failed validation are not in the JSON, so keep the raw reply as well
+        with open(f"investigation_results_{timestamp}.txt", "w") as f:
             f.write(reply)
-        print(
-            f"Results saved to investigation_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt (not valid JSON)"
-        )
+        for error in parser.errors:
+            print(f"Finding failed validation: {error}")
+        failed = len(parser.errors)
+        print(f"Raw reply saved to investigation_results_{timestamp}.txt ({failed} findings failed validation)")
+    if results.secondary_poi:
+        # Check the named people against who Jho Low actually corresponds with, in the agent tools' graph.
+        # Building it needs Qdrant for the transactions, so a failure here only skips the check.
+        try:
+            print(format_validation(get_communication_graph().validate_secondary_poi(results, "Jho Low")))
+        except Exception as e:
+            print(f"Skipped validating secondary people of interest: {type(e).__name__}: {e}")
@@ -1,222 +1,304 @@
 from dotenv import load_dotenv
-from langgraph.graph import StateGraph
-from langgraph.graph.message import add_messages
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Send
 from langchain.chat_models import init_chat_model
-from langchain.agents import create_tool_calling_agent, StructuredChatAgent
-from pydantic import BaseModel, Field
-from tools import load_all_emails, load_participant_descriptions, filter_emails_by_person
+from schemas import InvestigationResults
+from tools import load_all_emails, load_participant_descriptions, filter_emails_by_person, get_communication_graph
+from email_index import ParticipantIndex
+from map_reduce import BATCH_TOKEN_BUDGET, CONCURRENCY, MAX_OUTPUT_TOKENS, batch_emails, merge_results
+from prompt_builder import format_emails
+from prompt_format import restore_aliases
+from email_dedup import collapse_emails, format_report
+from embedding_cache import get_embedder
+from retrieval import retrieve_relevant_emails
+from triage import KEEP_FRACTION, triage_emails
+from tracing import span
+from result_store import MAX_AGE_DAYS, ResultStore, case_thread_id, result_key
+from openai import OpenAI
+from datetime import datetime, timedelta, timezone
 from typing import Annotated, TypedDict, List, Optional
-from langchain_core.tools import tool
-import json
-
-# from langchain.agents.output_parsers import ToolsAgentOutputParser
-from langchain.prompts import ChatPromptTemplate
+import argparse
+import operator
+import sqlite3
+import time
 
 load_dotenv()
 # MODEL = "claude-4-sonnet-20250514"  # Default model
 MODEL = "bedrock_converse:us.anthropic.claude-sonnet-4-20250514-v1:0"
 
-config = {"configurable": {"thread_id": "1"}}
-
-
-class Reference(BaseModel):
-    """Reference to an email with context"""
-
-    email_id: str = Field(description="Unique identifier for the email")
-    email_subject: str = Field(description="Subject of the email")
-    quotes: str = Field(description="Relevant quotes from the email")
-    description: str = Field(description="Description of why this email is relevant to the case")
-
-
-class Entity(BaseModel):
-    name: str
-    type: str
-    description: str
-    references: List[Reference]
-
+CHECKPOINT_PATH = "investigation_checkpoints.sqlite"
 
-class SecondaryPOI(BaseModel):
-    name: str
-    email_address: str
-    description: str
-    reasoning: str
-    references: List[Reference]
+# Extraction nodes for different batches run in parallel, at most max_concurrency at a time.
+# Each case gets its own thread_id (see result_store.case_thread_id).
+config = {"max_concurrency": CONCURRENCY}
 
+# The checkpoint and result databases are opened on first use, so importing this module creates no files
+_checkpointer = None
+_graph = None
+_result_store = None
+_pruned = False
 
-class KeyEvent(BaseModel):
-    event: str
-    date: str
-    location: str
-    references: List[Reference]
-
-
-class SuspiciousActivity(BaseModel):
-    short_title: str
-    description: str
-    date: str
-    references: List[Reference]
+# Initialize your LLM
+llm = init_chat_model(MODEL, temperature=0.2, max_tokens=MAX_OUTPUT_TOKENS)  # 1000 truncated larger results
+# Add schema for structured output
+structured_llm = llm.with_structured_output(InvestigationResults, include_raw=True)
 
 
-class InvestigationResults(BaseModel):
-    """Results of the investigation"""
+def merge_investigation_results(left: Optional[InvestigationResults], right: Optional[InvestigationResults]):
+    """Reducer: fold a batch's results into the results so far, de-duplicating findings"""
+    if left is None:
+        return right
+    if right is None:
+        return left
+    return merge_results([left, right])
 
-    secondary_poi: List[SecondaryPOI] = Field(default=[], description="List of secondary people of interest")
-    key_events: List[KeyEvent] = Field(default=[], description="List of key events")
-    sus_activities: List[SuspiciousActivity] = Field(default=[], description="List of suspicious activities")
-    entities_of_note: List[Entity] = Field(default=[], description="List of entities of note")
 
+# Define the state
+class InvestigationState(TypedDict):
+    question: str
+    context: str
+    poi: Optional[str]
+    emails: list
+    results: Annotated[Optional[InvestigationResults], merge_investigation_results]
+    timings: Annotated[list, operator.add]
 
-# # Wrap schema in a langchain tool
-# @tool
-# def produce_investigation_results(text: str) -> InvestigationResults:
-#     """Formats the investigation results."""
-#     pass  # dummy tool
 
+class BatchState(TypedDict):
+    """State sent to one extraction node"""
 
-# Define the state
-class ChatState(TypedDict):
-    messages: Annotated[list, add_messages]
+    question: str
     context: str
-    email_data: dict
-
+    poi: Optional[str]
+    batch: list
+    batch_index: int
+
+
+def timed_node(node):
+    """Record the wall-clock time of every run of a node in the timings channel"""
+
+    def run(state):
+        started = time.perf_counter()
+        with span(f"node.{node.__name__}", batch=state.get("batch_index"), emails=len(state.get("batch", ()))):
+            update = node(state)
+        timing = {"node": node.__name__, "batch": state.get("batch_index"), "seconds": time.perf_counter() - started}
+        return {**update, "timings": [timing]}
+
+    run.__name__ = node.__name__
+    return run
+
+
+def fan_out(state: InvestigationState):
+    """Send each token-budgeted batch of emails to its own extraction node"""
+    batches = batch_emails(state["emails"], BATCH_TOKEN_BUDGET)
+    return [
+        Send(
+            "extract",
+            {
+                "question": state["question"],
+                "context": state.get("context", ""),
+                "poi": state.get("poi"),
+                "batch": batch,
+                "batch_index": i,
+            },
+        )
+        for i, batch in enumerate(batches)
+    ]
+
+
+def batch_messages(state: BatchState):
+    """Build the chat messages for one batch"""
+    messages = []
+    if state.get("context"):
+        messages.append({"role": "system", "content": state["context"]})
+    poi = f"PERSON OF INTEREST: {state['poi']}\n\n" if state.get("poi") else ""
+    content = f"{poi}EMAIL DATA: {format_emails(state['batch'])}\n\nUSER QUERY: {state['question']}"
+    messages.append({"role": "user", "content": content})
+    return messages
+
+
+@timed_node
+def extract(state: BatchState):
+    """Extract InvestigationResults from one batch of emails"""
+    with span("llm.invoke", model=MODEL) as current:
+        response = structured_llm.invoke(batch_messages(state))
+        usage = getattr(response["raw"], "usage_metadata", None) or {}
+        details = usage.get("input_token_details") or {}
+        current.add(
+            input_tokens=usage.get("input_tokens"),
+            output_tokens=usage.get("output_tokens"),
+            cache_read_input_tokens=details.get("cache_read"),
+            cache_creation_input_tokens=details.get("cache_creation"),
+        )
+    return {"results": restore_aliases(response["parsed"] or InvestigationResults(), state["batch"])}
 
-# tools=[produce_investigation_results]
 
-# Define system prompt
-# prompt = StructuredChatAgent.create_prompt(
-#     # tools=tools,
-#     system_message_template="You are a helpful assistant that uses tools to extract structured data from emails."
-# )
-# prompt = ChatPromptTemplate.from_messages([
-#     ("system", "You are a helpful assistant that can extract structured information using tools."),
-#     ("human", "{input}"),
-#     ("placeholder", "{agent_scratchpad}")  # required for tool-using agents
-# ])
-# Initialize your LLM
-llm = init_chat_model(MODEL, temperature=0.2, max_tokens=1000)
-# Add schema for structured output
-structured_llm = llm.with_structured_output(InvestigationResults)
-
-# Create agent with tool support
-# agent = create_tool_calling_agent(llm=llm, prompt=prompt, tools=tools)
-# runnable = agent | ToolsAgentOutputParser()
-
-
-def add_context_node(state: ChatState):
-    """Add context before the chat model processes"""
-    context = state.get("context", "")
-    email_data = state.get("email_data", {})
-
-    if not context and not email_data:
-        return {"messages": state["messages"]}
-
-    # Format context message
-    context_parts = []
-    if context:
-        context_parts.append(f"CONTEXT: {context}")
-
-    if email_data:
-        context_parts.append(f"EMAIL DATA: {format_email_data(email_data)}")
-
-    context_message = "\n\n".join(context_parts) + "\n\nPlease analyze the following query in light of this context."
-
-    # Add context to the first user message
-    current_messages = state["messages"]
-    if current_messages:
-        last_message = current_messages[-1]
-        # Check if it's a user message (handle both dict and LangChain message objects)
-        if hasattr(last_message, 'type') and last_message.type == 'human':
-            # It's a LangChain HumanMessage object
-            original_content = last_message.content
-            enhanced_content = f"{context_message}\n\nUSER QUERY: {original_content}"
-            # Create a new message dict
-            current_messages[-1] = {"role": "user", "content": enhanced_content}
-        elif isinstance(last_message, dict) and last_message.get("role") == "user":
-            # It's a dictionary message
-            original_content = last_message["content"]
-            enhanced_content = f"{context_message}\n\nUSER QUERY: {original_content}"
-            current_messages[-1] = {"role": "user", "content": enhanced_content}
-
-    return {"messages": current_messages}
-
-
-def chat_node(state: ChatState):
-    """Chat node that processes messages"""
-    response = structured_llm.invoke(state["messages"])
-    # return {"messages": [response]}
-    # Convert to dict first, then to JSON
-    response_dict = {
-        "secondary_poi": getattr(response, 'secondary_poi', []),
-        "key_events": getattr(response, 'key_events', []),
-        "sus_activities": getattr(response, 'sus_activities', []),
-        "entities_of_note": getattr(response, 'entities_of_note', [])
+# Build the graph
+workflow = StateGraph(InvestigationState)
+workflow.add_node("extract", extract)
+workflow.add_conditional_edges(START, fan_out, ["extract"])
+workflow.add_edge("extract", END)
+
+
+def get_checkpointer():
+    """Completed nodes are checkpointed, so an interrupted investigation resumes where it stopped"""
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = SqliteSaver(
+            sqlite3.connect(CHECKPOINT_PATH, check_same_thread=False),
+            serde=JsonPlusSerializer(allowed_msgpack_modules=[("schemas", "InvestigationResults")]),
+        )
+    return _checkpointer
+
+
+def get_graph():
+    """The workflow compiled with the checkpointer"""
+    global _graph
+    if _graph is None:
+        _graph = workflow.compile(checkpointer=get_checkpointer())
+    return _graph
+
+
+def get_result_store():
+    global _result_store
+    if _result_store is None:
+        _result_store = ResultStore()
+    return _result_store
+
+
+def chunk_text(message_chunk) -> str:
+    """Text of a streamed message chunk, including partial structured-output (tool call) arguments"""
+    text = message_chunk.text if isinstance(message_chunk.text, str) else message_chunk.text()
+    tool_args = "".join(chunk.get("args") or "" for chunk in getattr(message_chunk, "tool_call_chunks", []))
+    return text + tool_args
+
+
+def case_config(thread_id: str) -> dict:
+    return {**config, "configurable": {"thread_id": thread_id}}
+
+
+def stream_investigation(question: str, emails: list, context: str = "", poi: str = None, thread_id: str = None):
+    """
+    Run the graph and yield (kind, node, payload) events as they happen.
+
+    kind is "token" for each streamed model token (payload is the text) and "update" when a
+    node finishes (payload is the node's state update, including its "timings" entry). If the
+    thread has unfinished work from an interrupted run, only the nodes that had not completed
+    are run again.
+    """
+    graph = get_graph()
+    thread_config = case_config(thread_id)
+    resume = bool(graph.get_state(thread_config).next)
+    # Rows enter the checkpointed state as plain dicts: EmailStore row views are not serializable
+    initial_state = None if resume else {
+        "question": question, "context": context, "poi": poi, "emails": [dict(email) for email in emails], "timings": []
     }
-    response_json = json.dumps(response_dict, indent=2, default=str)
-    # except Exception as e:
-    #     # Fallback to string representation
-    #     response_json = f"Error serializing response: {str(e)}\nResponse type: {type(response)}\nResponse: {str(response)}"
-    
-    # Return as a proper message format
-    return {"messages": [{"role": "assistant", "content": response_json}]}
-
-
-def format_email_data(email_data: dict) -> str:
-    """Helper function to format email data"""
-    if not email_data:
-        return "No email data provided"
-
-    formatted = []
-    for key, value in email_data.items():
-        if isinstance(value, list):
-            formatted.append(f"{key}: {', '.join(map(str, value))}")
+    for mode, chunk in graph.stream(initial_state, thread_config, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            message_chunk, metadata = chunk
+            text = chunk_text(message_chunk)
+            if text:
+                yield "token", metadata.get("langgraph_node"), text
         else:
-            formatted.append(f"{key}: {value}")
-
-    return "\n".join(formatted)
+            for node, update in chunk.items():
+                yield "update", node, update
 
 
-# Build the graph
-workflow = StateGraph(ChatState)
-workflow.add_node("add_context", add_context_node)
-workflow.add_node("chat", chat_node)
-workflow.add_edge("add_context", "chat")
-workflow.set_entry_point("add_context")
-
-# Compile the graph
-graph = workflow.compile()
+def prune_checkpoints(max_age_days: int = MAX_AGE_DAYS):
+    """Delete checkpoint threads whose latest checkpoint is older than the retention period"""
+    checkpointer = get_checkpointer()
+    latest = {}
+    for checkpoint in checkpointer.list(None):
+        thread_id = checkpoint.config["configurable"]["thread_id"]
+        ts = datetime.fromisoformat(checkpoint.checkpoint["ts"])
+        latest[thread_id] = max(ts, latest.get(thread_id, ts))
+    cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+    for thread_id, ts in latest.items():
+        if ts < cutoff:
+            checkpointer.delete_thread(thread_id)
 
 
 # Your updated streaming function
-def stream_graph_updates(user_input: str, context: str = "", email_data: dict = None):
-    """Stream updates with context support"""
-
-    # Prepare the initial state with context
-    initial_state = {
-        "messages": [{"role": "user", "content": user_input}],
-        "context": context,
-        "email_data": email_data or {},
-    }
-
-    # Stream the graph execution
-    for event in graph.stream(initial_state, config, stream_mode='values'):
-        # Only print if the last message is from the assistant
-        last_message = event["messages"][-1]
-        if hasattr(last_message, 'type') and last_message.type == 'ai':
-            print("LLM: " + last_message.content)
+def stream_graph_updates(
+    user_input: str, context: str = "", email_data: list = None, poi: str = None, show_tokens=False
+):
+    """
+    Stream updates with context support, returning the merged results and per-node timings.
+
+    An identical earlier investigation (same model, prompt and emails) is returned from the
+    result store without running the graph.
+    """
+    with span("investigation", poi=poi, emails=len(email_data or ())):
+        emails = [dict(email) for email in email_data or ()]
+        return _stream_graph_updates(user_input, context, emails, poi, show_tokens)
+
+
+def _stream_graph_updates(user_input, context, email_data, poi, show_tokens):
+    global _pruned
+    key = result_key(MODEL, user_input, email_data, context, poi)
+    result_store = get_result_store()
+    stored = result_store.get(key)
+    if stored is not None:
+        print("Returning stored result for an identical investigation")
+        return stored, []
+
+    thread_id = case_thread_id(key, poi)
+    timings = []
+    for kind, node, payload in stream_investigation(user_input, email_data, context, poi, thread_id):
+        if kind == "token":
+            if show_tokens:
+                print(payload, end="", flush=True)
+            continue
+        for timing in payload.get("timings", []):
+            timings.append(timing)
+            print(f"\n{timing['node']} batch {timing['batch']} finished in {timing['seconds']:.2f}s")
+
+    # The checkpointed state also holds the results of nodes completed before an interruption
+    results = get_graph().get_state(case_config(thread_id)).values.get("results") or InvestigationResults()
+    result_store.put(key, results, MODEL, thread_id)
+    # The finished result is stored, so the thread's checkpoints are no longer needed
+    get_checkpointer().delete_thread(thread_id)
+    # Pruning reads every checkpoint, so it runs once per process rather than after every investigation
+    if not _pruned:
+        prune_checkpoints()
+        _pruned = True
+    return results, timings
 
 
 # Usage examples
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dedup", action="store_true", help="Strip quoted history and collapse near-duplicate emails")
+    parser.add_argument(
+        "--triage",
+        type=float,
+        nargs="?",
+        const=KEEP_FRACTION,
+        metavar="FRACTION",
+        help="Only extract from this fraction of emails: the top scorers and their thread context",
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        metavar="K",
+        help="Only extract from the K emails most relevant to the question (hybrid BM25 + vector retrieval)",
+    )
+    args = parser.parse_args()
 
-    emails = load_all_emails()
+    emails = load_all_emails(as_store=True)  # rows carry their stable email_id
     participant_descriptions = load_participant_descriptions()
 
     jlow_email_address = [
         entry['email_address'] for entry in participant_descriptions if entry['participant'] == "Jho Low"
     ][0]
-    for i, email in enumerate(emails):
-        email['email_id'] = f'EMAIL_{i+2}'
-    email_data = filter_emails_by_person(emails, jlow_email_address)
+    index = ParticipantIndex.load_or_build(participant_descriptions=participant_descriptions)
+    email_data = filter_emails_by_person(emails, jlow_email_address, index)
+    if args.dedup:
+        email_data, report = collapse_emails(email_data)
+        print(format_report(report))
+    if args.triage:
+        email_data = triage_emails(email_data, keep=args.triage, graph=get_communication_graph())
 
     user_prompt = """ 
             You are investigating Jho Low's communications for suspicious financial activity.
@@ -231,9 +313,14 @@ if __name__ == "__main__":
             
             Use the InvestigationResults schema format with proper references to email IDs, subjects, and quotes.
             """
+    if args.top_k:
+        email_data = retrieve_relevant_emails(email_data, user_prompt, k=args.top_k, embed=get_embedder(OpenAI()))
 
-    stream_graph_updates(
+    results, timings = stream_graph_updates(
         user_input=user_prompt,
         context="You are an expert investigator specializing in financial misconduct such as bribery, money laundering and corruption. Your task is to analyze communications for signs of illicit activities and extract necessary information such as secondary people of interest, entities, and events that are necessary to build a case.",
-        email_data=email_data[1],
+        email_data=email_data,
+        poi="Jho Low",
+        show_tokens=True,
     )
+    print("LLM: " + results.model_dump_json(indent=2))
@@ -0,0 +1,109 @@
+"""
+Content-addressed point IDs and a local manifest of what is already indexed in Qdrant.
+
+A document's point ID is derived from a hash of its normalized text and payload, so an
+unchanged document always maps to the same point. The manifest records every point ID whose
+upsert has been acknowledged, batch by batch, which lets a rerun skip unchanged documents,
+delete removed ones and pick up where a crashed run stopped.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+import unicodedata
+import uuid
+
+from ingest import ingest
+
+MANIFEST_PATH = "qdrant_manifest.sqlite"
+DELETE_BATCH_SIZE = 1000
+
+
+def normalize_text(text):
+    """
+    Normalize unicode and whitespace so cosmetic differences do not change a document's ID.
+    """
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def document_id(document):
+    """
+    Derive a stable point ID from a document's normalized text and payload.
+    """
+    payload = json.dumps(document["payload"], sort_keys=True, default=str)
+    digest = hashlib.sha256(f"{normalize_text(document['text'])}\0{payload}".encode()).digest()
+    return str(uuid.UUID(bytes=digest[:16]))
+
+
+class IndexManifest:
+    """
+    SQLite record of the point IDs committed to each collection.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS points ("
+            "collection TEXT NOT NULL, point_id TEXT NOT NULL, committed_at REAL NOT NULL, "
+            "PRIMARY KEY (collection, point_id))"
+        )
+        self.conn.commit()
+
+    def ids(self, collection_name):
+        rows = self.conn.execute("SELECT point_id FROM points WHERE collection = ?", (collection_name,))
+        return {row[0] for row in rows}
+
+    def add(self, collection_name, point_ids):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO points VALUES (?, ?, ?)",
+                [(collection_name, point_id, now) for point_id in point_ids],
+            )
+
+    def remove(self, collection_name, point_ids):
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM points WHERE collection = ? AND point_id = ?",
+                [(collection_name, point_id) for point_id in point_ids],
+            )
+
+    def clear(self, collection_name):
+        with self.conn:
+            self.conn.execute("DELETE FROM points WHERE collection = ?", (collection_name,))
+
+    def close(self):
+        self.conn.close()
+
+
+def sync(documents, embed, qdrant, collection_name, manifest, **ingest_kwargs):
+    """
+    Bring a collection in line with documents, embedding only what is new or changed.
+
+    Points for documents no longer present are deleted. Returns the ingest stats together with
+    the number of skipped and deleted points.
+    """
+    indexed = manifest.ids(collection_name)
+    current = {}
+    for document in documents:
+        point_id = document_id(document)
+        current[point_id] = {**document, "id": point_id}
+
+    removed = list(indexed - current.keys())
+    for start in range(0, len(removed), DELETE_BATCH_SIZE):
+        chunk = removed[start : start + DELETE_BATCH_SIZE]
+        qdrant.delete(collection_name=collection_name, points_selector=chunk)
+        manifest.remove(collection_name, chunk)
+
+    to_index = [document for point_id, document in current.items() if point_id not in indexed]
+    stats = ingest(
+        to_index,
+        embed,
+        qdrant,
+        collection_name,
+        on_upsert=lambda point_ids: manifest.add(collection_name, point_ids),
+        **ingest_kwargs,
+    )
+    stats.skipped = len(current) - len(to_index)
+    stats.deleted = len(removed)
+    return stats
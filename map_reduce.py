@@ -0,0 +1,169 @@
+"""
+Token-budgeted map-reduce analysis over large mailboxes.
+
+The filtered emails are split into batches that fit a token budget, InvestigationResults are
+extracted from each batch concurrently, and the partial results are merged with deterministic
+de-duplication. Wall-clock time scales with batches / concurrency rather than mailbox size.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import anthropic
+from pydantic import ValidationError
+
+from prompt_builder import build_request, format_emails
+from prompt_format import restore_aliases
+from schemas import InvestigationResults
+from tracing import in_current_context
+from utils import count_tokens, retry_with_backoff
+
+# Token counts come from tiktoken, which only approximates Claude's tokenizer, so leave headroom
+BATCH_TOKEN_BUDGET = 60_000
+CONCURRENCY = 4
+MAX_OUTPUT_TOKENS = 8000
+
+RESULTS_TOOL = {
+    "name": "record_investigation_results",
+    "description": "Record the secondary people of interest, key events, suspicious activities and entities found.",
+    "input_schema": InvestigationResults.model_json_schema(),
+}
+
+RETRYABLE_ERRORS = (anthropic.RateLimitError, anthropic.InternalServerError, anthropic.APIConnectionError)
+
+
+def batch_emails(emails, max_tokens=BATCH_TOKEN_BUDGET):
+    """
+    Split emails into consecutive batches whose serialized size fits max_tokens.
+
+    An email larger than the budget on its own gets a batch to itself. The serializer's
+    one-time header is counted once per batch rather than once per email.
+    """
+    header = count_tokens(format_emails([]))
+    batches, batch, batch_tokens = [], [], header
+    for email in emails:
+        tokens = count_tokens(format_emails([email])) - header
+        if batch and batch_tokens + tokens > max_tokens:
+            batches.append(batch)
+            batch, batch_tokens = [], header
+        batch.append(email)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class AnthropicExtractor:
+    """
+    Extracts InvestigationResults from one batch of emails with a forced tool call.
+
+    Every batch shares the cached system prefix built by prompt_builder.
+    """
+
+    def __init__(self, client, model, question, poi=None, max_tokens=MAX_OUTPUT_TOKENS):
+        self.client = client
+        self.model = model
+        self.question = question
+        self.poi = poi
+        self.max_tokens = max_tokens
+
+    def __call__(self, batch):
+        response = retry_with_backoff(
+            lambda: self.client.messages.create(
+                model=self.model,
+                max_tokens=self.max_tokens,
+                tools=[RESULTS_TOOL],
+                tool_choice={"type": "tool", "name": RESULTS_TOOL["name"]},
+                **build_request(self.question, emails=batch, poi=self.poi),
+            ),
+            RETRYABLE_ERRORS,
+        )
+        for block in response.content:
+            if block.type == "tool_use":
+                try:
+                    results = InvestigationResults.model_validate(block.input)
+                except ValidationError:
+                    results = recover_results(block.input, response.stop_reason)
+                # Short IDs and aliases are numbered per batch, so they are mapped back before merging
+                return restore_aliases(results, batch)
+        return InvestigationResults()
+
+
+def recover_results(tool_input, stop_reason=None):
+    """
+    The findings of a tool input that failed validation as a whole (e.g. cut short by
+    max_tokens, or one malformed finding), so one bad batch does not discard the others.
+    """
+    # streaming imports this module, so its parser is imported on first use
+    from streaming import IncrementalResultsParser
+
+    parser = IncrementalResultsParser()
+    parser.feed(json.dumps(tool_input, default=str))
+    results = parser.results()
+    kept = sum(len(items) for items in parser.items.values())
+    print(f"Batch results failed validation (stop {stop_reason}): kept {kept} findings, dropped {len(parser.errors)}")
+    for error in parser.errors:
+        print(f"Finding failed validation: {error}")
+    return results
+
+
+def _key(*parts):
+    return tuple(" ".join(str(part or "").lower().split()) for part in parts)
+
+
+def _merge_references(target, references):
+    seen = {reference.email_id for reference in target}
+    for reference in references:
+        if reference.email_id not in seen:
+            seen.add(reference.email_id)
+            target.append(reference)
+
+
+def _merge_items(item_lists, key):
+    merged = {}
+    for items in item_lists:
+        for item in items:
+            k = key(item)
+            if k in merged:
+                _merge_references(merged[k].references, item.references)
+            else:
+                merged[k] = item.model_copy(deep=True)
+                merged[k].references = []
+                _merge_references(merged[k].references, item.references)
+    return list(merged.values())
+
+
+def merge_results(results):
+    """
+    Merge partial InvestigationResults, de-duplicating items and their references by email_id.
+
+    Items are matched on POI email address (or name), entity name and type, event and date, and
+    activity title and date. The first occurrence wins and later references are appended, so the
+    output depends only on the order of results, not on which batch finished first.
+    """
+    results = list(results)
+    return InvestigationResults(
+        secondary_poi=_merge_items(
+            [r.secondary_poi for r in results], lambda poi: _key(poi.email_address or poi.name)
+        ),
+        key_events=_merge_items([r.key_events for r in results], lambda event: _key(event.event, event.date)),
+        sus_activities=_merge_items(
+            [r.sus_activities for r in results], lambda activity: _key(activity.short_title, activity.date)
+        ),
+        entities_of_note=_merge_items(
+            [r.entities_of_note for r in results], lambda entity: _key(entity.name, entity.type)
+        ),
+    )
+
+
+def run_map_reduce(emails, extract, max_batch_tokens=BATCH_TOKEN_BUDGET, concurrency=CONCURRENCY):
+    """
+    Extract results from each batch of emails concurrently and merge them.
+
+    extract is any callable mapping a list of emails to InvestigationResults, such as an
+    AnthropicExtractor or a fake model.
+    """
+    batches = batch_emails(emails, max_batch_tokens)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # map keeps batch order, which keeps the merge deterministic
+        partial_results = list(executor.map(in_current_context(extract), batches))
+    return merge_results(partial_results)
@@ -1,96 +1,133 @@
 from qdrant_client import QdrantClient
 from openai import OpenAI
 from dotenv import load_dotenv
-from utils import add_text, generate_transaction, parse_email
+from embedding_cache import MODEL_DIMENSIONS, get_embedder
+from ingest import EMBEDDING_MODEL
+from manifest import IndexManifest, sync
+from qdrant_store import (
+    QUANTIZATION,
+    collection_dimension,
+    create_collection,
+    ensure_payload_indexes,
+    normalize_payload,
+    update_quantization,
+)
+from email_parser import email_bodies, parse_emails
+from transaction_store import TRANSACTIONS_PATH, TransactionStore
+from utils import generate_transaction, text_document, transaction_text
+import argparse
 import random
-import uuid
 import pandas as pd
 
 load_dotenv()
 
-client = OpenAI()
-qdrant = QdrantClient("http://localhost:6333")
-
 # Create collection if not exists
 collection_name = "documents_and_transactions"
-
-qdrant.delete_collection(collection_name=collection_name)
-
-if not qdrant.collection_exists(collection_name):
-    qdrant.create_collection(
-        collection_name=collection_name,
-        vectors_config={"size": 3072, "distance": "Cosine"},  # adjust to your embedding size
-    )
-
-
-# Add bribery policy doc to Qdrant
-add_text("bribery_policy_doc.txt", client, qdrant, collection_name, type="document")
-add_text("bribery_def_doc.txt", client, qdrant, collection_name, type="document")
-
-# Generate and add to Qdrant
-for _ in range(100):
-    transaction = generate_transaction()
-    text = f"{transaction['sender']} paid {transaction['receiver']} ${transaction['amount']} for {transaction['description']}"
-
-    embedding = client.embeddings.create(input=[text], model="text-embedding-3-large").data[0].embedding
-
-    qdrant.upsert(
-        collection_name=collection_name,
-        points=[
-            {
-                "id": str(uuid.uuid4()),
-                "vector": embedding,
-                "payload": {"type": "transaction", **transaction, "text": text},
-            }
-        ],
-    )
-
-# Add 5 suspicious transactions to Qdrant
-for _ in range(5):
-    transaction = generate_transaction(
-        senders=["Charlie"], receivers=["Maxwell"], label="suspicious", amount_range=(10000, 50000)
+TRANSACTION_SEED = 42  # keeps the synthetic transactions, and so their point IDs, stable across runs
+
+
+def transaction_document(transaction):
+    text = transaction_text(transaction)
+    return {"text": text, "payload": {"type": "transaction", **transaction, "text": text}}
+
+
+def build_documents():
+    """
+    Yield every document that belongs in the collection.
+    """
+    # Bribery policy docs
+    yield text_document("bribery_policy_doc.txt", type="document")
+    yield text_document("bribery_def_doc.txt", type="document")
+
+    # Generated transactions, from their own seeded generator so the global one is left alone
+    rng = random.Random(TRANSACTION_SEED)
+    for _ in range(100):
+        yield transaction_document(generate_transaction(rng=rng))
+
+    # 5 suspicious transactions
+    for _ in range(5):
+        yield transaction_document(
+            generate_transaction(
+                senders=["Charlie"], receivers=["Maxwell"], label="suspicious", amount_range=(10000, 50000), rng=rng
+            )
+        )
+
+    # Emails
+    all_emails = pd.read_csv("personal_financial_all_nohit_100.csv")
+    messages = all_emails["message"].tolist()
+    parsed = parse_emails(messages)  # Parse all the email content in one pass
+    bodies = email_bodies(messages, parsed)
+    for email, body, email_data in zip(messages, bodies, parsed.to_dict(orient="records")):
+        yield {
+            "text": email,
+            "payload": {
+                "type": "email",
+                "text": body,
+                "sender": email_data["sender"],
+                "receiver": email_data["receivers"][0] if email_data["receivers"] else None,
+                "receivers": email_data["receivers"] + email_data["cc"] + email_data["bcc"],
+                "subject": email_data["subject"],
+                "timestamp": email_data["timestamp"],
+            },
+        }
+
+    # Bribery emails
+    yield text_document("bribery_email_1.txt", type="email", sender="Maxwell", receiver="Charlie")
+    yield text_document("bribery_email_2.txt", type="email", sender="Charlie", receiver="Maxwell")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index documents, transactions and emails into Qdrant.")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the collection and re-embed everything")
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        default=MODEL_DIMENSIONS[EMBEDDING_MODEL],
+        help="Embedding size; text-embedding-3 models can be shortened, e.g. to 1024 or 256",
     )
-    text = f"{transaction['sender']} paid {transaction['receiver']} ${transaction['amount']} for {transaction['description']}"
-
-    embedding = client.embeddings.create(input=[text], model="text-embedding-3-large").data[0].embedding
-
-    qdrant.upsert(
-        collection_name=collection_name,
-        points=[
-            {
-                "id": str(uuid.uuid4()),
-                "vector": embedding,
-                "payload": {"type": "transaction", **transaction, "text": text},
-            }
-        ],
+    parser.add_argument(
+        "--quantization",
+        choices=sorted(filter(None, QUANTIZATION)),
+        help="Keep quantized vectors in RAM (an existing collection is updated to match)",
     )
-
-# Add emails to qdrant
-all_emails = pd.read_csv("personal_financial_all_nohit_100.csv")
-
-for row_idx, row in all_emails.iterrows():
-    email = row["message"]
-    email_data = parse_email(email)  # Parse the email content
-
-    embedding = client.embeddings.create(input=email, model="text-embedding-3-large").data[0].embedding
-    qdrant.upsert(
-        collection_name=collection_name,
-        points=[
-            {
-                "id": str(uuid.uuid4()),
-                "vector": embedding,
-                "payload": {
-                    "type": "email",
-                    "text": email_data["body"],
-                    "sender": email_data["sender"],
-                    "receiver": email_data["receiver"],
-                    "subject": email_data["subject"],
-                    "timestamp": email_data["timestamp"],
-                },
-            }
-        ],
-    )
-
-# Add bribery emails to Qdrant
-add_text("bribery_email_1.txt", client, qdrant, collection_name, type="email", kwargs={"sender": "Maxwell", "receiver": "Charlie"})
-add_text("bribery_email_2.txt", client, qdrant, collection_name, type="email", kwargs={"sender": "Charlie", "receiver": "Maxwell"})
+    parser.add_argument("--on-disk", action="store_true", help="Keep the original vectors on disk, for rescoring only")
+    args = parser.parse_args()
+
+    client = OpenAI()
+    qdrant = QdrantClient("http://localhost:6333")
+    manifest = IndexManifest()
+
+    if args.rebuild:
+        qdrant.delete_collection(collection_name=collection_name)
+
+    if not qdrant.collection_exists(collection_name):
+        create_collection(qdrant, collection_name, args.dimensions, quantization=args.quantization, on_disk=args.on_disk)
+        # A fresh collection holds nothing the manifest may remember
+        manifest.clear(collection_name)
+    elif collection_dimension(qdrant, collection_name) != args.dimensions:
+        parser.error(
+            f"{collection_name} holds {collection_dimension(qdrant, collection_name)}-dimensional vectors; "
+            "pass --rebuild to change --dimensions"
+        )
+    elif args.quantization or args.on_disk:
+        if update_quantization(qdrant, collection_name, args.quantization, on_disk=args.on_disk):
+            print(f"Updated {collection_name} to quantization={args.quantization}, on_disk={args.on_disk}")
+
+    embedder = get_embedder(client, dimensions=args.dimensions)
+    ensure_payload_indexes(qdrant, collection_name)
+
+    transactions = []
+
+    def normalized_documents():
+        for document in build_documents():
+            payload = normalize_payload(document["payload"])
+            if payload["type"] == "transaction":
+                transactions.append(payload)
+            yield {**document, "payload": payload}
+
+    stats = sync(normalized_documents(), embedder, qdrant, collection_name, manifest)
+    print(stats.report())
+    # A columnar copy of the transactions for structured queries (transaction_store.py)
+    TransactionStore.from_records(transactions).save(TRANSACTIONS_PATH)
+    print(f"Saved {len(transactions)} transactions to {TRANSACTIONS_PATH}")
+    print("Embedding cache:", embedder.cache.stats())
@@ -0,0 +1,135 @@
+"""
+Prompt assembly for investigation requests, ordered for Anthropic prompt caching.
+
+Content that never changes between requests comes first: the system prompt, the bribery
+definition and policy documents and the response schema, followed by the person of interest's
+email corpus. Cache breakpoints are placed after the fixed instructions and after the corpus,
+so repeated questions about the same person only pay full price for the question itself.
+"""
+import json
+import os
+from functools import lru_cache
+
+from prompt_format import get_serializer
+from tracing import enabled, span
+
+SYSTEM_PROMPT = "You are an expert investigator specializing in financial misconduct such as bribery, money laundering and corruption. Your task is to analyze communications for signs of illicit activities and extract necessary information such as secondary people of interest, entities, and events that are necessary to build a case."
+
+REFERENCE_DOCUMENTS = ("bribery_def_doc.txt", "bribery_policy_doc.txt")
+
+RESPONSE_SCHEMA = """
+Return what you find as a JSON response with this structure:
+{
+    "secondary_poi": [{
+        "name": "John Doe",
+        "email_address": "john.doe@example.com",
+        "description": "Description of the person and relationship to the person of interest",
+        "reasoning": "Description of why this person is of interest",
+        "references": [{
+            "email_id": "Unique identifier ID for the email where this person was mentioned. Under key 'email_id'.",
+            "email_subject": "Subject of the email.",
+            "quotes": "List of quotes from the email where this person was mentioned.",
+            "description": "Couple sentence description of why this email is relevant to the case."
+        }]
+    }],
+    "key_events": [{
+        "event": "Description of the event",
+        "date": "Date of the event",
+        "location": "Location of the event",
+        "references": [{"email_id": "...", "email_subject": "...", "quotes": "...", "description": "..."}]
+    }],
+    "sus_activities": [{
+        "short_title": "Short title of the activity",
+        "description": "Description of the activity",
+        "date": "Date of the activity",
+        "references": [{"email_id": "...", "email_subject": "...", "quotes": "...", "description": "..."}]
+    }],
+    "entities_of_note": [{
+        "name": "Company Name",
+        "type": "Type of entity (e.g., company, organization)",
+        "description": "Description of the entity and its relevance to the case",
+        "references": [{"email_id": "...", "email_subject": "...", "quotes": "...", "description": "..."}]
+    }]
+}
+"""
+
+CACHE_BREAKPOINT = {"type": "ephemeral"}
+
+
+@lru_cache(maxsize=None)
+def load_reference_documents(paths=REFERENCE_DOCUMENTS):
+    """
+    Read the reference documents that exist, as (name, text) pairs.
+    """
+    documents = []
+    for path in paths:
+        if os.path.exists(path):
+            with open(path) as f:
+                documents.append((path, f.read()))
+    return tuple(documents)
+
+
+def format_emails(emails, serializer=None):
+    """
+    Serialize emails deterministically, so the same corpus always produces the same cached prefix.
+
+    serializer is a prompt_format serializer or its name; by default the compact table, whose
+    short IDs and aliases prompt_format.restore_aliases maps back in the reply.
+    """
+    return get_serializer(serializer)(emails)
+
+
+def build_request(question, emails=None, poi=None, system=SYSTEM_PROMPT, documents=None, schema=RESPONSE_SCHEMA):
+    """
+    Build the system and messages arguments for client.messages.create.
+
+    The stable prefix (system prompt, documents, schema, then the email corpus) carries cache
+    breakpoints; the question goes last so changing it does not invalidate the cache.
+    """
+    with span("build_request") as current:
+        request = _build_request(question, emails, poi, system, documents, schema)
+        if enabled():
+            current.set(emails=len(emails or ()), request_bytes=len(json.dumps(request, ensure_ascii=False)))
+    return request
+
+
+def _build_request(question, emails, poi, system, documents, schema):
+    documents = load_reference_documents() if documents is None else documents
+    system_blocks = [{"type": "text", "text": system}]
+    for name, text in documents:
+        system_blocks.append({"type": "text", "text": f'<document name="{name}">\n{text}\n</document>'})
+    if schema:
+        system_blocks.append({"type": "text", "text": schema})
+    system_blocks[-1]["cache_control"] = CACHE_BREAKPOINT
+
+    content = []
+    if emails is not None:
+        owner = f' poi="{poi}"' if poi else ""
+        content.append(
+            {"type": "text", "text": f"<emails{owner}>\n{format_emails(emails)}\n</emails>", "cache_control": CACHE_BREAKPOINT}
+        )
+    content.append({"type": "text", "text": question})
+    return {"system": system_blocks, "messages": [{"role": "user", "content": content}]}
+
+
+def cache_usage(usage):
+    """
+    Pull the token counts, including prompt-cache reads and writes, out of a response's usage.
+    """
+    return {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+    }
+
+
+def format_cache_usage(usage):
+    counts = cache_usage(usage)
+    total_input = counts["input_tokens"] + counts["cache_creation_input_tokens"] + counts["cache_read_input_tokens"]
+    hit_rate = counts["cache_read_input_tokens"] / total_input if total_input else 0.0
+    return (
+        f"Input tokens: {total_input} ({counts['cache_read_input_tokens']} cache read, "
+        f"{counts['cache_creation_input_tokens']} cache write, {counts['input_tokens']} uncached; "
+        f"{hit_rate:.0%} from cache). Output tokens: {counts['output_tokens']}"
+    )
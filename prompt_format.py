@@ -0,0 +1,223 @@
+"""
+Serializers that turn emails into prompt text.
+
+JSON repeats every key name for every email and spends tokens on escaped newlines, full
+timestamps, long addresses and empty cc/bcc/attachment fields. The compact layout is a
+delimited table instead:
+
+    PEOPLE: @P1=Jho Low <jho.low@example.com>; @P2=riza.aziz@example.com
+    id|date|from|to|subject|body
+    #E12|2012-03-01 14:05|@P1|@P2|Transfer|Please wire the funds ...
+
+- the header is written once, listing only the projected fields some email fills;
+- email IDs are shortened (EMAIL_12 -> #E12) and addresses replaced by @P1, @P2, ... aliases
+  declared once, numbered in order of first appearance so the same emails always give the
+  same text (and the same cached prompt prefix). The sigils keep them apart from text such
+  as "the P3 route" in the bodies;
+- dates lose their seconds (and midnight times), and whitespace in bodies collapses.
+
+The model answers in the short forms, so restore_aliases maps them back in the reply text or
+parsed results (leaving verbatim quotes alone), given the emails the prompt was built from.
+Pass a serializer name (or set PROMPT_FORMAT) to choose the layout; "json" keeps the original
+one.
+"""
+import json
+import os
+import re
+from functools import lru_cache
+
+import pandas as pd
+from pydantic import BaseModel
+
+from email_index import ADDRESS_FIELDS, parse_addresses
+
+PROMPT_FORMAT_ENV = "PROMPT_FORMAT"
+DEFAULT_FORMAT = "compact"
+COMPACT_FIELDS = ("email_id", "date", "sender", "recipients", "cc", "bcc", "subject", "thread", "aliases", "body")
+DATE_FIELDS = ("date", "timestamp")
+HEADERS = {"email_id": "id", "sender": "from", "recipients": "to"}
+DELIMITER = "|"
+EMAIL_ID = re.compile(r"\bEMAIL_(\d+)\b")
+SHORT_FORM = re.compile(r"(?<!\w)(?:@P|#E)\d+\b")
+VERBATIM_FIELDS = ("quotes",)
+
+
+class JsonSerializer:
+    """
+    Every email as a JSON object with all its fields; nothing to map back.
+    """
+
+    name = "json"
+
+    def __call__(self, emails):
+        return json.dumps([dict(email) for email in emails], default=str, ensure_ascii=False)
+
+    def aliases(self, emails):
+        return {}
+
+
+class CompactSerializer:
+    """
+    Emails as a delimited table with short email IDs and address aliases.
+
+    fields projects (and orders) the columns; the body should stay last, since it is the only
+    column whose text may contain the delimiter.
+    """
+
+    name = "compact"
+
+    def __init__(self, fields=COMPACT_FIELDS):
+        self.fields = tuple(fields)
+
+    def people(self, emails):
+        """
+        Alias -> (display name, address) for every address in emails, in order of first appearance.
+        """
+        aliases, people = {}, {}
+        for email in emails:
+            for field in ADDRESS_FIELDS:
+                if field not in self.fields:
+                    continue
+                for name, address in _addresses(email.get(field)):
+                    if address not in aliases:
+                        aliases[address] = f"@P{len(aliases) + 1}"
+                        people[aliases[address]] = (name, address)
+                    elif name and not people[aliases[address]][0]:
+                        people[aliases[address]] = (name, address)
+        return people
+
+    def aliases(self, emails):
+        """
+        Short form -> original for every short form the text of emails uses.
+        """
+        mapping = {alias: address for alias, (_, address) in self.people(emails).items()}
+        for email in emails:
+            duplicates = email.get("aliases")
+            for email_id in [email.get("email_id"), *(duplicates if isinstance(duplicates, (list, tuple)) else ())]:
+                short = EMAIL_ID.sub(r"#E\1", email_id) if isinstance(email_id, str) else None
+                if short and short != email_id:
+                    mapping[short] = email_id
+        return mapping
+
+    def __call__(self, emails):
+        emails = list(emails)
+        people = self.people(emails)
+        by_address = {address: alias for alias, (_, address) in people.items()}
+        columns = {field: self._column(emails, field, by_address) for field in self.fields}
+        columns = {field: cells for field, cells in columns.items() if any(cells)}
+        last = list(columns)[-1] if columns else None
+        lines = [
+            f"Emails as a {DELIMITER}-delimited table, one per line. @P<n> are the people listed under PEOPLE "
+            "and #E<n> are email IDs; cite emails by these IDs."
+        ]
+        if people:
+            lines.append("PEOPLE: " + "; ".join(_person(alias, *person) for alias, person in people.items()))
+        lines.append(DELIMITER.join(HEADERS.get(field, field) for field in columns))
+        for field in columns:
+            if field != last:
+                columns[field] = [cell.replace(DELIMITER, "/") for cell in columns[field]]
+        lines.extend(DELIMITER.join(row) for row in zip(*columns.values()))
+        return "\n".join(lines)
+
+    def _column(self, emails, field, by_address):
+        """
+        The cells of one column; header and date values repeat, so each distinct one is formatted once.
+        """
+        if field == "date":
+            values = [next(filter(_present, map(email.get, DATE_FIELDS)), "") for email in emails]
+            distinct = list(dict.fromkeys(map(str, values)))
+            short = dict(zip(distinct, _short_dates(distinct)))
+            return [short[str(value)] for value in values]
+        values = [email.get(field) for email in emails]
+        if field in ADDRESS_FIELDS:
+            values = [", ".join(map(str, value)) if isinstance(value, (list, tuple)) else value for value in values]
+            cells = {}
+            for value in values:
+                if isinstance(value, str) and value not in cells:
+                    aliases = [by_address[address] for _, address in _addresses(value)]
+                    cells[value] = ",".join(aliases) if aliases else _text(value)
+            return [cells.get(value, "") if isinstance(value, str) else "" for value in values]
+        if field in ("email_id", "aliases"):
+            return [_short_ids(value) if _present(value) else "" for value in values]
+        return [_text(value) if _present(value) else "" for value in values]
+
+
+def _addresses(value):
+    # Headers repeat across a mailbox, so each distinct one is parsed once
+    return _parse_header(value) if isinstance(value, str) else parse_addresses(value)
+
+
+@lru_cache(maxsize=1 << 16)
+def _parse_header(value):
+    return tuple(parse_addresses(value))
+
+
+def _text(value):
+    if isinstance(value, (list, tuple)):
+        value = ",".join(map(str, value))
+    return " ".join(str(value).split())
+
+
+def _short_ids(value):
+    values = value if isinstance(value, (list, tuple)) else [value]
+    return ",".join(EMAIL_ID.sub(r"#E\1", str(item)) for item in values)
+
+
+def _present(value):
+    return value is not None and not (isinstance(value, float) and value != value) and value != ""
+
+
+def _person(alias, name, address):
+    return f"{alias}={name} <{address}>" if name else f"{alias}={address}"
+
+
+def _short_dates(values):
+    """
+    Dates as "YYYY-MM-DD HH:MM", or just the day at midnight; unparseable values are kept as is.
+    """
+    timestamps = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce", utc=True, format="mixed")
+    formatted = timestamps.dt.strftime("%Y-%m-%d %H:%M").str.removesuffix(" 00:00")
+    return [short if isinstance(short, str) else value for short, value in zip(formatted, values)]
+
+
+SERIALIZERS = {serializer.name: serializer for serializer in (JsonSerializer(), CompactSerializer())}
+
+
+def get_serializer(serializer=None):
+    """
+    A serializer by name, or the PROMPT_FORMAT one (compact unless set) when serializer is None.
+    Serializer instances are returned unchanged.
+    """
+    if serializer is None:
+        serializer = os.environ.get(PROMPT_FORMAT_ENV, DEFAULT_FORMAT)
+    if isinstance(serializer, str):
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"Unknown prompt format {serializer!r}; expected one of {sorted(SERIALIZERS)}")
+        return SERIALIZERS[serializer]
+    return serializer
+
+
+def restore_aliases(value, emails, serializer=None, mapping=None):
+    """
+    value (reply text, a pydantic model such as InvestigationResults, or dicts and lists of
+    them) with the short forms the serializer used for emails mapped back to email IDs and
+    addresses. Unknown short forms, and the VERBATIM_FIELDS of dicts and models, are left
+    alone. Pass mapping (the serializer's aliases for emails) to reuse it across calls.
+    """
+    if mapping is None:
+        mapping = get_serializer(serializer).aliases(list(emails or ()))
+    if not mapping:
+        return value
+    return _map_strings(value, lambda text: SHORT_FORM.sub(lambda match: mapping.get(match[0], match[0]), text))
+
+
+def _map_strings(value, fn):
+    if isinstance(value, str):
+        return fn(value)
+    if isinstance(value, BaseModel):
+        return type(value).model_validate(_map_strings(value.model_dump(), fn))
+    if isinstance(value, dict):
+        return {key: item if key in VERBATIM_FIELDS else _map_strings(item, fn) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_map_strings(item, fn) for item in value)
+    return value
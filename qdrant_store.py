@@ -0,0 +1,266 @@
+"""
+Typed payload schema, payload indexes and filtered search for the Qdrant collection.
+
+Every point's payload is normalized the same way whether it is a document, transaction or
+email: lower-cased sender and receivers, an integer epoch "timestamp" plus an RFC 3339 "date",
+and a numeric "amount". Keyword, integer, float and datetime payload indexes on those fields
+let Qdrant apply structured filters during the vector search instead of scanning the whole
+collection.
+
+Collections can also be created with quantized vectors: scalar (int8, 4x smaller) or binary
+(1 bit per dimension, 32x smaller) copies kept in RAM for the search, with the original float32
+vectors optionally moved to disk and only read to rescore the top candidates. Searches on a
+quantized collection oversample and rescore according to its quantization.
+"""
+from datetime import datetime, timezone
+
+import pandas as pd
+from qdrant_client import models
+
+PAYLOAD_INDEXES = {
+    "type": models.PayloadSchemaType.KEYWORD,
+    "label": models.PayloadSchemaType.KEYWORD,
+    "sender": models.PayloadSchemaType.KEYWORD,
+    "receivers": models.PayloadSchemaType.KEYWORD,
+    "timestamp": models.PayloadSchemaType.INTEGER,
+    "date": models.PayloadSchemaType.DATETIME,
+    "amount": models.PayloadSchemaType.FLOAT,
+}
+
+QUANTIZATION = {
+    None: None,
+    "scalar": models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+    ),
+    "binary": models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True)),
+}
+BYTES_PER_DIMENSION = {None: 0, "scalar": 1, "binary": 1 / 8}
+OVERSAMPLING = {None: None, "scalar": 2.0, "binary": 3.0}  # binary loses more, so fetch more to rescore
+
+
+def normalize_party(value):
+    return value.strip().strip("<>").lower() if isinstance(value, str) and value.strip() else None
+
+
+def to_epoch(value):
+    """
+    Whole seconds since the epoch for a datetime, date string or number (naive values are taken as UTC).
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    timestamp = pd.to_datetime(value, errors="coerce", utc=True)
+    return None if pd.isna(timestamp) else int(timestamp.timestamp())
+
+
+def normalize_payload(payload):
+    """
+    Return a copy of payload with typed, normalized filter fields.
+
+    sender/receiver become lower-case strings, "receivers" always lists every receiver,
+    "timestamp" is an integer epoch (None if missing or unparseable) with a matching RFC 3339
+    "date", and "amount" is a float.
+    """
+    payload = dict(payload)
+    payload["sender"] = normalize_party(payload.get("sender"))
+    receivers = payload.get("receivers") or []
+    if payload.get("receiver") is not None:
+        receivers = [payload["receiver"], *receivers]
+    payload["receivers"] = list(dict.fromkeys(filter(None, map(normalize_party, receivers))))
+    payload["receiver"] = payload["receivers"][0] if payload["receivers"] else None
+
+    timestamp = to_epoch(payload.get("timestamp"))
+    payload["timestamp"] = timestamp
+    payload["date"] = None if timestamp is None else datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+    if payload.get("amount") is not None:
+        payload["amount"] = float(payload["amount"])
+    return payload
+
+
+def _check_quantization(quantization):
+    if quantization not in QUANTIZATION:
+        raise ValueError(f"Unknown quantization {quantization!r}, expected one of {sorted(filter(None, QUANTIZATION))}")
+
+
+def create_collection(qdrant, collection_name, dimension, quantization=None, on_disk=False):
+    """
+    Create a cosine collection of the given dimension.
+
+    quantization is None, "scalar" or "binary"; on_disk keeps the original vectors on disk
+    (memory-mapped), which only makes sense together with quantization.
+    """
+    _check_quantization(quantization)
+    qdrant.create_collection(
+        collection_name,
+        vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE, on_disk=on_disk),
+        quantization_config=QUANTIZATION[quantization],
+    )
+
+
+def collection_dimension(qdrant, collection_name):
+    return qdrant.get_collection(collection_name).config.params.vectors.size
+
+
+def collection_quantization(qdrant, collection_name):
+    """
+    The quantization ("scalar", "binary" or None) a collection was created or updated with.
+    """
+    config = qdrant.get_collection(collection_name).config.quantization_config
+    if isinstance(config, models.ScalarQuantization):
+        return "scalar"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    return None
+
+
+def update_quantization(qdrant, collection_name, quantization=None, on_disk=False):
+    """
+    Bring an existing collection to the given quantization and on_disk setting.
+
+    Returns whether anything changed; Qdrant re-quantizes the stored vectors in the background.
+    """
+    _check_quantization(quantization)
+    current_on_disk = bool(qdrant.get_collection(collection_name).config.params.vectors.on_disk)
+    if (collection_quantization(qdrant, collection_name), current_on_disk) == (quantization, on_disk):
+        return False
+    qdrant.update_collection(
+        collection_name,
+        vectors_config={"": models.VectorParamsDiff(on_disk=on_disk)},
+        quantization_config=QUANTIZATION[quantization] or models.Disabled.DISABLED,
+    )
+    return True
+
+
+def vector_memory(points, dimension, quantization=None, on_disk=False):
+    """
+    Estimated bytes of RAM for the vectors of a collection (excluding the HNSW graph and payloads).
+    """
+    original = 0 if on_disk else 4 * dimension
+    return int(points * (original + BYTES_PER_DIMENSION[quantization] * dimension))
+
+
+def search_params(quantization=None, rescore=True, oversampling=None):
+    """
+    SearchParams for a quantized collection: rescore the oversampled candidates with the original vectors.
+    """
+    if quantization is None:
+        return None
+    oversampling = oversampling if oversampling is not None else OVERSAMPLING[quantization]
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(rescore=rescore, oversampling=oversampling if rescore else None)
+    )
+
+
+def ensure_payload_indexes(qdrant, collection_name):
+    """
+    Create any payload indexes the collection is missing.
+    """
+    existing = qdrant.get_collection(collection_name).payload_schema or {}
+    for field, schema in PAYLOAD_INDEXES.items():
+        if field not in existing:
+            qdrant.create_payload_index(collection_name, field_name=field, field_schema=schema)
+
+
+def _match(key, value):
+    return models.FieldCondition(key=key, match=models.MatchValue(value=value))
+
+
+def build_filter(
+    type=None,
+    sender=None,
+    receiver=None,
+    between=None,
+    start=None,
+    end=None,
+    min_amount=None,
+    max_amount=None,
+    label=None,
+):
+    """
+    Turn structured filters into a Qdrant Filter, or None when unfiltered.
+
+    between=(a, b) matches points sent by either party to the other. start/end bound the
+    timestamp (inclusive) and accept datetimes, date strings or epoch seconds.
+    """
+    must = []
+    if type is not None:
+        must.append(_match("type", type))
+    if label is not None:
+        must.append(_match("label", label))
+    if sender is not None:
+        must.append(_match("sender", normalize_party(sender)))
+    if receiver is not None:
+        must.append(_match("receivers", normalize_party(receiver)))
+    if between is not None:
+        a, b = map(normalize_party, between)
+        must.append(
+            models.Filter(
+                should=[
+                    models.Filter(must=[_match("sender", a), _match("receivers", b)]),
+                    models.Filter(must=[_match("sender", b), _match("receivers", a)]),
+                ]
+            )
+        )
+    if start is not None or end is not None:
+        must.append(models.FieldCondition(key="timestamp", range=models.Range(gte=to_epoch(start), lte=to_epoch(end))))
+    if min_amount is not None or max_amount is not None:
+        must.append(models.FieldCondition(key="amount", range=models.Range(gte=min_amount, lte=max_amount)))
+    return models.Filter(must=must) if must else None
+
+
+def search(qdrant, collection_name, vector, limit=10, params=None, **filters):
+    """
+    Vector search restricted by structured filters (see build_filter). Returns scored points.
+
+    params are optional SearchParams; by default they follow the collection's quantization
+    (see search_params).
+    """
+    if params is None:
+        params = search_params(collection_quantization(qdrant, collection_name))
+    return qdrant.query_points(
+        collection_name,
+        query=vector,
+        query_filter=build_filter(**filters),
+        search_params=params,
+        limit=limit,
+        with_payload=True,
+    ).points
+
+
+def scroll(qdrant, collection_name, limit=100, **filters):
+    """
+    Payloads matching structured filters, without a query vector.
+    """
+    points, _ = qdrant.scroll(
+        collection_name, scroll_filter=build_filter(**filters), limit=limit, with_payload=True, with_vectors=False
+    )
+    return [point.payload for point in points]
+
+
+def count(qdrant, collection_name, **filters):
+    """
+    Exact number of points matching structured filters.
+    """
+    return qdrant.count(collection_name, count_filter=build_filter(**filters), exact=True).count
+
+
+def iter_payloads(qdrant, collection_name, batch_size=1000, **filters):
+    """
+    Every payload matching structured filters, paging through the whole collection.
+    """
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name,
+            scroll_filter=build_filter(**filters),
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        for point in points:
+            yield point.payload
+        if offset is None:
+            return
@@ -0,0 +1,105 @@
+"""
+Content-addressed store of finished investigation results.
+
+A result is keyed by a hash of the model, the prompt (question, context and person of
+interest) and the exact emails analyzed, so re-running an identical investigation returns the
+stored InvestigationResults without calling the model. Entries older than the retention
+period are dropped, and beyond max_entries the least recently used ones are evicted.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import time
+
+from schemas import InvestigationResults
+
+RESULTS_PATH = "investigation_results.sqlite"
+MAX_ENTRIES = 10_000
+MAX_AGE_DAYS = 30
+
+
+def _sha256(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def prompt_hash(question, context="", poi=None):
+    return _sha256(" ".join(question.split()), " ".join((context or "").split()), poi or "")
+
+
+def email_set_hash(emails):
+    """
+    Hash of the emails' contents, in order (the order decides how they are batched).
+    """
+    return _sha256(*(json.dumps(dict(email), sort_keys=True, default=str) for email in emails))
+
+
+def result_key(model, question, emails, context="", poi=None):
+    return _sha256(model, prompt_hash(question, context, poi), email_set_hash(emails))
+
+
+def case_thread_id(key, poi=None):
+    """
+    Checkpoint thread ID for one case: stable across restarts so an interrupted run resumes.
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", (poi or "case").lower()).strip("-")
+    return f"{slug}-{key[:16]}"
+
+
+class ResultStore:
+    """
+    SQLite table of InvestigationResults JSON by result key.
+    """
+
+    def __init__(self, path=RESULTS_PATH, max_entries=MAX_ENTRIES, max_age_days=MAX_AGE_DAYS):
+        self.max_entries = max_entries
+        self.max_age_s = max_age_days * 86400
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, thread_id TEXT, results TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.conn.commit()
+
+    def get(self, key):
+        row = self.conn.execute(
+            "SELECT results FROM results WHERE key = ? AND created_at >= ?", (key, time.time() - self.max_age_s)
+        ).fetchone()
+        if row is None:
+            return None
+        with self.conn:
+            self.conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        return InvestigationResults.model_validate_json(row[0])
+
+    def put(self, key, results, model, thread_id=None):
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, thread_id, results.model_dump_json(), now, now),
+            )
+        self.evict()
+
+    def evict(self):
+        """
+        Drop expired entries, then the least recently used ones beyond max_entries.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - self.max_age_s,))
+            self.conn.execute(
+                "DELETE FROM results WHERE key IN "
+                "(SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,208 @@
+"""
+Local hybrid retrieval over emails: BM25 over subjects and bodies plus dense vectors.
+
+Both rankings run in-process: BM25 on a NumPy inverted index and dense search on an embedded
+Qdrant (in memory, or on disk with a path). They are combined with reciprocal-rank fusion and
+can be filtered on type, sender, receiver and a timestamp range, so only the top-k relevant
+emails need to go into the prompt. Without an embedder the retriever falls back to BM25 alone.
+"""
+import hashlib
+import json
+import math
+import re
+from collections import Counter, OrderedDict, defaultdict
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from email_index import email_addresses, parse_addresses
+from ingest import batch_by_tokens
+from qdrant_store import build_filter, normalize_party, normalize_payload, to_epoch
+
+TOKEN = re.compile(r"[a-z0-9]+(?:['.][a-z0-9]+)*")
+RRF_K = 60
+CANDIDATES = 100
+COLLECTION_NAME = "email_retrieval"
+RETRIEVER_CACHE_SIZE = 4
+
+_retrievers = OrderedDict()
+
+
+def tokenize(text):
+    return TOKEN.findall(text.lower()) if isinstance(text, str) else []
+
+
+def email_text(email):
+    return f"{email.get('subject') or ''}\n{email.get('body') or ''}"
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a fixed list of texts, with postings stored as NumPy arrays.
+    """
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        postings = defaultdict(lambda: ([], []))
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                ids, tfs = postings[term]
+                ids.append(doc_id)
+                tfs.append(count)
+        self.doc_count = len(lengths)
+        self.lengths = np.array(lengths, dtype=np.float32)
+        self.avg_length = float(self.lengths.mean()) if self.doc_count else 0.0
+        self.postings = {
+            term: (np.array(ids, dtype=np.int64), np.array(tfs, dtype=np.float32)) for term, (ids, tfs) in postings.items()
+        }
+
+    def scores(self, query):
+        scores = np.zeros(self.doc_count, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / (self.avg_length or 1.0))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            ids, tfs = self.postings[term]
+            idf = math.log(1 + (self.doc_count - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm[ids])
+        return scores
+
+    def search(self, query, k, mask=None):
+        """
+        Return up to k (doc_id, score) pairs with a positive score, best first.
+        """
+        scores = self.scores(query)
+        if mask is not None:
+            scores[~mask] = 0
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in top if scores[doc_id] > 0]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse ranked lists of doc IDs into one list of (doc_id, score), best first.
+    """
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))
+
+
+class HybridRetriever:
+    """
+    BM25 + dense retrieval over one list of emails.
+
+    embed is any callable mapping texts to vectors (e.g. embedding_cache.get_embedder(client));
+    qdrant defaults to an in-memory embedded instance.
+    """
+
+    def __init__(self, emails, embed=None, qdrant=None, collection_name=COLLECTION_NAME):
+        self.emails = list(emails)
+        self.embed = embed
+        self.collection_name = collection_name
+        self.bm25 = BM25Index([email_text(email) for email in self.emails])
+
+        senders = [parse_addresses(email.get("sender")) for email in self.emails]
+        self.payloads = [
+            normalize_payload(
+                {
+                    "type": email.get("type", "email"),
+                    "sender": sender[0][1] if sender else None,
+                    "receivers": sorted(email_addresses(email) - {address for _, address in sender}),
+                    "timestamp": email.get("date", email.get("timestamp")),
+                    "doc_id": doc_id,
+                }
+            )
+            for doc_id, (email, sender) in enumerate(zip(self.emails, senders))
+        ]
+
+        self._types = np.array([payload["type"] for payload in self.payloads], dtype=object)
+        self._senders = np.array([payload["sender"] for payload in self.payloads], dtype=object)
+        self._timestamps = np.array(
+            [np.nan if payload["timestamp"] is None else payload["timestamp"] for payload in self.payloads]
+        )
+
+        self.qdrant = None
+        if embed is not None and self.emails:
+            self.qdrant = qdrant or QdrantClient(":memory:")
+            vectors = []
+            for batch, _ in batch_by_tokens({"text": email_text(email)} for email in self.emails):
+                vectors.extend(embed([document["text"] for document in batch]))
+            if self.qdrant.collection_exists(collection_name):
+                self.qdrant.delete_collection(collection_name)
+            self.qdrant.create_collection(
+                collection_name,
+                vectors_config=models.VectorParams(size=len(vectors[0]), distance=models.Distance.COSINE),
+            )
+            self.qdrant.upload_points(
+                collection_name,
+                [
+                    models.PointStruct(id=doc_id, vector=vector, payload=payload)
+                    for doc_id, (vector, payload) in enumerate(zip(vectors, self.payloads))
+                ],
+            )
+
+    def _mask(self, type=None, sender=None, receiver=None, start=None, end=None):
+        if all(value is None for value in (type, sender, receiver, start, end)):
+            return None
+        mask = np.ones(len(self.emails), dtype=bool)
+        if type is not None:
+            mask &= self._types == type
+        if sender is not None:
+            mask &= self._senders == normalize_party(sender)
+        if receiver is not None:
+            receiver = normalize_party(receiver)
+            mask &= np.array([receiver in payload["receivers"] for payload in self.payloads], dtype=bool)
+        # NaN timestamps compare False, so undated emails drop out of any date range
+        if start is not None:
+            mask &= self._timestamps >= to_epoch(start)
+        if end is not None:
+            mask &= self._timestamps <= to_epoch(end)
+        return mask
+
+    def search(self, query, k=20, candidates=CANDIDATES, **filters):
+        """
+        Return the top-k (email, score) pairs for a query, optionally filtered by
+        type, sender, receiver, start and end.
+        """
+        rankings = [[doc_id for doc_id, _ in self.bm25.search(query, candidates, self._mask(**filters))]]
+        if self.qdrant is not None:
+            hits = self.qdrant.query_points(
+                self.collection_name,
+                query=self.embed([query])[0],
+                query_filter=build_filter(**filters),
+                limit=candidates,
+            ).points
+            rankings.append([hit.id for hit in hits])
+        return [(self.emails[doc_id], score) for doc_id, score in reciprocal_rank_fusion(rankings)[:k]]
+
+
+def get_retriever(emails, embed=None):
+    """
+    Return a HybridRetriever for emails, reusing the one built for the same emails and embedder.
+
+    The last RETRIEVER_CACHE_SIZE retrievers are kept, so repeat queries over a mailbox do not
+    rebuild the BM25 index or re-upload every vector.
+    """
+    emails = list(emails)
+    digest = hashlib.sha256(json.dumps([dict(email) for email in emails], sort_keys=True, default=str).encode())
+    key = (digest.hexdigest(), embed)
+    if key in _retrievers:
+        _retrievers.move_to_end(key)
+        return _retrievers[key]
+    retriever = _retrievers[key] = HybridRetriever(emails, embed=embed)
+    if len(_retrievers) > RETRIEVER_CACHE_SIZE:
+        _retrievers.popitem(last=False)
+    return retriever
+
+
+def retrieve_relevant_emails(emails, query, k=20, embed=None, **filters):
+    """
+    Convenience wrapper: the top-k emails for query, in fused rank order.
+    """
+    return [email for email, _ in get_retriever(emails, embed=embed).search(query, k, **filters)]
@@ -0,0 +1,53 @@
+"""
+Structured output schema for investigation results.
+"""
+from typing import List, Union
+
+from pydantic import BaseModel, Field
+
+
+class Reference(BaseModel):
+    """Reference to an email with context"""
+
+    email_id: str = Field(description="Unique identifier for the email")
+    email_subject: str = Field(description="Subject of the email")
+    quotes: Union[str, List[str]] = Field(description="Relevant quotes from the email")
+    description: str = Field(description="Description of why this email is relevant to the case")
+
+
+class Entity(BaseModel):
+    name: str
+    type: str
+    description: str
+    references: List[Reference]
+
+
+class SecondaryPOI(BaseModel):
+    name: str
+    email_address: str
+    description: str
+    reasoning: str
+    references: List[Reference]
+
+
+class KeyEvent(BaseModel):
+    event: str
+    date: str
+    location: str
+    references: List[Reference]
+
+
+class SuspiciousActivity(BaseModel):
+    short_title: str
+    description: str
+    date: str
+    references: List[Reference]
+
+
+class InvestigationResults(BaseModel):
+    """Results of the investigation"""
+
+    secondary_poi: List[SecondaryPOI] = Field(default=[], description="List of secondary people of interest")
+    key_events: List[KeyEvent] = Field(default=[], description="List of key events")
+    sus_activities: List[SuspiciousActivity] = Field(default=[], description="List of suspicious activities")
+    entities_of_note: List[Entity] = Field(default=[], description="List of entities of note")
@@ -3,4 +3,3 @@ from tools import load_all_emails, load_participant_descriptions, filter_emails_
 emails = load_all_emails()
 
 participant_descriptions = load_participant_descriptions()
-import ipdb; ipdb.set_trace()
\ No newline at end of file
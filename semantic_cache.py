@@ -0,0 +1,150 @@
+"""
+Semantic response cache for repeated analyst questions.
+
+Responses are cached per scope: the model, the person of interest, the exact emails analyzed
+and any other request settings that change the answer. A lookup first tries the exact
+normalized question, then the cached question in the same scope whose embedding is most
+similar, accepted above a similarity threshold. Entries expire after a TTL and the least
+recently used are evicted beyond max_entries. Hit counts and the model latency the hits
+avoided are tracked so the cache can be tuned.
+"""
+import hashlib
+import sqlite3
+import time
+
+import numpy as np
+
+from result_store import email_set_hash
+
+CACHE_PATH = "response_cache.sqlite"
+SIMILARITY_THRESHOLD = 0.92
+TTL_S = 7 * 86400
+MAX_ENTRIES = 5000
+
+
+def normalize_question(question):
+    return " ".join(question.lower().split())
+
+
+def cache_scope(model, emails=None, poi=None, **settings):
+    """
+    Key of everything besides the question that a cached response depends on.
+    """
+    settings = "\0".join(f"{name}={value}" for name, value in sorted(settings.items()))
+    emails = email_set_hash(emails) if emails is not None else ""
+    return hashlib.sha256(f"{model}\0{poi or ''}\0{emails}\0{settings}".encode()).hexdigest()
+
+
+class SemanticCache:
+    """
+    SQLite-backed cache of responses, matched exactly or by question embedding.
+
+    embed is any callable mapping texts to vectors (e.g. embedding_cache.get_embedder(client));
+    without it only exact matches are found.
+    """
+
+    def __init__(
+        self, path=CACHE_PATH, embed=None, threshold=SIMILARITY_THRESHOLD, ttl_s=TTL_S, max_entries=MAX_ENTRIES
+    ):
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.latency_saved_s = 0.0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "scope TEXT NOT NULL, question TEXT NOT NULL, vector BLOB, response TEXT NOT NULL, "
+            "latency_s REAL NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL, "
+            "PRIMARY KEY (scope, question))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.conn.commit()
+
+    def _vector(self, question):
+        if self.embed is None:
+            return None
+        vector = np.asarray(self.embed([question])[0], dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _hit(self, scope, question, response, latency_s, semantic):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE responses SET last_used = ? WHERE scope = ? AND question = ?", (time.time(), scope, question)
+            )
+        if semantic:
+            self.semantic_hits += 1
+        else:
+            self.exact_hits += 1
+        self.latency_saved_s += latency_s
+        return response
+
+    def get(self, question, scope):
+        """
+        Return the cached response for question in scope, or None.
+        """
+        question = normalize_question(question)
+        fresh = time.time() - self.ttl_s
+        row = self.conn.execute(
+            "SELECT response, latency_s FROM responses WHERE scope = ? AND question = ? AND created_at >= ?",
+            (scope, question, fresh),
+        ).fetchone()
+        if row is not None:
+            return self._hit(scope, question, *row, semantic=False)
+
+        rows = self.conn.execute(
+            "SELECT question, vector, response, latency_s FROM responses "
+            "WHERE scope = ? AND vector IS NOT NULL AND created_at >= ?",
+            (scope, fresh),
+        ).fetchall()
+        if rows and self.embed is not None:
+            vectors = np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector, _, _ in rows])
+            similarities = vectors @ self._vector(question)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                cached_question, _, response, latency_s = rows[best]
+                return self._hit(scope, cached_question, response, latency_s, semantic=True)
+        self.misses += 1
+        return None
+
+    def put(self, question, scope, response, latency_s=0.0):
+        """
+        Cache a response; latency_s is how long it took to produce, credited on later hits.
+        """
+        question = normalize_question(question)
+        vector = self._vector(question)
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scope, question, None if vector is None else vector.tobytes(), response, latency_s, now, now),
+            )
+        self.evict()
+
+    def evict(self):
+        """
+        Drop expired entries, then the least recently used ones beyond max_entries.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_s,))
+            self.conn.execute(
+                "DELETE FROM responses WHERE rowid IN "
+                "(SELECT rowid FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            "latency_saved_s": round(self.latency_saved_s, 2),
+        }
+
+    def close(self):
+        self.conn.close()
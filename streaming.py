@@ -0,0 +1,208 @@
+"""
+Streaming InvestigationResults with incremental JSON parsing.
+
+The model is asked for its results through the forced record_investigation_results tool and
+the response is consumed as a Messages API event stream. The partial JSON is scanned as it
+arrives, and every SecondaryPOI, KeyEvent, SuspiciousActivity and Entity is validated and
+emitted as soon as its closing brace is seen, so the first findings are available long before
+the response ends. If the response is cut short (max_tokens, a dropped connection) the items
+completed so far still make up a valid, partial InvestigationResults.
+"""
+import json
+import time
+
+from pydantic import ValidationError
+
+from map_reduce import MAX_OUTPUT_TOKENS, RESULTS_TOOL
+from prompt_builder import build_request
+from prompt_format import get_serializer, restore_aliases
+from schemas import Entity, InvestigationResults, KeyEvent, SecondaryPOI, SuspiciousActivity
+
+SECTION_MODELS = {
+    "secondary_poi": SecondaryPOI,
+    "key_events": KeyEvent,
+    "sus_activities": SuspiciousActivity,
+    "entities_of_note": Entity,
+}
+FENCE = "```json"
+
+
+class IncrementalResultsParser:
+    """
+    Incremental parser for an InvestigationResults JSON document fed in arbitrary chunks.
+
+    feed(chunk) returns the (section, item) pairs completed by that chunk. The document is the
+    content of a ```json fence if one appears before it starts, otherwise the first "{" whose
+    first key is a results section, so braces in any prose before it are skipped. Anything after
+    the document closes is ignored.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.items = {section: [] for section in SECTION_MODELS}
+        self.errors = []
+        self.started = False
+        self.complete = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._section = None
+        self._item_start = None
+        self._first_key = False
+
+    def _restart(self):
+        # What looked like the document was prose; wait for the next "{"
+        self.started = False
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        text = self.text
+        if not self.started:
+            # A fence may have been split across chunks, so look back over its length
+            fence = text.find(FENCE, max(0, self._pos - len(FENCE) + 1))
+            if fence >= 0:
+                self._pos = max(self._pos, fence + len(FENCE))
+        for pos in range(self._pos, len(text)):
+            if self.complete:
+                break
+            char = text[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1 : pos]
+                continue
+            if not self.started:
+                self.started = self._first_key = char == "{"
+                self._depth = int(self.started)
+                self._last_string = None
+                continue
+            if self._first_key and not char.isspace() and char not in '":':
+                self._restart()
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char == ":" and self._depth == 1:
+                if self._first_key and self._last_string not in SECTION_MODELS:
+                    self._restart()
+                    continue
+                self._first_key = False
+                self._section = self._last_string
+            elif char in "{[":
+                if char == "{" and self._depth == 2 and self._section in SECTION_MODELS:
+                    self._item_start = pos
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if char == "}" and self._depth == 2 and self._item_start is not None:
+                    item = self._parse_item(text[self._item_start : pos + 1])
+                    if item is not None:
+                        completed.append((self._section, item))
+                    self._item_start = None
+                elif self._depth == 0:
+                    self.complete = True
+        self._pos = len(text)
+        return completed
+
+    def _parse_item(self, item_json):
+        try:
+            item = SECTION_MODELS[self._section].model_validate(json.loads(item_json))
+        except (json.JSONDecodeError, ValidationError) as e:
+            self.errors.append(f"{self._section}: {e}")
+            return None
+        self.items[self._section].append(item)
+        return item
+
+    def results(self):
+        """
+        InvestigationResults holding every item completed so far.
+        """
+        return InvestigationResults(**self.items)
+
+
+def parse_investigation_results(text):
+    """
+    Parse a complete or truncated InvestigationResults reply, fenced or not.
+    """
+    parser = IncrementalResultsParser()
+    parser.feed(text)
+    return parser.results()
+
+
+class InvestigationStream:
+    """
+    Iterate over (section, item) findings as a streamed response produces them.
+
+    After iteration, results holds the (possibly partial) InvestigationResults, truncated tells
+    whether the document was cut short, and first_item_s is the latency of the first finding.
+    """
+
+    def __init__(self, client, model, question, emails=None, poi=None, max_tokens=MAX_OUTPUT_TOKENS):
+        self.client = client
+        self.model = model
+        self.question = question
+        self.emails = emails
+        self.poi = poi
+        self.max_tokens = max_tokens
+        self.parser = IncrementalResultsParser()
+        self.aliases = get_serializer().aliases(list(emails or ()))
+        self.stop_reason = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.first_item_s = None
+        self.elapsed_s = None
+
+    @property
+    def results(self):
+        return restore_aliases(self.parser.results(), self.emails, mapping=self.aliases)
+
+    @property
+    def truncated(self):
+        return not self.parser.complete or self.stop_reason == "max_tokens"
+
+    def __iter__(self):
+        started = time.perf_counter()
+        events = self.client.messages.create(
+            model=self.model,
+            max_tokens=self.max_tokens,
+            tools=[RESULTS_TOOL],
+            tool_choice={"type": "tool", "name": RESULTS_TOOL["name"]},
+            stream=True,
+            **build_request(self.question, emails=self.emails, poi=self.poi),
+        )
+        try:
+            for event in events:
+                if event.type == "message_start":
+                    self.input_tokens = event.message.usage.input_tokens
+                elif event.type == "message_delta":
+                    self.stop_reason = event.delta.stop_reason
+                    self.output_tokens = event.usage.output_tokens
+                elif event.type == "content_block_delta":
+                    delta = event.delta
+                    chunk = delta.partial_json if delta.type == "input_json_delta" else getattr(delta, "text", "")
+                    for finding in self.parser.feed(chunk):
+                        if self.first_item_s is None:
+                            self.first_item_s = time.perf_counter() - started
+                        section, item = finding
+                        yield section, restore_aliases(item, self.emails, mapping=self.aliases)
+        finally:
+            self.elapsed_s = time.perf_counter() - started
+
+
+def format_finding(section, item):
+    """
+    One-line summary of a streamed finding.
+    """
+    title = getattr(item, "name", None) or getattr(item, "event", None) or getattr(item, "short_title", "")
+    return f"[{section}] {title} ({len(item.references)} references)"
@@ -2,4 +2,3 @@ from tools import bribery_playbook
 
 bribery_playbook_response = bribery_playbook("Charlie", "Maxwell")
 print(bribery_playbook_response)
-import ipdb; ipdb.set_trace()
\ No newline at end of file
@@ -0,0 +1,50 @@
+from anthropic.types import ToolUseBlock
+
+from agent import ToolRegistry, run_agent
+from fake_llm import FakeAnthropic, make_message
+
+
+def echo_registry():
+    registry = ToolRegistry()
+    registry.add(lambda text: text, "echo", "Echo the text back.", {"type": "object", "properties": {}})
+    return registry
+
+
+def tool_turn(kwargs):
+    if kwargs.get("tool_choice") == {"type": "none"}:
+        return make_message("Answer from what the tools returned.")
+    block = ToolUseBlock(type="tool_use", id=f"toolu_{len(kwargs['messages'])}", name="echo", input={"text": "hi"})
+    return make_message(content=[block], stop_reason="tool_use")
+
+
+def test_run_agent_stops_when_the_model_ends_its_turn():
+    client = FakeAnthropic(lambda kwargs: "done", latency=0)
+    messages = [{"role": "user", "content": "question"}]
+
+    response, steps = run_agent(client, "fake", messages, echo_registry())
+
+    assert response.content[0].text == "done"
+    assert len(steps) == 1 and "final" not in steps[0]
+    assert client.calls == 1
+
+
+def test_run_agent_asks_for_text_once_the_step_budget_runs_out():
+    client = FakeAnthropic(tool_turn, latency=0)
+    messages = [{"role": "user", "content": "question"}]
+
+    response, steps = run_agent(client, "fake", messages, echo_registry(), max_steps=2)
+
+    assert response.content[0].text == "Answer from what the tools returned."
+    assert [record.get("final", False) for record in steps] == [False, False, True]
+    assert steps[0]["tools"] == ["echo"]
+    assert messages[-1]["role"] == "assistant"
+
+
+def test_run_agent_asks_for_text_once_the_token_budget_runs_out():
+    client = FakeAnthropic(tool_turn, latency=0)
+    messages = [{"role": "user", "content": "question"}]
+
+    response, steps = run_agent(client, "fake", messages, echo_registry(), token_budget=1)
+
+    assert response.stop_reason == "end_turn"
+    assert len(steps) == 2 and steps[-1]["final"]
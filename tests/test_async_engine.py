@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+
+import async_engine
+from async_engine import EngineStats, RateLimiter, run_investigations, run_job
+from fake_llm import FakeAsyncAnthropic, api_error
+
+JOB = {"job_id": "job-1", "poi": "Jho Low", "prompt": "Who moved the money?", "emails": []}
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the engine's sleeps without waiting for them."""
+    recorded = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        recorded.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(async_engine.asyncio, "sleep", sleep)
+    return recorded
+
+
+def test_rate_limiter_waits_for_a_request_slot_and_settles_token_estimates(sleeps):
+    async def scenario():
+        limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000)
+        await limiter.acquire(400)
+        assert limiter.tokens == pytest.approx(600, abs=1)
+        # The response used fewer tokens than estimated, so the difference is returned to the bucket
+        limiter.settle(400, 100)
+        assert limiter.tokens == pytest.approx(900, abs=1)
+        limiter.requests = 0
+        await limiter.acquire(10)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert len(sleeps) >= 1 and sleeps[0] == pytest.approx(1.0, abs=0.05)
+    assert limiter.waited >= sleeps[0]
+
+
+def test_rate_limiter_caps_requests_larger_than_the_budget(sleeps):
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=100)
+    asyncio.run(limiter.acquire(10_000))
+    assert sleeps == [] and limiter.tokens == pytest.approx(0, abs=1)
+
+
+def test_rate_limited_requests_are_retried_after_retry_after(sleeps):
+    failures = [api_error(429, retry_after=30)]
+
+    def responder(kwargs):
+        if failures:
+            raise failures.pop()
+        return "done"
+
+    stats = EngineStats()
+    client = FakeAsyncAnthropic(responder, latency=0)
+    result = asyncio.run(run_job(JOB, client, RateLimiter(), stats))
+    assert (result["status"], result["text"], result["attempts"]) == ("ok", "done", 2)
+    assert stats.retries == 1 and client.calls == 2
+    assert 30 <= max(sleeps) <= 31
+
+
+def test_errors_that_are_not_retryable_fail_the_job_at_once(sleeps):
+    def responder(kwargs):
+        raise api_error(400)
+
+    stats = EngineStats()
+    result = asyncio.run(run_job(JOB, FakeAsyncAnthropic(responder, latency=0), RateLimiter(), stats))
+    assert (result["status"], result["attempts"], stats.failed) == ("error", 1, 1)
+
+
+def test_a_job_whose_emails_cannot_be_read_does_not_stop_the_batch(tmp_path, sleeps):
+    def emails_for(poi):
+        if poi == "Unknown":
+            raise KeyError(poi)
+        return []
+
+    jobs = [{**JOB, "job_id": f"job-{i}", "poi": poi} for i, poi in enumerate(["Jho Low", "Unknown", "Tim"])]
+    output = tmp_path / "results.jsonl"
+    stats = asyncio.run(
+        run_investigations(jobs, FakeAsyncAnthropic(latency=0), str(output), emails_for=emails_for, concurrency=2)
+    )
+    results = {result["job_id"]: result for result in map(json.loads, output.read_text().splitlines())}
+    assert {job_id: result["status"] for job_id, result in results.items()} == {
+        "job-0": "ok",
+        "job-1": "error",
+        "job-2": "ok",
+    }
+    assert results["job-1"]["attempts"] == 0
+    assert (stats.completed, stats.failed) == (2, 1)
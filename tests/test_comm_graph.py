@@ -0,0 +1,76 @@
+import pandas as pd
+
+from comm_graph import CommunicationGraph
+from schemas import InvestigationResults, SecondaryPOI
+
+EMAILS = [
+    {"sender": "Jho Low <jho@x.com>", "recipients": "Tim Leissner <tim@gs.com>", "date": "2012-03-01"},
+    {"sender": "tim@gs.com", "recipients": "jho@x.com", "cc": "Roger <roger@gs.com>", "date": "2012-03-02"},
+    {"sender": "jho@x.com", "recipients": "tim@gs.com, riza@x.com", "date": "2012-03-03"},
+    {"sender": "roger@gs.com", "recipients": "banker@aabar.com", "date": "2012-03-04"},
+]
+TRANSACTIONS = [{"sender": "Jho Low", "receiver": "Tim Leissner", "amount": 1_000_000.0}]
+
+
+def graph():
+    return CommunicationGraph.build(EMAILS, transactions=TRANSACTIONS)
+
+
+def test_recipient_display_names_map_to_their_addresses():
+    g = graph()
+    assert g.aliases["tim leissner"] == {"tim@gs.com"}
+    assert g.names["roger@gs.com"] == "Roger"
+
+
+def test_contacts_count_messages_and_transactions_both_ways():
+    [tim, riza] = graph().contacts("Jho Low")
+    assert (tim["address"], tim["sent"], tim["received"]) == ("tim@gs.com", 2, 1)
+    # The payment to "Tim Leissner" resolves through his display name rather than becoming its own node
+    assert (tim["transactions"], tim["volume"]) == (1, 1_000_000.0)
+    assert tim["first_contact"].startswith("2012-03-01") and tim["last_contact"].startswith("2012-03-03")
+    assert (riza["address"], riza["sent"], riza["received"], riza["transactions"]) == ("riza@x.com", 1, 0, 0)
+
+
+def test_k_hop():
+    assert graph().k_hop("jho@x.com", k=2) == {"tim@gs.com": 1, "riza@x.com": 1, "roger@gs.com": 2}
+    assert graph().k_hop("Jho Low", k=3)["banker@aabar.com"] == 3
+
+
+def test_validate_secondary_poi():
+    named = [
+        SecondaryPOI(name="Tim Leissner", email_address="", description="", reasoning="", references=[]),
+        SecondaryPOI(name="Najib", email_address="najib@gov.my", description="", reasoning="", references=[]),
+    ]
+    validation = graph().validate_secondary_poi(InvestigationResults(secondary_poi=named), "Jho Low")
+    assert validation["confirmed"] == [{"name": "Tim Leissner", "hops": 1}]
+    assert validation["unconnected"] == ["Najib"]
+    assert [contact["address"] for contact in validation["missed"]] == ["riza@x.com"]
+
+
+def test_load_or_build_rebuilds_when_inputs_change(tmp_path):
+    path = str(tmp_path / "emails.csv")
+    pd.DataFrame(EMAILS).to_csv(path, index=False)
+    graph_path = str(tmp_path / "emails.graph.pkl")
+    descriptions = [{"participant": "Riza Aziz", "email_address": "riza@x.com"}]
+    assert "riza aziz" not in CommunicationGraph.load_or_build(path, graph_path=graph_path).aliases
+    assert "riza aziz" in CommunicationGraph.load_or_build(path, descriptions, graph_path=graph_path).aliases
+    with_transactions = CommunicationGraph.load_or_build(path, descriptions, TRANSACTIONS, graph_path=graph_path)
+    assert with_transactions.contacts("jho@x.com")[0]["transactions"] == 1
+
+
+def test_load_or_build_only_reads_transactions_when_the_key_changes(tmp_path):
+    path = str(tmp_path / "emails.csv")
+    pd.DataFrame(EMAILS).to_csv(path, index=False)
+    reads = []
+
+    def transactions():
+        reads.append(1)
+        yield from TRANSACTIONS
+
+    first = CommunicationGraph.load_or_build(path, transactions=transactions(), transactions_key=1)
+    cached = CommunicationGraph.load_or_build(path, transactions=transactions(), transactions_key=1)
+    rebuilt = CommunicationGraph.load_or_build(path, transactions=transactions(), transactions_key=2)
+
+    assert len(reads) == 2
+    assert first.contacts("Jho Low")[0]["volume"] == cached.contacts("Jho Low")[0]["volume"] == 1_000_000.0
+    assert len(rebuilt) == len(first)
@@ -0,0 +1,81 @@
+import pyarrow as pa
+import pytest
+
+from email_dedup import assign_threads, clean_bodies, collapse_emails, format_report, is_forward, thread_key
+
+BODY = "Approved, send it. The wire goes out through the usual account on Friday morning."
+
+
+def email(email_id, sender, recipients, subject, date, body=BODY):
+    return {
+        "email_id": email_id,
+        "sender": sender,
+        "recipients": recipients,
+        "subject": subject,
+        "date": date,
+        "body": body,
+    }
+
+
+def test_copies_of_one_message_collapse_into_the_earliest():
+    emails = [
+        email("EMAIL_2", "jho@x.com", "riza@x.com", "Wire", "2012-03-01 10:00", BODY + "\n--\nriza"),
+        email("EMAIL_3", "jho@x.com", "tim@gs.com", "Wire", "2012-03-01 10:00", BODY + "\n--\ntim"),
+    ]
+    reduced, report = collapse_emails(emails)
+    [kept] = reduced
+    assert kept["email_id"] == "EMAIL_2"
+    assert kept["aliases"] == ["EMAIL_3"]
+    assert kept["recipients"] == "riza@x.com, tim@gs.com"
+    assert (report["kept"], report["duplicates_collapsed"]) == (1, 1)
+
+
+def test_same_body_from_different_people_is_kept():
+    emails = [
+        email("EMAIL_2", "jho@x.com", "riza@x.com", "Lunch", "2012-03-01 10:00"),
+        email("EMAIL_3", "tim@gs.com", "jho@x.com", "Wire to Aabar", "2012-03-02 09:00"),
+    ]
+    reduced, _ = collapse_emails(emails)
+    assert [e["email_id"] for e in reduced] == ["EMAIL_2", "EMAIL_3"]
+    assert all("aliases" not in e for e in reduced)
+
+
+def test_empty_mailbox():
+    reduced, report = collapse_emails([])
+    assert reduced == [] and report["emails"] == 0
+    assert "0 emails" in format_report(report)
+
+
+def test_clean_bodies_strips_quoted_history_and_signatures():
+    body = "Send it today.\n\nOn Mon, Jho wrote:\n> old text\n> more"
+    [cleaned] = clean_bodies(pa.array([body + "\n--\nTim"])).to_pylist()
+    assert cleaned == "Send it today."
+
+
+def test_forwards_keep_the_forwarded_message():
+    outlook = "From: Tim Leissner\nSent: Monday, March 5, 2012 9:00 AM\nTo: Jho Low\nSubject: {}\n\nWire $5m to Aabar."
+    emails = [
+        email("EMAIL_2", "jho@x.com", "riza@x.com", "FW: Aabar", "2012-03-05", "FYI\n" + outlook.format("Aabar")),
+        email("EMAIL_3", "jho@x.com", "tim@gs.com", "RE: Aabar", "2012-03-05", "Done.\n" + outlook.format("Aabar")),
+    ]
+    forward, reply = collapse_emails(emails)[0]
+    assert forward["body"].endswith("Wire $5m to Aabar.")
+    assert reply["body"] == "Done."
+    assert is_forward(pa.array(["Fwd: x", "Re: FW: x", "RE: x", None])).to_pylist() == [True, True, False, False]
+
+
+def test_list_input_needs_corpus_email_ids():
+    emails = [email("EMAIL_7", "jho@x.com", "tim@gs.com", "Wire", "2012-03-01"), {"body": BODY, "subject": "Wire"}]
+    with pytest.raises(ValueError, match=r"positions \[1\]"):
+        collapse_emails(emails)
+
+
+def test_threads_follow_subjects_without_prefixes():
+    assert thread_key("RE: Fwd: Wire") == thread_key("wire")
+    emails = [
+        email("EMAIL_2", "jho@x.com", "tim@gs.com", "Wire", "2012-03-01"),
+        email("EMAIL_3", "tim@gs.com", "jho@x.com", "Re: Wire", "2012-03-02"),
+        email("EMAIL_4", "jho@x.com", "tim@gs.com", "Wire", "2013-01-01"),
+    ]
+    threads = assign_threads(emails)
+    assert threads[0] == threads[1] != threads[2]
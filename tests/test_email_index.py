@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from email_index import ParticipantIndex, email_addresses, parse_addresses
+
+EMAILS = [
+    {"sender": "Jho Low <JHO@x.com>", "recipients": "tim@gs.com"},
+    {"sender": "tim@gs.com", "recipients": "jho@x.com", "cc": "Roger Ng <roger@gs.com>"},
+    {"sender": "riza@x.com", "recipients": "jho@x.com, tim@gs.com", "bcc": float("nan")},
+]
+DESCRIPTIONS = [{"participant": "Riza Aziz", "email_address": "riza@x.com"}]
+
+
+def test_parse_addresses():
+    assert parse_addresses('"Low, Jho" <JHO@x.com>, tim@gs.com') == [("Low, Jho", "jho@x.com"), ("", "tim@gs.com")]
+    assert parse_addresses(float("nan")) == [] and parse_addresses(None) == []
+    assert email_addresses(EMAILS[1]) == {"tim@gs.com", "jho@x.com", "roger@gs.com"}
+
+
+def test_queries():
+    index = ParticipantIndex.build(EMAILS, DESCRIPTIONS)
+    assert index.emails_involving("Jho Low").tolist() == [0, 1, 2]
+    assert index.emails_sent_by("jho@x.com").tolist() == [0]
+    assert index.emails_involving("Riza Aziz").tolist() == [2]
+    assert index.emails_involving_any(["roger ng", "riza@x.com"]).tolist() == [1, 2]
+    assert index.emails_involving_all(["jho@x.com", "tim@gs.com", "riza@x.com"]).tolist() == [2]
+    assert index.emails_between("jho@x.com", "tim@gs.com").tolist() == [0, 1]
+    assert index.emails_involving("nobody@x.com").tolist() == []
+
+
+def test_all_of_no_one_is_empty():
+    result = ParticipantIndex.build(EMAILS).emails_involving_all([])
+    assert result.dtype == np.int64 and len(result) == 0
+
+
+def test_load_or_build_rebuilds_when_descriptions_change(tmp_path):
+    path = str(tmp_path / "emails.csv")
+    pd.DataFrame(EMAILS).to_csv(path, index=False)
+    assert ParticipantIndex.load_or_build(path, DESCRIPTIONS).resolve("Riza Aziz") == {"riza@x.com"}
+    renamed = [{"participant": "Riza", "email_address": "riza@x.com"}]
+    index = ParticipantIndex.load_or_build(path, renamed)
+    assert index.resolve("Riza Aziz") == set() and index.resolve("Riza") == {"riza@x.com"}
+    assert os.path.exists(str(tmp_path / "emails.participants.pkl"))
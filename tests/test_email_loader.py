@@ -0,0 +1,45 @@
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from email_loader import convert_to_parquet, iter_email_chunks, iter_emails
+
+ROWS = [
+    {
+        "email_id": f"EMAIL_{i + 2}",
+        "sender": f"person{i % 3}@x.com",
+        # Empty in the first chunk, then text
+        "attachments": None if i < 15 else f"file{i}.pdf",
+        # Whole numbers in the first chunks, then fractions
+        "score": float(i) if i < 25 else i + 0.5,
+        # Numbers, then text
+        "note": str(i) if i < 30 else "see attached",
+        "body": f"Body of email {i}",
+    }
+    for i in range(40)
+]
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / "emails.csv")
+    pd.DataFrame(ROWS).to_csv(path, index=False)
+    return path
+
+
+def test_conversion_widens_columns_whose_type_changes_between_chunks(csv_path):
+    path = convert_to_parquet(csv_path, chunksize=10)
+    schema = pq.read_schema(path)
+    assert "string" in str(schema.field("attachments").type) and "string" in str(schema.field("note").type)
+    emails = list(iter_emails(path))
+    assert len(emails) == 40
+    assert emails[0]["attachments"] is None and emails[-1]["attachments"] == "file39.pdf"
+    assert (emails[0]["score"], emails[-1]["score"]) == (0.0, 39.5)
+    assert (emails[0]["note"], emails[-1]["note"]) == ("0", "see attached")
+
+
+def test_chunks_and_column_selection(csv_path):
+    chunks = list(iter_email_chunks(csv_path, columns=["sender", "missing"], chunksize=16))
+    assert [len(chunk) for chunk in chunks] == [16, 16, 8]
+    assert chunks[0][0] == {"sender": "person0@x.com"}
+
@@ -0,0 +1,64 @@
+import pandas as pd
+
+import email_parser
+from email_parser import email_bodies, parse_dates, parse_emails
+
+MESSAGE = (
+    "Message-ID: <1.JavaMail@thyme>\r\n"
+    "Date: Mon, 14 May 2001 16:39:00 -0700 (PDT)\r\n"
+    'From: "Allen, Phillip" <phillip.allen@enron.com>\r\n'
+    "To: john.arnold@enron.com,\r\n"
+    "\tSally Beck <sally.beck@enron.com>\r\n"
+    "Cc: kay.mann@enron.com\r\n"
+    "References: <0.JavaMail@thyme> <00.JavaMail@thyme>\r\n"
+    "Subject: Re: gas deal\r\n"
+    "\r\n"
+    "Please review the attached, café.\r\n\r\n"
+)
+
+
+def test_headers_and_addresses():
+    [row] = parse_emails([MESSAGE]).to_dict(orient="records")
+    assert row["sender"] == "phillip.allen@enron.com"
+    assert row["receivers"] == ["john.arnold@enron.com", "sally.beck@enron.com"]
+    assert (row["cc"], row["bcc"]) == (["kay.mann@enron.com"], [])
+    assert row["subject"] == "Re: gas deal"
+    assert (row["message_id"], row["in_reply_to"]) == ("1.JavaMail@thyme", None)
+    assert row["references"] == ["0.JavaMail@thyme", "00.JavaMail@thyme"]
+    assert row["timestamp"] == pd.Timestamp("2001-05-14 23:39:00", tz="UTC")
+
+
+def test_body_offsets_count_characters():
+    messages = [MESSAGE, "Subject: no body", ""]
+    assert email_bodies(messages, parse_emails(messages)) == ["Please review the attached, café.", "", ""]
+
+
+def test_missing_fields_are_none_not_nan():
+    [row] = parse_emails(["X-Mailer: test\n\nbody"]).to_dict(orient="records")
+    assert row["sender"] is None and row["subject"] is None and row["message_id"] is None
+    assert row["receivers"] == [] and pd.isna(row["timestamp"])
+
+
+def test_first_header_wins_and_unparseable_senders_are_kept():
+    message = "From: undisclosed\nfrom: b@x.com\nSubject: one\nSubject: two\n\n"
+    [row] = parse_emails([message]).to_dict(orient="records")
+    assert (row["sender"], row["subject"]) == ("undisclosed", "one")
+
+
+def test_parse_dates_falls_back_to_other_formats():
+    parsed = parse_dates(pd.Series(["Fri, 4 May 2001 13:51:00 -0700 (PDT)", "2001-05-14 16:39:00", "soon", None]))
+    assert parsed.iloc[0] == pd.Timestamp("2001-05-04 20:51:00", tz="UTC")
+    assert parsed.iloc[1] == pd.Timestamp("2001-05-14 16:39:00", tz="UTC")
+    assert parsed.iloc[2:].isna().all()
+
+
+def test_process_pool_matches_a_single_process(monkeypatch):
+    monkeypatch.setattr(email_parser, "PARALLEL_THRESHOLD", 0)
+    messages = [MESSAGE.replace("gas deal", f"deal {i}") for i in range(50)]
+    pooled = parse_emails(messages, processes=2, chunksize=10)
+    single = parse_emails(messages, processes=1)
+    assert pooled.equals(single)
+
+
+def test_no_messages():
+    assert parse_emails([]).empty
@@ -0,0 +1,30 @@
+import pandas as pd
+import pytest
+
+from email_store import EmailStore
+
+ROWS = [
+    {
+        "email_id": f"EMAIL_{i + 2}",
+        "sender": f"person{i % 3}@x.com",
+        "attachments": None if i < 15 else f"file{i}.pdf",
+        "body": f"Body of email {i}",
+    }
+    for i in range(40)
+]
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / "emails.csv")
+    pd.DataFrame(ROWS).to_csv(path, index=False)
+    return path
+
+
+def test_email_store_round_trip(csv_path):
+    store = EmailStore.load(csv_path)
+    assert len(store) == 40
+    assert store[3]["sender"] == "person0@x.com" and store[3]["email_id"] == "EMAIL_5"
+    subset = store[[5, 1]]
+    assert [dict(email)["body"] for email in subset] == ["Body of email 5", "Body of email 1"]
+    assert store[0].get("attachments") is None
@@ -0,0 +1,90 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+from embedding_cache import CachedEmbedder, EmbeddingCache, get_cache
+from fake_llm import FakeEmbedder
+
+DIMENSION = 4
+
+
+def open_cache(tmp_path, capacity):
+    return EmbeddingCache("fake", DIMENSION, cache_dir=str(tmp_path), max_bytes=capacity * DIMENSION * 4)
+
+
+def vector(text):
+    return np.full(DIMENSION, float(sum(map(ord, text))), dtype=np.float32)
+
+
+def test_round_trip_and_misses(tmp_path):
+    cache = open_cache(tmp_path, 10)
+    cache.put_many(["a", "b"], [vector("a"), vector("b")])
+    a, missing, b = cache.get_many(["a", "c", "b"])
+    assert np.array_equal(a, vector("a")) and np.array_equal(b, vector("b")) and missing is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_full_cache_evicts_the_least_recently_used(tmp_path):
+    cache = open_cache(tmp_path, 3)
+    cache.put_many(["a", "b", "c"], [vector(t) for t in "abc"])
+    cache.get_many(["a"])
+    cache.put_many(["d"], [vector("d")])
+    assert len(cache) == 3
+    assert cache.get_many(["b"]) == [None]
+    assert all(found is not None for found in cache.get_many(["a", "c", "d"]))
+
+
+def test_entries_never_share_a_slot(tmp_path):
+    cache = open_cache(tmp_path, 5)
+    rng = random.Random(0)
+    for _ in range(200):
+        # Re-putting cached texts next to new ones made evictions free slots still in use
+        texts = rng.sample([f"text {i}" for i in range(12)], rng.randint(1, 6))
+        cache.put_many(texts, [vector(text) for text in texts])
+        for text, found in zip(texts, cache.get_many(texts)):
+            assert found is None or np.array_equal(found, vector(text))
+    slots = [slot for (slot,) in cache.conn.execute("SELECT slot FROM entries")]
+    assert len(slots) == len(set(slots)) <= 5
+
+
+def test_reopening_with_another_size_keeps_the_entries_that_fit(tmp_path):
+    texts = [f"text {i}" for i in range(8)]
+    open_cache(tmp_path, 8).put_many(texts, [vector(text) for text in texts])
+    smaller = open_cache(tmp_path, 4)
+    assert smaller.vectors.shape == (4, DIMENSION)
+    found = smaller.get_many(texts)
+    assert sum(vector is not None for vector in found) == 4
+    assert all(v is None or np.array_equal(v, vector(text)) for text, v in zip(texts, found))
+    larger = open_cache(tmp_path, 16)
+    assert larger.vectors.shape == (16, DIMENSION) and len(larger) == 4
+
+
+def test_entries_whose_vectors_are_missing_are_dropped(tmp_path):
+    cache = open_cache(tmp_path, 10)
+    cache.put_many(["a", "b", "c"], [vector("a"), vector("b"), vector("c")])
+    path = str(tmp_path / f"fake-{DIMENSION}.f32")
+    # Truncated after two rows: the third entry's vector is gone
+    with open(path, "r+b") as f:
+        f.truncate(2 * DIMENSION * 4 + 3)
+    reopened = open_cache(tmp_path, 10)
+    assert len(reopened) == 2 and sum(v is not None for v in reopened.get_many(["a", "b", "c"])) == 2
+    os.remove(path)
+    assert len(open_cache(tmp_path, 10)) == 0
+
+
+def test_unknown_models_need_a_dimension(tmp_path):
+    with pytest.raises(ValueError, match="not-a-model"):
+        get_cache("not-a-model", cache_dir=str(tmp_path))
+
+
+def test_cached_embedder_only_embeds_misses(tmp_path):
+    fake = FakeEmbedder(DIMENSION)
+    embed = CachedEmbedder(fake, open_cache(tmp_path, 10))
+    first = embed(["a", "b", "a"])
+    second = embed(["b", "c"])
+    assert fake.calls == 2
+    # Cached vectors come back as float32
+    assert np.allclose(first[1], second[0])
+    assert np.allclose(second, fake(["b", "c"]))
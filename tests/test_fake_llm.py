@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import anthropic
+import pytest
+from anthropic.types import ToolUseBlock
+
+from fake_llm import (
+    DEFAULT_REPLY,
+    FakeAnthropic,
+    FakeAsyncAnthropic,
+    FakeEmbedder,
+    RecordingAnthropic,
+    ReplayAnthropic,
+    make_message,
+    message_events,
+)
+from schemas import InvestigationResults
+
+REQUEST = {"model": "fake-claude", "max_tokens": 100, "messages": [{"role": "user", "content": "Who is Jho Low?"}]}
+
+
+def test_fake_anthropic_returns_an_empty_investigation_by_default():
+    client = FakeAnthropic(latency=0)
+    message = client.messages.create(**REQUEST)
+    assert InvestigationResults.model_validate_json(message.content[0].text) == InvestigationResults()
+    assert message.usage.input_tokens > 0
+    assert client.calls == 1
+
+
+def test_fake_anthropic_enforces_its_request_limit():
+    client = FakeAnthropic(latency=0, requests_per_minute=2)
+    client.messages.create(**REQUEST)
+    client.messages.create(**REQUEST)
+    with pytest.raises(anthropic.RateLimitError) as raised:
+        client.messages.create(**REQUEST)
+    assert float(raised.value.response.headers["retry-after"]) > 0
+    assert client.rejected == 1
+
+
+def test_fake_anthropic_can_be_overloaded():
+    with pytest.raises(anthropic.InternalServerError):
+        FakeAnthropic(latency=0, overloaded_rate=1.0).messages.create(**REQUEST)
+
+
+def test_streamed_events_rebuild_the_reply():
+    client = FakeAnthropic(responder=lambda kwargs: "x" * 50, latency=0)
+    events = list(client.messages.create(stream=True, **REQUEST))
+    assert events[0].type == "message_start" and events[-1].type == "message_stop"
+    assert "".join(event.delta.text for event in events if event.type == "content_block_delta") == "x" * 50
+
+
+def test_tool_use_streams_as_partial_json():
+    block = ToolUseBlock(type="tool_use", id="toolu_fake", name="record", input={"key_events": []})
+    events = message_events(make_message(content=[block]))
+    deltas = [event.delta.partial_json for event in events if event.type == "content_block_delta"]
+    assert json.loads("".join(deltas)) == {"key_events": []}
+
+
+def test_replay_serves_recorded_responses(tmp_path):
+    path = str(tmp_path / "recorded.jsonl")
+    recorder = RecordingAnthropic(FakeAnthropic(responder=lambda kwargs: "recorded answer", latency=0), path)
+    recorded = recorder.messages.create(**REQUEST)
+
+    replay = ReplayAnthropic(path, strict=True, latency=0)
+    assert replay.messages.create(**REQUEST) == recorded
+    # Streaming the same request replays it too
+    streamed = list(replay.messages.create(stream=True, **REQUEST))
+    assert "".join(event.delta.text for event in streamed if event.type == "content_block_delta") == "recorded answer"
+    assert replay.replayed == 2
+    with pytest.raises(KeyError):
+        replay.messages.create(**{**REQUEST, "max_tokens": 200})
+
+
+def test_replay_falls_back_to_the_default_reply(tmp_path):
+    replay = ReplayAnthropic(str(tmp_path / "missing.jsonl"), latency=0)
+    assert replay.messages.create(**REQUEST).content[0].text == DEFAULT_REPLY
+    assert replay.replayed == 0
+
+
+def test_fake_async_anthropic():
+    async def ask():
+        client = FakeAsyncAnthropic(latency=0)
+        return await asyncio.gather(*(client.messages.create(**REQUEST) for _ in range(3)))
+
+    assert [message.content[0].text for message in asyncio.run(ask())] == [DEFAULT_REPLY] * 3
+
+
+def test_fake_embedder_is_deterministic_and_normalized():
+    embedder = FakeEmbedder(dimensions=8)
+    first, second, again = embedder(["wire", "transfer", "wire"])
+    assert first == again and first != second
+    assert sum(value * value for value in first) == pytest.approx(1.0)
+    assert embedder.calls == 1
@@ -0,0 +1,140 @@
+import httpx
+import openai
+import pytest
+from qdrant_client import QdrantClient, models
+
+import utils
+from fake_llm import FakeEmbedder
+from ingest import MAX_INPUT_TOKENS, batch_by_tokens, ingest
+from utils import count_tokens, retry_with_backoff
+
+DIMENSIONS = 16
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Backoff delays requested by the code under test, recorded instead of slept.
+    """
+    delays = []
+    monkeypatch.setattr(utils.time, "sleep", delays.append)
+    return delays
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    return openai.RateLimitError("Rate limit reached", response=httpx.Response(429, request=request), body=None)
+
+
+class Flaky:
+    """
+    Raises error for the first failures calls, then delegates to fn.
+    """
+
+    def __init__(self, fn, failures, error):
+        self.fn = fn
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error()
+        return self.fn(*args)
+
+
+def documents(count):
+    return [{"id": i + 1, "text": f"email {i} about the wire transfer", "payload": {"n": i}} for i in range(count)]
+
+
+def test_retry_with_backoff_retries_until_success(sleeps):
+    fn = Flaky(lambda: "ok", failures=2, error=rate_limit_error)
+    retries = []
+    assert retry_with_backoff(fn, openai.RateLimitError, on_retry=lambda error, delay: retries.append(delay)) == "ok"
+    assert fn.calls == 3
+    assert retries == sleeps
+    # Jittered exponential backoff: half to all of 1s, then of 2s
+    assert 0.5 <= sleeps[0] <= 1.0 and 1.0 <= sleeps[1] <= 2.0
+
+
+def test_retry_with_backoff_caps_the_delay(sleeps):
+    fn = Flaky(lambda: "ok", failures=4, error=rate_limit_error)
+    retry_with_backoff(fn, openai.RateLimitError, base_delay=1.0, max_delay=3.0)
+    assert max(sleeps) <= 3.0
+
+
+def test_retry_with_backoff_gives_up_after_max_retries(sleeps):
+    fn = Flaky(lambda: "ok", failures=10, error=rate_limit_error)
+    with pytest.raises(openai.RateLimitError):
+        retry_with_backoff(fn, openai.RateLimitError, max_retries=2)
+    assert fn.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_retry_with_backoff_does_not_retry_other_errors(sleeps):
+    fn = Flaky(lambda: "ok", failures=1, error=ValueError)
+    with pytest.raises(ValueError):
+        retry_with_backoff(fn, openai.RateLimitError)
+    assert fn.calls == 1
+    assert sleeps == []
+
+
+def test_batch_by_tokens_bounds_items_and_tokens():
+    docs = documents(25)
+    per_doc = count_tokens(docs[0]["text"])
+    batches = list(batch_by_tokens(docs, max_batch_tokens=per_doc * 4, max_batch_items=3))
+    assert [doc for batch, _ in batches for doc in batch] == docs
+    assert all(len(batch) <= 3 for batch, _ in batches)
+    assert all(tokens <= per_doc * 4 for _, tokens in batches)
+    assert sum(tokens for _, tokens in batches) == sum(count_tokens(doc["text"]) for doc in docs)
+
+
+def test_batch_by_tokens_gives_an_oversized_document_its_own_batch():
+    docs = documents(3)
+    docs[1] = {**docs[1], "text": "word " * 100}
+    batches = [batch for batch, _ in batch_by_tokens(docs, max_batch_tokens=20)]
+    assert [len(batch) for batch in batches] == [1, 1, 1]
+
+
+def test_batch_by_tokens_truncates_texts_over_the_model_limit():
+    text = "token " * (MAX_INPUT_TOKENS * 2)
+    [(batch, tokens)] = batch_by_tokens([{"text": text, "payload": {}}])
+    assert tokens == MAX_INPUT_TOKENS
+    assert len(batch[0]["text"]) < len(text)
+
+
+def memory_qdrant():
+    qdrant = QdrantClient(":memory:")
+    vectors = models.VectorParams(size=DIMENSIONS, distance=models.Distance.COSINE)
+    qdrant.create_collection("docs", vectors_config=vectors)
+    return qdrant
+
+
+def test_ingest_stores_every_document_in_batches():
+    qdrant, embedder, acknowledged = memory_qdrant(), FakeEmbedder(DIMENSIONS), []
+    stats = ingest(
+        documents(50),
+        embedder,
+        qdrant,
+        "docs",
+        max_batch_items=8,
+        concurrency=3,
+        upsert_batch_size=10,
+        on_upsert=acknowledged.extend,
+    )
+    assert (stats.docs, stats.batches, stats.upserts, stats.retries) == (50, 7, 5, 0)
+    assert embedder.calls == 7
+    assert sorted(acknowledged) == list(range(1, 51))
+    assert qdrant.count("docs").count == 50
+    [hit] = qdrant.query_points("docs", query=embedder(["email 7 about the wire transfer"])[0], limit=1).points
+    assert hit.payload == {"n": 7}
+
+
+def test_ingest_retries_rate_limited_embedding_requests(sleeps):
+    qdrant = memory_qdrant()
+    embedder = Flaky(FakeEmbedder(DIMENSIONS), failures=1, error=rate_limit_error)
+    stats = ingest(documents(10), embedder, qdrant, "docs", max_batch_items=5, concurrency=1)
+    assert stats.retries == 1
+    assert qdrant.count("docs").count == 10
+    assert "docs/sec" in stats.report()
@@ -0,0 +1,70 @@
+import pytest
+from qdrant_client import QdrantClient, models
+
+from fake_llm import FakeEmbedder
+from manifest import IndexManifest, document_id, sync
+
+DIMENSIONS = 16
+ONE_BATCH_AT_A_TIME = {"max_batch_items": 4, "upsert_batch_size": 4, "concurrency": 1}
+
+
+def documents(count, prefix="email"):
+    return [{"text": f"{prefix} {i} about the wire transfer", "payload": {"n": i}} for i in range(count)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    qdrant = QdrantClient(":memory:")
+    vectors = models.VectorParams(size=DIMENSIONS, distance=models.Distance.COSINE)
+    qdrant.create_collection("docs", vectors_config=vectors)
+    return qdrant, IndexManifest(str(tmp_path / "manifest.sqlite"))
+
+
+class CountingEmbedder(FakeEmbedder):
+    def __init__(self):
+        super().__init__(DIMENSIONS)
+        self.texts = 0
+
+    def __call__(self, texts):
+        self.texts += len(texts)
+        return super().__call__(texts)
+
+
+def test_document_ids_ignore_cosmetic_whitespace_but_not_content():
+    document = {"text": "Wire the  funds\ttoday.", "payload": {"sender": "jho@x.com", "n": 1}}
+    reformatted = {"text": " Wire the funds today.\n", "payload": {"n": 1, "sender": "jho@x.com"}}
+    assert document_id(document) == document_id(reformatted)
+    assert document_id(document) != document_id({**document, "text": "Wire the funds tomorrow."})
+    assert document_id(document) != document_id({**document, "payload": {"sender": "tim@gs.com", "n": 1}})
+
+
+def test_sync_skips_unchanged_documents_and_deletes_removed_ones(store):
+    qdrant, manifest = store
+    embedder = CountingEmbedder()
+    sync(documents(10), embedder, qdrant, "docs", manifest)
+
+    stats = sync(documents(8) + documents(1, prefix="new"), embedder, qdrant, "docs", manifest)
+    assert (stats.skipped, stats.deleted, embedder.texts) == (8, 2, 11)
+    assert qdrant.count("docs").count == 9 == len(manifest.ids("docs"))
+
+
+def test_sync_resumes_after_an_interrupted_run(store):
+    qdrant, manifest = store
+
+    class Interrupted(Exception):
+        pass
+
+    def failing_embedder(texts, embedder=CountingEmbedder()):
+        # The second batch never makes it: the run crashes after the first was acknowledged
+        if embedder.texts:
+            raise Interrupted
+        return embedder(texts)
+
+    with pytest.raises(Interrupted):
+        sync(documents(10), failing_embedder, qdrant, "docs", manifest, **ONE_BATCH_AT_A_TIME)
+    assert len(manifest.ids("docs")) == 4
+
+    embedder = CountingEmbedder()
+    stats = sync(documents(10), embedder, qdrant, "docs", manifest, **ONE_BATCH_AT_A_TIME)
+    assert (stats.skipped, embedder.texts) == (4, 6)
+    assert qdrant.count("docs").count == 10 == len(manifest.ids("docs"))
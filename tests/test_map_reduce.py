@@ -0,0 +1,130 @@
+import random
+import time
+
+from anthropic.types import ToolUseBlock
+
+from fake_llm import FakeAnthropic, make_message
+from map_reduce import RESULTS_TOOL, AnthropicExtractor, batch_emails, merge_results, run_map_reduce
+from prompt_builder import format_emails
+from schemas import Entity, InvestigationResults, KeyEvent, Reference, SecondaryPOI
+from utils import count_tokens
+
+
+def reference(email_id, quotes="Approved, send it."):
+    return Reference(email_id=email_id, email_subject="Wire", quotes=quotes, description="Approves the wire")
+
+
+def poi(name, address, *email_ids):
+    references = [reference(email_id) for email_id in email_ids]
+    return SecondaryPOI(name=name, email_address=address, description="", reasoning="", references=references)
+
+
+def emails(count):
+    return [
+        {
+            "email_id": f"EMAIL_{i + 2}",
+            "date": f"2012-03-{i % 28 + 1:02d} 10:00:00",
+            "sender": "jho.low@example.com",
+            "recipients": f"banker{i % 5}@example.com",
+            "subject": f"Transfer {i}",
+            "body": f"Please wire tranche {i} through the usual account. " * 5,
+        }
+        for i in range(count)
+    ]
+
+
+def test_merge_results_deduplicates_items_and_references():
+    first = InvestigationResults(secondary_poi=[poi("Tim Leissner", "tim@gs.com", "EMAIL_2", "EMAIL_3")])
+    second = InvestigationResults(
+        secondary_poi=[poi("Tim", " TIM@gs.com ", "EMAIL_3", "EMAIL_4"), poi("Riza", "riza@example.com", "EMAIL_5")]
+    )
+    merged = merge_results([first, second])
+    assert [p.name for p in merged.secondary_poi] == ["Tim Leissner", "Riza"]
+    assert [r.email_id for r in merged.secondary_poi[0].references] == ["EMAIL_2", "EMAIL_3", "EMAIL_4"]
+
+
+def test_merge_results_matches_each_section_on_its_own_key():
+    event = KeyEvent(event="Wire to Aabar", date="2012-03-01", location="", references=[reference("EMAIL_2")])
+    entity = Entity(name="Aabar", type="company", description="", references=[reference("EMAIL_2")])
+    partials = [
+        InvestigationResults(key_events=[event], entities_of_note=[entity]),
+        InvestigationResults(
+            key_events=[event.model_copy(update={"date": "2012-03-02"})],
+            entities_of_note=[entity.model_copy(update={"name": "AABAR", "references": [reference("EMAIL_9")]})],
+        ),
+    ]
+    merged = merge_results(partials)
+    assert [e.date for e in merged.key_events] == ["2012-03-01", "2012-03-02"]
+    [aabar] = merged.entities_of_note
+    assert [r.email_id for r in aabar.references] == ["EMAIL_2", "EMAIL_9"]
+
+
+def test_merge_results_does_not_modify_its_inputs():
+    partial = InvestigationResults(secondary_poi=[poi("Tim", "tim@gs.com", "EMAIL_2")])
+    merge_results([partial, InvestigationResults(secondary_poi=[poi("Tim", "tim@gs.com", "EMAIL_3")])])
+    assert [r.email_id for r in partial.secondary_poi[0].references] == ["EMAIL_2"]
+
+
+def test_batch_emails_fits_the_budget_and_keeps_order():
+    mailbox = emails(40)
+    budget = count_tokens(format_emails(mailbox)) // 4
+    batches = batch_emails(mailbox, budget)
+    assert len(batches) > 1
+    assert [email for batch in batches for email in batch] == mailbox
+    assert all(count_tokens(format_emails(batch)) <= budget for batch in batches)
+
+
+def test_batch_emails_gives_an_oversized_email_its_own_batch():
+    mailbox = emails(3)
+    mailbox[1] = {**mailbox[1], "body": "tranche " * 2000}
+    assert [len(batch) for batch in batch_emails(mailbox, count_tokens(format_emails(mailbox[:1])) * 2)] == [1, 1, 1]
+
+
+def test_run_map_reduce_is_deterministic_whatever_finishes_first():
+    def extract(batch):
+        # Later batches tend to finish first
+        time.sleep(random.uniform(0, 0.02))
+        return InvestigationResults(secondary_poi=[poi("Banker", "banker0@example.com", batch[0]["email_id"])])
+
+    mailbox = emails(30)
+    budget = count_tokens(format_emails(mailbox)) // 6
+    first_ids = [batch[0]["email_id"] for batch in batch_emails(mailbox, budget)]
+    for _ in range(3):
+        merged = run_map_reduce(mailbox, extract, max_batch_tokens=budget, concurrency=4)
+        assert [r.email_id for r in merged.secondary_poi[0].references] == first_ids
+
+
+def test_anthropic_extractor_restores_short_ids_and_aliases():
+    finding = {"secondary_poi": [poi("Banker", "@P2", "#E2").model_dump()]}
+    finding["secondary_poi"][0]["references"][0]["quotes"] = "see #E2 via the P3 route"
+
+    def responder(kwargs):
+        assert kwargs["tool_choice"] == {"type": "tool", "name": RESULTS_TOOL["name"]}
+        block = ToolUseBlock(type="tool_use", id="toolu_fake", name=RESULTS_TOOL["name"], input=finding)
+        return make_message(content=[block], stop_reason="tool_use")
+
+    extractor = AnthropicExtractor(FakeAnthropic(responder, latency=0), "fake-claude", "Who moved the money?")
+    [found] = extractor(emails(2)).secondary_poi
+    assert found.email_address == "banker0@example.com"
+    assert found.references[0].email_id == "EMAIL_2"
+    assert found.references[0].quotes == "see #E2 via the P3 route"
+
+
+def test_anthropic_extractor_keeps_the_valid_findings_of_an_invalid_batch():
+    finding = {
+        "secondary_poi": [poi("Banker", "@P2", "#E2").model_dump(), {"name": "Missing every other field"}],
+        "key_events": "cut short by max_tokens",
+    }
+
+    def responder(kwargs):
+        block = ToolUseBlock(type="tool_use", id="toolu_fake", name=RESULTS_TOOL["name"], input=finding)
+        return make_message(content=[block], stop_reason="max_tokens")
+
+    extractor = AnthropicExtractor(FakeAnthropic(responder, latency=0), "fake-claude", "Who moved the money?")
+    results = extractor(emails(2))
+    [found] = results.secondary_poi
+    assert (found.email_address, found.references[0].email_id) == ("banker0@example.com", "EMAIL_2")
+    assert results.key_events == []
+    # Every batch fails validation the same way without failing the run
+    merged = run_map_reduce(emails(4), extractor, max_batch_tokens=count_tokens(format_emails(emails(2))))
+    assert len(merged.secondary_poi) == 4
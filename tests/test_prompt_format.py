@@ -0,0 +1,74 @@
+import pytest
+
+from prompt_format import CompactSerializer, JsonSerializer, get_serializer, restore_aliases
+from schemas import InvestigationResults
+
+EMAILS = [
+    {
+        "email_id": "EMAIL_12",
+        "date": "2012-03-01 14:05:33",
+        "sender": "Jho Low <jho.low@example.com>",
+        "recipients": "riza.aziz@example.com, tim@gs.com",
+        "cc": float("nan"),
+        "subject": "Transfer",
+        "body": "Please wire   the funds\nvia P3 route | today",
+    },
+    {
+        "email_id": "EMAIL_13",
+        "date": "2012-03-02 00:00:00",
+        "sender": "tim@gs.com",
+        "recipients": "jho.low@example.com",
+        "subject": "Re: Transfer",
+        "aliases": ["EMAIL_14"],
+        "body": "Done, see E12.",
+    },
+]
+
+
+def test_compact_layout():
+    lines = CompactSerializer()(EMAILS).splitlines()
+    assert lines[1] == "PEOPLE: @P1=Jho Low <jho.low@example.com>; @P2=riza.aziz@example.com; @P3=tim@gs.com"
+    assert lines[2] == "id|date|from|to|subject|aliases|body"
+    assert lines[3] == "#E12|2012-03-01 14:05|@P1|@P2,@P3|Transfer||Please wire the funds via P3 route | today"
+    assert lines[4] == "#E13|2012-03-02|@P3|@P1|Re: Transfer|#E14|Done, see E12."
+
+
+def test_restore_aliases_maps_short_forms_back_in_text():
+    reply = "@P3 confirmed #E12 and #E14 to @P1; @P9 and #E99 are unknown"
+    assert restore_aliases(reply, EMAILS) == (
+        "tim@gs.com confirmed EMAIL_12 and EMAIL_14 to jho.low@example.com; @P9 and #E99 are unknown"
+    )
+
+
+def test_restore_aliases_leaves_mail_text_and_quotes_alone():
+    reference = {"email_id": "#E12", "email_subject": "Transfer", "quotes": ["via @P3 route"], "description": ""}
+    results = InvestigationResults.model_validate(
+        {
+            "secondary_poi": [
+                {
+                    "name": "Tim",
+                    "email_address": "@P3",
+                    "description": "Moved funds via P3 route",
+                    "reasoning": "",
+                    "references": [reference],
+                }
+            ]
+        }
+    )
+    [poi] = restore_aliases(results, EMAILS).secondary_poi
+    assert poi.email_address == "tim@gs.com"
+    assert poi.description == "Moved funds via P3 route"
+    assert poi.references[0].email_id == "EMAIL_12"
+    assert poi.references[0].quotes == ["via @P3 route"]
+
+
+def test_json_layout_has_nothing_to_restore():
+    assert restore_aliases("@P1 #E12", EMAILS, serializer="json") == "@P1 #E12"
+    assert '"email_id": "EMAIL_12"' in JsonSerializer()(EMAILS)
+
+
+def test_get_serializer(monkeypatch):
+    monkeypatch.setenv("PROMPT_FORMAT", "json")
+    assert get_serializer().name == "json"
+    with pytest.raises(ValueError):
+        get_serializer("yaml")
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from qdrant_client import QdrantClient, models
+
+from qdrant_store import QUANTIZATION, create_collection, search, update_quantization
+
+
+class CollectionConfigs:
+    """Just enough of a Qdrant server client to hold a quantized collection's config."""
+
+    def __init__(self, quantization=None, on_disk=False):
+        self.quantization_config = QUANTIZATION[quantization]
+        self.on_disk = on_disk
+        self.updates = []
+        self.queries = []
+
+    def get_collection(self, collection_name):
+        vectors = SimpleNamespace(size=8, on_disk=self.on_disk)
+        return SimpleNamespace(
+            config=SimpleNamespace(params=SimpleNamespace(vectors=vectors), quantization_config=self.quantization_config)
+        )
+
+    def update_collection(self, collection_name, vectors_config, quantization_config):
+        self.updates.append(quantization_config)
+        self.quantization_config, self.on_disk = quantization_config, vectors_config[""].on_disk
+
+    def query_points(self, collection_name, **kwargs):
+        self.queries.append(kwargs)
+        return SimpleNamespace(points=[])
+
+
+def test_search_rescores_according_to_the_collection_quantization():
+    qdrant = CollectionConfigs("binary")
+    search(qdrant, "docs", [0.0] * 8, type="email")
+    params = qdrant.queries[0]["search_params"]
+    assert params.quantization.rescore and params.quantization.oversampling == 3.0
+
+
+def test_update_quantization_only_changes_a_collection_that_differs():
+    qdrant = CollectionConfigs("scalar")
+    assert not update_quantization(qdrant, "docs", "scalar")
+    assert update_quantization(qdrant, "docs", "binary", on_disk=True)
+    assert qdrant.updates == [QUANTIZATION["binary"]] and qdrant.on_disk
+    assert update_quantization(qdrant, "docs", None)
+    assert qdrant.updates[-1] == models.Disabled.DISABLED
+
+
+def test_search_on_an_unquantized_local_collection():
+    qdrant = QdrantClient(":memory:")
+    create_collection(qdrant, "docs", 2)
+    qdrant.upsert("docs", [models.PointStruct(id=1, vector=[1.0, 0.0], payload={"type": "email"})])
+    [hit] = search(qdrant, "docs", [1.0, 0.1], type="email")
+    assert hit.id == 1
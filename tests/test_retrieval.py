@@ -0,0 +1,21 @@
+from fake_llm import FakeEmbedder
+from retrieval import get_retriever, retrieve_relevant_emails
+
+EMAILS = [
+    {"email_id": "EMAIL_2", "sender": "jho@x.com", "subject": "Yacht", "body": "The yacht is ready in Monaco."},
+    {"email_id": "EMAIL_3", "sender": "tim@gs.com", "subject": "Transfer", "body": "Wire the bond proceeds today."},
+    {"email_id": "EMAIL_4", "sender": "riza@x.com", "subject": "Film", "body": "Premiere tickets for Friday."},
+]
+
+
+def test_retrieve_relevant_emails_ranks_the_matching_email_first():
+    [top] = retrieve_relevant_emails(EMAILS, "bond proceeds wire", k=1, embed=FakeEmbedder(dimensions=16))
+    assert top["email_id"] == "EMAIL_3"
+
+
+def test_retrievers_are_reused_for_the_same_emails_and_embedder():
+    embed = FakeEmbedder(dimensions=16)
+    retriever = get_retriever(EMAILS, embed=embed)
+    assert get_retriever([dict(email) for email in EMAILS], embed=embed) is retriever
+    assert get_retriever(EMAILS[:2], embed=embed) is not retriever
+    assert get_retriever(EMAILS, embed=None) is not retriever
@@ -0,0 +1,76 @@
+import json
+
+from anthropic.types import ToolUseBlock
+
+from fake_llm import FakeAnthropic, make_message
+from map_reduce import RESULTS_TOOL
+from streaming import IncrementalResultsParser, InvestigationStream, parse_investigation_results
+
+POI = {
+    "name": "Tim Leissner",
+    "email_address": "tim@gs.com",
+    "description": "Banker",
+    "reasoning": "Approved the wire",
+    "references": [
+        {"email_id": "EMAIL_3", "email_subject": "Wire", "quotes": ["Approved.", "Send it."], "description": "x"}
+    ],
+}
+EVENT = {"event": "Wire to Aabar", "date": "2012-03-01", "location": "Abu Dhabi", "references": []}
+
+
+def reply(**sections):
+    return json.dumps(sections)
+
+
+def test_items_are_emitted_as_soon_as_they_close():
+    text = reply(secondary_poi=[POI], key_events=[EVENT])
+    parser = IncrementalResultsParser()
+    emitted = [parser.feed(text[i : i + 7]) for i in range(0, len(text), 7)]
+    found = [item for chunk in emitted for item in chunk]
+    assert [section for section, _ in found] == ["secondary_poi", "key_events"]
+    assert found[0][1].references[0].quotes == ["Approved.", "Send it."]
+    assert parser.complete and not parser.errors
+
+
+def test_fenced_and_truncated_replies_keep_completed_items():
+    text = "```json\n" + reply(secondary_poi=[POI], key_events=[EVENT])
+    results = parse_investigation_results(text[: text.index("Abu Dhabi")])
+    assert [poi.name for poi in results.secondary_poi] == ["Tim Leissner"]
+    assert results.key_events == []
+
+
+def test_braces_in_prose_before_the_document_are_skipped():
+    text = 'I grouped findings as {person, event} and checked {"email_id": "EMAIL_3"} first.\n' + reply(
+        secondary_poi=[POI]
+    )
+    parser = IncrementalResultsParser()
+    found = [item for i in range(0, len(text), 5) for item in parser.feed(text[i : i + 5])]
+    assert [item.name for _, item in found] == ["Tim Leissner"]
+
+
+def test_a_fenced_document_is_preferred():
+    text = f"Example: {reply(secondary_poi=[])}\nResults:\n```json\n{reply(secondary_poi=[POI])}\n```"
+    assert [poi.name for poi in parse_investigation_results(text).secondary_poi] == ["Tim Leissner"]
+
+
+def test_invalid_items_are_reported_not_dropped_silently():
+    parser = IncrementalResultsParser()
+    parser.feed(reply(secondary_poi=[{"name": "No address"}, POI]))
+    assert len(parser.results().secondary_poi) == 1
+    assert len(parser.errors) == 1 and parser.errors[0].startswith("secondary_poi")
+
+
+def test_investigation_stream_yields_findings_with_aliases_restored():
+    emails = [{"email_id": "EMAIL_3", "sender": "tim@gs.com", "recipients": "jho@x.com", "body": "Approved."}]
+    found = {**POI, "email_address": "@P1", "references": [{**POI["references"][0], "email_id": "#E3"}]}
+
+    def responder(kwargs):
+        findings = {"secondary_poi": [found]}
+        block = ToolUseBlock(type="tool_use", id="toolu_fake", name=RESULTS_TOOL["name"], input=findings)
+        return make_message(content=[block], stop_reason="tool_use")
+
+    stream = InvestigationStream(FakeAnthropic(responder, latency=0), "fake-claude", "Who?", emails=emails)
+    [(section, item)] = list(stream)
+    assert section == "secondary_poi"
+    assert item.email_address == "tim@gs.com" and item.references[0].email_id == "EMAIL_3"
+    assert not stream.truncated and stream.first_item_s is not None
@@ -0,0 +1,63 @@
+import pytest
+
+from transaction_store import TransactionStore
+
+TRANSACTIONS = [
+    {"sender": "Charlie", "receiver": "Maxwell", "amount": 9_500.0, "timestamp": "2025-03-05T10:00:00"},
+    {"sender": "Charlie", "receiver": "Maxwell", "amount": 9_800.0, "timestamp": "2025-03-06T09:00:00"},
+    {"sender": "Maxwell", "receiver": "Charlie", "amount": 25_000.0, "timestamp": "2025-03-01T00:00:00"},
+    {"sender": "Alice", "receiver": "Bob", "amount": 120.0, "timestamp": "2025-02-01T12:00:00", "label": "normal"},
+    {"sender": "Alice", "receiver": "Bob", "amount": 80.0, "timestamp": None},
+]
+
+
+@pytest.fixture
+def store():
+    return TransactionStore.from_records(TRANSACTIONS)
+
+
+def amounts(store, positions):
+    return sorted(store.amount[positions].tolist())
+
+
+def test_select_filters(store):
+    assert amounts(store, store.select(sender="charlie")) == [9_500.0, 9_800.0]
+    assert amounts(store, store.select(between=("Maxwell", "Charlie"))) == [9_500.0, 9_800.0, 25_000.0]
+    assert amounts(store, store.select(min_amount=1_000, max_amount=10_000)) == [9_500.0, 9_800.0]
+    assert amounts(store, store.select(label="normal")) == [120.0]
+    assert len(store.select(sender="nobody")) == 0
+
+
+def test_a_date_only_end_covers_that_whole_day(store):
+    assert amounts(store, store.select(start="2025-03-01", end="2025-03-05")) == [9_500.0, 25_000.0]
+    assert amounts(store, store.select(end="2025-03-05T09:00")) == [120.0, 25_000.0]
+
+
+def test_unparseable_dates_raise(store):
+    with pytest.raises(ValueError, match="next tuesday"):
+        store.select(end="next tuesday")
+
+
+def test_pair_totals(store):
+    totals = store.pair_totals()
+    top = totals.iloc[0]
+    assert (top["sender"], top["receiver"], top["total"]) == ("maxwell", "charlie", 25_000.0)
+    charlie = totals[totals["sender"] == "charlie"].iloc[0]
+    assert (charlie["count"], charlie["total"], charlie["max"]) == (2, 19_300.0, 9_800.0)
+
+
+def test_structuring_flags_payments_kept_under_the_threshold(store):
+    flagged = store.structuring(threshold=10_000)
+    assert flagged["amount"].tolist() == [9_800.0]
+    assert flagged["window_total"].tolist() == [19_300.0]
+
+
+def test_round_amounts(store):
+    assert store.round_amounts(multiple=1_000)["amount"].tolist() == [25_000.0]
+
+
+def test_save_and_load(store, tmp_path):
+    path = str(tmp_path / "transactions.parquet")
+    store.save(path)
+    loaded = TransactionStore.load(path)
+    assert loaded.frame().equals(store.frame())
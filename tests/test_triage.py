@@ -0,0 +1,36 @@
+from triage import score_emails, select_positions, triage_emails, with_thread_context
+
+
+def mailbox():
+    emails = [
+        {"subject": f"Lunch {i}", "date": f"2012-03-{i + 1:02d}", "sender": "a@x.com", "body": "See you at noon."}
+        for i in range(10)
+    ]
+    thread = [
+        {"subject": "Permit", "date": "2012-04-01", "sender": "a@x.com", "body": "Any news on the permit?"},
+        {"subject": "Re: Permit", "date": "2012-04-02", "sender": "b@x.com", "body": "Still waiting."},
+        {
+            "subject": "Re: Permit",
+            "date": "2012-04-03",
+            "sender": "a@x.com",
+            "body": "Offer the official a $50,000 commission in exchange for the permit. Delete this after reading.",
+        },
+    ]
+    return emails + thread
+
+
+def test_select_positions_returns_the_best_first():
+    scores = score_emails(mailbox())
+    assert select_positions(scores, top_k=1).tolist() == [12]
+
+
+def test_thread_context_adds_earlier_messages_of_the_thread():
+    assert with_thread_context(mailbox(), [12], context=2).tolist() == [10, 11, 12]
+    assert with_thread_context(mailbox(), [12], context=0).tolist() == [12]
+
+
+def test_thread_context_counts_towards_the_limit():
+    # Nearest context first, then the next best email, never more than the limit
+    assert with_thread_context(mailbox(), [12, 3, 4], context=2, limit=2).tolist() == [11, 12]
+    kept = triage_emails(mailbox(), keep=0.2)
+    assert len(kept) == 3 and kept[-1]["subject"] == "Re: Permit"
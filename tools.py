@@ -2,16 +2,55 @@
 Tool functions for the DeepSearch project.
 
 """
-import pandas as pd
+import os
 import pickle as p
 
+from qdrant_client import QdrantClient
 
-def load_all_emails():
+from comm_graph import DATE_FIELDS, CommunicationGraph, email_date, to_epochs
+from email_index import ParticipantIndex, email_addresses, normalize_address
+from email_loader import EMAILS_PATH, iter_emails
+from email_store import ID_OFFSET, EmailStore, email_label
+from qdrant_store import count, iter_payloads, scroll
+from tracing import traced
+from transaction_store import TRANSACTIONS_PATH, TransactionStore
+
+QDRANT_URL = "http://localhost:6333"
+COLLECTION_NAME = "documents_and_transactions"
+
+TRANSACTION_ANALYSES = ("search", "pair_totals", "rolling_totals", "outliers", "round_amounts", "structuring")
+
+_qdrant = None
+_graph = None
+_transactions = None
+_email_timeline = None
+
+
+def get_qdrant():
+    """
+    Return the shared Qdrant client, connecting on first use.
+    """
+    global _qdrant
+    if _qdrant is None:
+        _qdrant = QdrantClient(QDRANT_URL)
+    return _qdrant
+
+
+@traced()
+def load_all_emails(path=EMAILS_PATH, columns=None, as_store=False):
     """
     Load all emails from the database.
+
+    Reads through the streaming loader, so after the first run this comes from the Parquet
+    cache rather than the xlsx. Use email_loader.iter_emails to avoid holding every email at once.
+    With as_store=True the emails come back as a compact EmailStore whose rows carry stable
+    "email_id" labels, instead of a list of dicts.
     """
-    return pd.read_excel("generated_emails_with_background_7.xlsx").to_dict(orient="records")
+    if as_store:
+        return EmailStore.load(path, columns=columns)
+    return list(iter_emails(path, columns=columns))
 
+@traced()
 def load_participant_descriptions():
     """
     Load participant descriptions from the database.
@@ -20,10 +59,142 @@ def load_participant_descriptions():
         return p.load(f)
 
 
-def filter_emails_by_person(all_emails, poi_email_address):
+@traced()
+def filter_emails_by_person(all_emails, poi_email_address, index=None):
     """
     Filter emails by person of interest.
+
+    Addresses are matched exactly against the parsed sender and recipient lists. Pass a
+    ParticipantIndex built over all_emails to look up matches without scanning the corpus.
+    An EmailStore is filtered into a subset EmailStore, a list into a list.
+    """
+    if index is not None:
+        positions = index.emails_involving(poi_email_address)
+    else:
+        poi_email_address = normalize_address(poi_email_address)
+        positions = [i for i, email in enumerate(all_emails) if poi_email_address in email_addresses(email)]
+    if isinstance(all_emails, EmailStore):
+        return all_emails.take(positions)
+    return [all_emails[email_id] for email_id in positions]
+
+
+def bribery_playbook(user1, user2, collection_name=COLLECTION_NAME, qdrant=None, limit=50):
+    """
+    Query the database for bribery related information on policy, transactions, and communications
+    between two individuals of interest.
+    """
+    qdrant = qdrant or get_qdrant()
+    return {
+        "policy": [payload["text"] for payload in scroll(qdrant, collection_name, limit, type="document")],
+        "transactions": scroll(qdrant, collection_name, limit, type="transaction", between=(user1, user2)),
+        "emails": scroll(qdrant, collection_name, limit, type="email", between=(user1, user2)),
+    }
+
+
+def get_communication_graph(qdrant=None, collection_name=COLLECTION_NAME):
+    """
+    Return the shared communication graph, loading or building it on first use.
+
+    Edges carry the volume of the transactions stored in the Qdrant collection, if it exists.
+    """
+    global _graph
+    if _graph is None:
+        qdrant = qdrant or get_qdrant()
+        transactions, transactions_key = (), 0
+        if qdrant.collection_exists(collection_name):
+            # The transactions are generated from a fixed seed, so their count keys the cached graph
+            # and they are only paged out of Qdrant when it is rebuilt
+            transactions_key = count(qdrant, collection_name, type="transaction")
+            transactions = iter_payloads(qdrant, collection_name, type="transaction")
+        _graph = CommunicationGraph.load_or_build(
+            participant_descriptions=load_participant_descriptions(),
+            transactions=transactions,
+            transactions_key=transactions_key,
+        )
+    return _graph
+
+
+@traced()
+def communication_network(person, limit=20, hops=2):
+    """
+    Look up who a person communicates and transacts with, from the precomputed communication graph.
+    """
+    return get_communication_graph().ego_network(person, limit, hops)
+
+
+def get_transaction_store(path=TRANSACTIONS_PATH, qdrant=None, collection_name=COLLECTION_NAME):
+    """
+    Return the shared transaction store: the Parquet copy written by populate_qdrant_db.py, or
+    else every transaction payload in the Qdrant collection.
+    """
+    global _transactions
+    if _transactions is None:
+        if os.path.exists(path):
+            _transactions = TransactionStore.load(path)
+        else:
+            payloads = iter_payloads(qdrant or get_qdrant(), collection_name, type="transaction")
+            _transactions = TransactionStore.from_records(payloads)
+    return _transactions
+
+
+def get_email_timeline(path=EMAILS_PATH):
+    """
+    Return the participant index and per-email timestamps used to join transactions to emails.
+    """
+    global _email_timeline
+    if _email_timeline is None:
+        index = ParticipantIndex.load_or_build(path, participant_descriptions=load_participant_descriptions())
+        dates = [email_date(email) for email in iter_emails(path, columns=DATE_FIELDS)]
+        _email_timeline = (index, to_epochs(dates))
+    return _email_timeline
+
+
+@traced()
+def transaction_analytics(
+    analysis="search",
+    sender=None,
+    receiver=None,
+    between=None,
+    min_amount=None,
+    max_amount=None,
+    start=None,
+    end=None,
+    label=None,
+    threshold=None,
+    limit=50,
+    related_emails=False,
+):
+    """
+    Structured queries over every transaction.
+
+    The filters pick the transactions to search or aggregate; "pair_totals" sums them per
+    sender -> receiver pair, "rolling_totals" gives 7-day totals per pair (those reaching
+    threshold), and "outliers", "round_amounts" and "structuring" (payments kept just under
+    threshold) flag individual transactions. With related_emails, each transaction lists the
+    emails between its parties within 3 days of it.
     """
-    # all_emails = load_all_emails()
-    filtered_emails = [email for email in all_emails if email["sender"] == poi_email_address or poi_email_address in email["recipients"]]
-    return filtered_emails
+    store = get_transaction_store()
+    between = tuple(between) if between else None
+    positions = store.select(sender, receiver, between, min_amount, max_amount, start, end, label)
+    if analysis == "search":
+        frame = store.frame(positions)
+    elif analysis == "pair_totals":
+        frame = store.pair_totals(positions, limit)
+    elif analysis == "rolling_totals":
+        frame = store.rolling_totals(min_total=threshold, positions=positions)
+    elif analysis == "structuring":
+        frame = store.structuring(**({"threshold": threshold} if threshold else {}))
+    elif analysis in ("outliers", "round_amounts"):
+        frame = getattr(store, analysis)()
+    else:
+        raise ValueError(f"analysis must be one of {TRANSACTION_ANALYSES}, not {analysis!r}")
+    if analysis in ("structuring", "outliers", "round_amounts"):
+        frame = frame[frame.index.isin(positions)]
+    frame = frame.head(limit)
+    records = frame.drop(columns="timestamp", errors="ignore").to_dict(orient="records")
+    if related_emails and analysis != "pair_totals":
+        index, email_epochs = get_email_timeline()
+        related = store.related_emails(frame.index, index, email_epochs)
+        for record, position in zip(records, frame.index):
+            record["emails"] = [email_label(email + ID_OFFSET) for email in related[position].tolist()]
+    return records
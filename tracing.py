@@ -0,0 +1,325 @@
+"""
+Lightweight tracing for the investigation pipeline.
+
+Spans nest through contextvars, so everything that runs inside an investigation span shares
+its trace ID. Each finished span records its latency and attributes such as item counts,
+request bytes and the model's input, output and cache token usage. Spans are written one per
+line to a JSONL file using the OpenTelemetry (OTLP JSON) span field names: traceId, spanId,
+parentSpanId, name, startTimeUnixNano, endTimeUnixNano, attributes, status.
+
+Tracing is off until configure(path) is called or DEEPSEARCH_TRACE_FILE is set; disabled spans
+cost one context lookup. Summarize a trace file with:
+
+    python tracing.py traces.jsonl [--trace-id ID]
+"""
+import argparse
+import contextvars
+import functools
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import numpy as np
+
+TRACE_FILE_ENV = "DEEPSEARCH_TRACE_FILE"
+TOKEN_ATTRIBUTES = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+_current = contextvars.ContextVar("current_span", default=None)
+_exporter = None
+
+
+class Span:
+    """
+    One timed operation. Use set() for attributes and add() for counters.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + (value or 0)
+
+    def to_dict(self):
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+class _NullSpan:
+    def set(self, **attributes):
+        pass
+
+    def add(self, **counts):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class JsonlExporter:
+    """
+    Appends finished spans to a JSONL file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+def configure(path=None, exporter=None):
+    """
+    Send spans to exporter, or to a JSONL file at path; configure() with neither turns tracing off.
+    """
+    global _exporter
+    _exporter = exporter or (JsonlExporter(path) if path else None)
+
+
+def enabled():
+    return _exporter is not None
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Context manager for a span nested under the current one.
+    """
+    if _exporter is None:
+        yield NULL_SPAN
+        return
+    current = Span(name, _current.get(), **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        current.end_ns = time.time_ns()
+        _exporter.export(current)
+
+
+def traced(name=None):
+    """
+    Decorator wrapping every call in a span; records "items" when the result has a length.
+    """
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__name__) as current:
+                result = fn(*args, **kwargs)
+                if hasattr(result, "__len__"):
+                    current.set(items=len(result))
+                return result
+
+        return wrapper
+
+    return decorate
+
+
+def in_current_context(fn):
+    """
+    Wrap fn so calls from worker threads nest their spans under the span current here.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+def record_usage(current, usage):
+    """
+    Add a response's token usage to a span.
+    """
+    if usage is not None:
+        current.add(**{name: getattr(usage, name, 0) for name in TOKEN_ATTRIBUTES})
+
+
+def _end(current, error=None):
+    if error is not None:
+        current.error = f"{type(error).__name__}: {error}"
+    current.end_ns = time.time_ns()
+    _exporter.export(current)
+
+
+def _record_response(current, response):
+    if hasattr(response, "usage"):
+        record_usage(current, response.usage)
+        current.set(stop_reason=response.stop_reason)
+        _end(current)
+        return response
+    # A stream: the call span ends now and the stream gets its own span with the usage
+    _end(current)
+    return _traced_stream(response, current)
+
+
+class _TracedMessages:
+    def __init__(self, messages):
+        self._messages = messages
+
+    def create(self, **kwargs):
+        if _exporter is None:
+            return self._messages.create(**kwargs)
+        request = [kwargs.get("system"), kwargs.get("messages"), kwargs.get("tools")]
+        request_bytes = len(json.dumps(request, default=str))
+        current = Span("messages.create", _current.get(), model=kwargs.get("model"), request_bytes=request_bytes)
+        try:
+            response = self._messages.create(**kwargs)
+        except BaseException as e:
+            _end(current, e)
+            raise
+        if inspect.isawaitable(response):
+            return self._acreate(current, response)
+        return _record_response(current, response)
+
+    async def _acreate(self, current, pending):
+        try:
+            response = await pending
+        except BaseException as e:
+            _end(current, e)
+            raise
+        if hasattr(response, "usage"):
+            return _record_response(current, response)
+        _end(current)  # async streams are passed through untraced
+        return response
+
+
+def _traced_stream(events, parent):
+    # Not made the current span: the consumer's own spans run between events
+    current = Span("messages.stream", parent)
+    try:
+        for event in events:
+            if event.type == "message_start":
+                record_usage(current, event.message.usage)
+            elif event.type == "message_delta":
+                current.set(output_tokens=event.usage.output_tokens, stop_reason=event.delta.stop_reason)
+            yield event
+    except GeneratorExit:  # the consumer stopped early
+        _end(current)
+        raise
+    except BaseException as e:
+        _end(current, e)
+        raise
+    _end(current)
+
+
+class TracedClient:
+    """
+    Wraps an Anthropic or AsyncAnthropic client so every messages.create call is a span with
+    its token usage.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.messages = _TracedMessages(client.messages)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def read_spans(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(spans):
+    """
+    Per trace: wall time, then time and tokens by span name.
+
+    Returns {trace_id: {"root": name, "seconds": wall time, "spans": {name: stats}}}.
+    """
+    traces = defaultdict(list)
+    for record in spans:
+        traces[record["traceId"]].append(record)
+    summary = {}
+    for trace_id, records in traces.items():
+        roots = [record for record in records if not record["parentSpanId"]]
+        start = min(record["startTimeUnixNano"] for record in records)
+        end = max(record["endTimeUnixNano"] for record in records)
+        by_name = defaultdict(list)
+        for record in records:
+            by_name[record["name"]].append(record)
+        stats = {}
+        for name, group in by_name.items():
+            seconds = np.array([(r["endTimeUnixNano"] - r["startTimeUnixNano"]) / 1e9 for r in group])
+            stats[name] = {
+                "count": len(group),
+                "seconds": float(seconds.sum()),
+                "p50_s": float(np.percentile(seconds, 50)),
+                "max_s": float(seconds.max()),
+                "errors": sum(r["status"]["code"] == "ERROR" for r in group),
+                **{
+                    attribute: sum(r["attributes"].get(attribute, 0) or 0 for r in group)
+                    for attribute in TOKEN_ATTRIBUTES + ("request_bytes",)
+                },
+            }
+        summary[trace_id] = {
+            "root": roots[0]["name"] if roots else None,
+            "attributes": roots[0]["attributes"] if roots else {},
+            "seconds": (end - start) / 1e9,
+            "spans": stats,
+        }
+    return summary
+
+
+def format_summary(summary):
+    lines = []
+    for trace_id, trace in summary.items():
+        lines.append(f"Trace {trace_id} ({trace['root']} {trace['attributes']}): {trace['seconds']:.2f}s")
+        lines.append(
+            f"  {'span':<28} {'count':>5} {'total s':>9} {'share':>6} {'p50 s':>8} {'max s':>8} "
+            f"{'in tok':>9} {'cached':>9} {'out tok':>8}"
+        )
+        for name, stats in sorted(trace["spans"].items(), key=lambda item: -item[1]["seconds"]):
+            share = stats["seconds"] / trace["seconds"] if trace["seconds"] else 0
+            lines.append(
+                f"  {name:<28} {stats['count']:>5} {stats['seconds']:>9.3f} {share:>6.0%} {stats['p50_s']:>8.3f} "
+                f"{stats['max_s']:>8.3f} {stats['input_tokens']:>9} {stats['cache_read_input_tokens']:>9} "
+                f"{stats['output_tokens']:>8}"
+            )
+    return "\n".join(lines)
+
+
+if os.environ.get(TRACE_FILE_ENV):
+    configure(os.environ[TRACE_FILE_ENV])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize where time and tokens went per investigation.")
+    parser.add_argument("path", help="JSONL trace file")
+    parser.add_argument("--trace-id", help="Only this trace")
+    args = parser.parse_args()
+
+    spans = read_spans(args.path)
+    if args.trace_id:
+        spans = [record for record in spans if record["traceId"] == args.trace_id]
+    print(format_summary(summarize(spans)))
@@ -0,0 +1,388 @@
+"""
+Columnar transaction store with vectorized analytics.
+
+Transactions are also embedded into Qdrant as sentences, which suits fuzzy questions but not
+structured ones such as "payments from Charlie to Maxwell over $10k" or "amounts kept just
+under the reporting threshold". Here every transaction is a row of flat arrays (sender and
+receiver IDs into a shared party table, amount, epoch timestamp, label and description codes),
+sorted by time, so filters, per-pair aggregates, rolling windows, outliers and structuring
+checks are NumPy passes over the whole table. The store is saved as Parquet next to the
+Qdrant collection by populate_qdrant_db.py.
+"""
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from comm_graph import DAY_S, MISSING, to_epochs
+from qdrant_store import normalize_party, to_epoch
+
+TRANSACTIONS_PATH = "transactions.parquet"
+GROUPINGS = ("pair", "sender", "receiver")
+ROLLING_WINDOW_S = 7 * DAY_S
+OUTLIER_ZSCORE = 3.0
+MIN_HISTORY = 5
+ROUND_MULTIPLE = 1000
+REPORTING_THRESHOLD = 10_000
+STRUCTURING_MARGIN = 0.1
+STRUCTURING_MIN_COUNT = 2
+EMAIL_WINDOW_S = 3 * DAY_S
+
+
+def _epochs(values):
+    """
+    Epoch seconds for a mix of epoch numbers (Qdrant payloads) and date strings.
+    """
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    numbers = pd.to_numeric(values, errors="coerce")
+    dates = to_epochs(values.where(numbers.isna()))
+    return np.where(numbers.notna(), numbers.fillna(0).astype(np.int64), dates)
+
+
+def _bound(value, name, end=False):
+    """
+    Epoch seconds for a start or end filter. A date without a time of day as end covers that
+    whole day, so end stays inclusive.
+    """
+    epoch = to_epoch(value)
+    if epoch is None:
+        raise ValueError(f"Unparseable {name} date {value!r}; expected e.g. 2025-03-05 or 2025-03-05T10:00")
+    if end and epoch % DAY_S == 0 and _date_only(value):
+        epoch += DAY_S - 1
+    return epoch
+
+
+def _date_only(value):
+    if isinstance(value, str):
+        return ":" not in value
+    return isinstance(value, date) and not isinstance(value, datetime)
+
+
+def _dates(timestamp):
+    return pd.to_datetime(pd.Series(timestamp).where(timestamp != MISSING), unit="s", utc=True).to_numpy()
+
+
+def _codes(values):
+    codes, vocabulary = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    return codes.astype(np.int32), np.asarray(vocabulary, dtype=object)
+
+
+class TransactionStore:
+    """
+    Transactions as parallel arrays in timestamp order (undated ones first).
+    """
+
+    def __init__(self, parties, sender, receiver, amount, timestamp, labels, label, descriptions, description):
+        order = np.argsort(timestamp, kind="stable")
+        self.parties = parties
+        self.party_ids = {party: i for i, party in enumerate(parties)}
+        self.sender = sender[order]
+        self.receiver = receiver[order]
+        self.amount = amount[order]
+        self.timestamp = timestamp[order]
+        self.labels = labels
+        self.label = label[order]
+        self.descriptions = descriptions
+        self.description = description[order]
+        self._groupings = {}
+
+    @classmethod
+    def from_frame(cls, frame):
+        """
+        Build a store from a DataFrame of transactions or transaction payloads.
+
+        Rows need a sender and a receiver (or a receivers list); amount, timestamp, label and
+        description are optional.
+        """
+        frame = frame.reset_index(drop=True)
+        missing = pd.Series([None] * len(frame), dtype=object)
+        receiver = frame.get("receiver", missing)
+        if "receivers" in frame:
+            receiver = receiver.where(receiver.notna(), frame["receivers"].str[0])
+        sender = frame.get("sender", missing).map(normalize_party)
+        receiver = receiver.map(normalize_party)
+        keep = (sender.notna() & receiver.notna()).to_numpy()
+        codes, parties = _codes(pd.concat([sender[keep], receiver[keep]], ignore_index=True))
+        count = int(keep.sum())
+        label, labels = _codes(frame.get("label", missing)[keep])
+        description, descriptions = _codes(frame.get("description", missing)[keep])
+        return cls(
+            parties,
+            codes[:count],
+            codes[count:],
+            pd.to_numeric(frame.get("amount", missing)[keep], errors="coerce").fillna(0.0).to_numpy(np.float64),
+            _epochs(frame.get("timestamp", missing)[keep]),
+            labels,
+            label,
+            descriptions,
+            description,
+        )
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a store from transaction dicts (utils.generate_transaction) or Qdrant payloads.
+        """
+        return cls.from_frame(pd.DataFrame.from_records(list(records)))
+
+    @classmethod
+    def load(cls, path=TRANSACTIONS_PATH):
+        return cls.from_frame(pq.read_table(path).to_pandas())
+
+    def save(self, path=TRANSACTIONS_PATH):
+        pq.write_table(pa.Table.from_pandas(self.frame(), preserve_index=False), path)
+
+    def __len__(self):
+        return len(self.amount)
+
+    @staticmethod
+    def _lookup(vocabulary, codes):
+        values = np.full(len(codes), None, dtype=object)
+        present = codes != MISSING
+        values[present] = vocabulary[codes[present]]
+        return values
+
+    def frame(self, positions=None):
+        """
+        The transactions at positions (all by default) as a DataFrame, with party names and dates.
+        """
+        positions = np.arange(len(self)) if positions is None else np.asarray(positions, dtype=np.int64)
+        timestamp = self.timestamp[positions]
+        return pd.DataFrame(
+            {
+                "sender": self.parties[self.sender[positions]],
+                "receiver": self.parties[self.receiver[positions]],
+                "amount": self.amount[positions],
+                "timestamp": timestamp,
+                "date": _dates(timestamp),
+                "label": self._lookup(self.labels, self.label[positions]),
+                "description": self._lookup(self.descriptions, self.description[positions]),
+            },
+            index=positions,
+        )
+
+    def party(self, name):
+        """
+        ID of a party name, or -1 if no transaction involves it.
+        """
+        return self.party_ids.get(normalize_party(name), -1)
+
+    def select(
+        self,
+        sender=None,
+        receiver=None,
+        between=None,
+        min_amount=None,
+        max_amount=None,
+        start=None,
+        end=None,
+        label=None,
+    ):
+        """
+        Positions of the transactions matching every given filter, in time order.
+
+        between=(a, b) matches payments either way between a and b; start and end bound the
+        timestamp (inclusive, so a date-only end includes that whole day) and accept anything
+        qdrant_store.to_epoch does. Unparseable dates raise ValueError.
+        """
+        low = 0 if start is None else np.searchsorted(self.timestamp, _bound(start, "start"), side="left")
+        high = len(self) if end is None else np.searchsorted(self.timestamp, _bound(end, "end", end=True), side="right")
+        if start is None and end is not None:
+            low = np.searchsorted(self.timestamp, 0, side="left")  # undated transactions have no time to bound
+        mask = np.ones(high - low, dtype=bool)
+        senders, receivers = self.sender[low:high], self.receiver[low:high]
+        if sender is not None:
+            mask &= senders == self.party(sender)
+        if receiver is not None:
+            mask &= receivers == self.party(receiver)
+        if between is not None:
+            a, b = self.party(between[0]), self.party(between[1])
+            mask &= ((senders == a) & (receivers == b)) | ((senders == b) & (receivers == a))
+        if min_amount is not None:
+            mask &= self.amount[low:high] >= min_amount
+        if max_amount is not None:
+            mask &= self.amount[low:high] <= max_amount
+        if label is not None:
+            codes = np.flatnonzero(self.labels == label)
+            mask &= self.label[low:high] == (codes[0] if len(codes) else -2)
+        return low + np.flatnonzero(mask)
+
+    def _groups(self, by):
+        if by not in GROUPINGS:
+            raise ValueError(f"by must be one of {GROUPINGS}, not {by!r}")
+        if by == "sender":
+            return self.sender.astype(np.int64)
+        if by == "receiver":
+            return self.receiver.astype(np.int64)
+        return self.sender.astype(np.int64) * len(self.parties) + self.receiver
+
+    def _grouping(self, by):
+        """
+        (keys, inverse, order, rank, starts) for a grouping, computed once: the distinct group
+        keys, each transaction's index into keys, the permutation sorting transactions by (group,
+        time), each transaction's position in that permutation and where each group starts in it.
+        """
+        if by not in self._groupings:
+            groups = self._groups(by)
+            order = np.argsort(groups, kind="stable")  # rows are in time order, so ties stay in time order
+            ordered = groups[order]
+            boundary = np.concatenate(([True], ordered[1:] != ordered[:-1])) if len(ordered) else ordered.astype(bool)
+            inverse = np.empty(len(groups), dtype=np.int64)
+            inverse[order] = np.cumsum(boundary) - 1
+            rank = np.empty(len(groups), dtype=np.int64)
+            rank[order] = np.arange(len(groups))
+            self._groupings[by] = (ordered[boundary], inverse, order, rank, np.flatnonzero(boundary))
+        return self._groupings[by]
+
+    def pair_totals(self, positions=None, limit=None):
+        """
+        Count, total, mean and largest amount, and first and last date per sender -> receiver
+        pair, largest total first (only the top limit pairs, if given).
+        """
+        keys, inverse, order, _, starts = self._grouping("pair")
+        if positions is None:
+            amount, timestamp = self.amount, self.timestamp
+        else:
+            positions = np.asarray(positions, dtype=np.int64)
+            inverse, amount, timestamp = inverse[positions], self.amount[positions], self.timestamp[positions]
+        count = np.bincount(inverse, minlength=len(keys))
+        total = np.bincount(inverse, weights=amount, minlength=len(keys))
+        undated = np.where(timestamp == MISSING, np.iinfo(np.int64).max, timestamp)
+        if positions is None and len(keys):
+            # Every group is a contiguous run of the (group, time) order
+            largest = np.maximum.reduceat(amount[order], starts)
+            first = np.minimum.reduceat(undated[order], starts)
+            last = np.maximum.reduceat(timestamp[order], starts)
+        else:
+            largest = np.zeros(len(keys))
+            first = np.full(len(keys), np.iinfo(np.int64).max)
+            last = np.full(len(keys), MISSING, dtype=np.int64)
+            np.maximum.at(largest, inverse, amount)
+            np.minimum.at(first, inverse, undated)
+            np.maximum.at(last, inverse, timestamp)
+        first[first == np.iinfo(np.int64).max] = MISSING
+        present = np.flatnonzero(count)
+        if limit is not None and limit < len(present):
+            present = present[np.argpartition(-total[present], limit)[:limit]]
+        present = present[np.argsort(-total[present], kind="stable")]
+        return pd.DataFrame(
+            {
+                "sender": self.parties[keys[present] // len(self.parties)],
+                "receiver": self.parties[keys[present] % len(self.parties)],
+                "count": count[present],
+                "total": total[present],
+                "mean": total[present] / count[present],
+                "max": largest[present],
+                "first": _dates(first[present]),
+                "last": _dates(last[present]),
+            }
+        )
+
+    def _trailing(self, by, window_s, positions=None):
+        """
+        Count and sum of the amounts in each transaction's group over the window_s seconds up
+        to and including it, for the dated transactions at positions (all by default).
+
+        Returns the positions in (group, time) order with their window counts and sums.
+        """
+        _, inverse, order, rank, _ = self._grouping(by)
+        if positions is None:
+            positions = order
+        else:
+            positions = np.asarray(positions, dtype=np.int64)
+            positions = positions[np.argsort(rank[positions], kind="stable")]
+        positions = positions[self.timestamp[positions] != MISSING]
+        groups, timestamp = inverse[positions], self.timestamp[positions]
+        # One sorted key per (group, time), so a window start is a single searchsorted
+        earliest = timestamp.min() if len(timestamp) else 0
+        stride = int(timestamp.max() - earliest) + window_s + 1 if len(timestamp) else 1
+        keys = groups * stride + (timestamp - earliest)
+        starts = np.searchsorted(keys, keys - window_s, side="left")
+        ends = np.arange(1, len(keys) + 1)
+        sums = np.concatenate(([0.0], np.cumsum(self.amount[positions])))
+        return positions, ends - starts, sums[ends] - sums[starts]
+
+    def rolling_totals(self, by="pair", window_s=ROLLING_WINDOW_S, min_total=None, positions=None):
+        """
+        Every dated transaction with the count and total of its group's transactions in the
+        trailing window; with min_total, only the windows reaching it.
+        """
+        positions, counts, totals = self._trailing(by, window_s, positions)
+        if min_total is not None:
+            keep = totals >= min_total
+            positions, counts, totals = positions[keep], counts[keep], totals[keep]
+        frame = self.frame(positions)
+        frame["window_count"] = counts
+        frame["window_total"] = totals
+        return frame
+
+    def outliers(self, by="pair", zscore=OUTLIER_ZSCORE, min_history=MIN_HISTORY):
+        """
+        Transactions whose amount is zscore standard deviations above their group's mean, for
+        groups with at least min_history transactions. Largest deviation first.
+        """
+        keys, inverse, _, _, _ = self._grouping(by)
+        count = np.bincount(inverse, minlength=len(keys))
+        mean = np.bincount(inverse, weights=self.amount, minlength=len(keys)) / np.maximum(count, 1)
+        variance = np.bincount(inverse, weights=self.amount**2, minlength=len(keys)) / np.maximum(count, 1) - mean**2
+        std = np.sqrt(np.maximum(variance, 0))[inverse]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = (self.amount - mean[inverse]) / std
+        flagged = np.flatnonzero((count[inverse] >= min_history) & (std > 0) & (scores >= zscore))
+        frame = self.frame(flagged)
+        frame["group_mean"] = mean[inverse][flagged]
+        frame["zscore"] = scores[flagged]
+        return frame.sort_values("zscore", ascending=False, kind="stable")
+
+    def round_amounts(self, multiple=ROUND_MULTIPLE, positions=None):
+        """
+        Transactions for an exact multiple of multiple (e.g. $25,000.00).
+        """
+        positions = np.arange(len(self)) if positions is None else np.asarray(positions, dtype=np.int64)
+        amount = self.amount[positions]
+        cents = np.round(amount * 100).astype(np.int64)
+        return self.frame(positions[(amount >= multiple) & (cents % int(multiple * 100) == 0)])
+
+    def structuring(
+        self,
+        threshold=REPORTING_THRESHOLD,
+        margin=STRUCTURING_MARGIN,
+        by="sender",
+        window_s=ROLLING_WINDOW_S,
+        min_count=STRUCTURING_MIN_COUNT,
+    ):
+        """
+        Possible structuring: at least min_count payments by the same group within window_s,
+        each within margin below threshold, that together reach it.
+        """
+        amount = self.amount
+        near = np.flatnonzero((amount >= threshold * (1 - margin)) & (amount < threshold))
+        positions, counts, totals = self._trailing(by, window_s, near)
+        keep = (counts >= min_count) & (totals >= threshold)
+        frame = self.frame(positions[keep])
+        frame["window_count"] = counts[keep]
+        frame["window_total"] = totals[keep]
+        return frame
+
+    def related_emails(self, positions, index, email_epochs, window_s=EMAIL_WINDOW_S):
+        """
+        For each transaction, the positions of emails between its sender and receiver sent
+        within window_s of it.
+
+        index is an email_index.ParticipantIndex (party names resolve through its aliases) and
+        email_epochs the emails' timestamps (comm_graph.to_epochs), both over the same emails.
+        """
+        related = {}
+        for position in np.asarray(positions, dtype=np.int64).tolist():
+            timestamp = self.timestamp[position]
+            sender, receiver = self.parties[self.sender[position]], self.parties[self.receiver[position]]
+            candidates = index.emails_between(sender, receiver)
+            if timestamp != MISSING and len(candidates):
+                times = email_epochs[candidates]
+                candidates = candidates[(times != MISSING) & (np.abs(times - timestamp) <= window_s)]
+            else:
+                candidates = candidates[:0]
+            related[position] = candidates
+        return related
@@ -0,0 +1,247 @@
+"""
+Deterministic triage of emails before any LLM call.
+
+Every email gets a score from cheap signals computed over the whole mailbox at once: hits on
+the bribery lexicon of the reference documents (bribery_def_doc.txt, bribery_policy_doc.txt),
+money amounts and large amounts, off-channel cues ("call my cell", "delete this"), urgency
+cues, and how rarely the email's sender and recipients correspond. Each signal is a single
+alternation matched by RE2 over the whole text column at once (pyarrow.compute), which is two
+orders of magnitude faster than running Python regexes email by email. Only the top-scoring
+emails, plus the earlier emails of their threads for context, are passed on to the model, and
+the context counts towards the same budget: keep=0.2 sends at most 20% of the emails.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from email_dedup import assign_threads
+from email_index import ADDRESS_FIELDS, parse_addresses
+from email_store import EmailStore
+from tracing import traced
+
+TEXT_FIELDS = ("subject", "body")
+
+# Terms from the definition and policy documents, plus the usual euphemisms for them
+BRIBERY_TERMS = [
+    r"bribe[sd]?", r"briber(?:y|ies)", r"kick-?backs?", r"commissions?", r"facilitation (?:payments?|fees?)",
+    r"(?:undue|improper) advantages?", r"preferential treatment", r"in (?:return|exchange) for", r"gift ?cards?",
+    r"(?:concert|event) tickets", r"luxury (?:trips?|travel|gifts?)", r"(?:lavish|expensive) hospitality",
+    r"donations?", r"charity", r"inflated invoices?", r"excess funds", r"shared privately", r"intermediar(?:y|ies)",
+    r"(?:consulting|consultant|finder'?s|success) fees?", r"side (?:payments?|deals?|arrangements?)",
+    r"under the table", r"off the books", r"(?:in )?cash", r"sweeteners?", r"backhanders?", r"pay-?offs?",
+    r"grease", r"make it worth (?:your|his|her|their) while", r"take care of (?:him|her|them|you)",
+    r"favou?rable (?:terms|treatment)", r"secure the (?:contract|deal|licen[cs]e|bid)", r"expedite",
+    r"government officials?", r"shell compan(?:y|ies)", r"offshore", r"nominee",
+]
+OFF_CHANNEL_TERMS = [
+    r"whatsapp", r"signal", r"telegram", r"wechat", r"(?:personal|private) (?:e-?mail|phone|account|line)",
+    r"gmail", r"yahoo", r"hotmail", r"protonmail", r"call (?:me|my cell)", r"my cell", r"burner",
+    r"delete (?:this|it|after reading)", r"off the record", r"(?:don'?t|do not) put (?:this|it|that) in writing",
+    r"not (?:over|by|on) e-?mail", r"in person", r"between (?:us|you and me)", r"keep (?:this|it) (?:quiet|between)",
+    r"discreet(?:ly)?", r"no paper trail",
+]
+URGENCY_TERMS = [
+    r"urgent(?:ly)?", r"asap", r"as soon as possible", r"immediately", r"right away", r"time[- ]sensitive",
+    r"by (?:end of day|eod|tomorrow|tonight)", r"before (?:monday|tuesday|wednesday|thursday|friday|the weekend)",
+    r"today", r"tonight", r"deadline", r"no later than",
+]
+SCALES = {"k": 1e3, "thousand": 1e3, "m": 1e6, "mm": 1e6, "million": 1e6, "bn": 1e9, "billion": 1e9}
+SCALE_PATTERN = r"(?:\s?(?P<scale>k|mm|m|thousand|million|bn|billion)\b)?"
+NUMBER_PATTERN = r"(?P<amount>\d[\d,]*(?:\.\d+)?)"
+MONEY_PATTERNS = [
+    r"(?:[$€£]|\b(?:usd|rm|myr|eur|gbp)\s?)" + NUMBER_PATTERN + SCALE_PATTERN,
+    r"\b" + NUMBER_PATTERN + SCALE_PATTERN + r"\s?(?:usd|dollars|ringgit|euros?|pounds)\b",
+]
+LARGE_AMOUNT = 10_000
+
+WEIGHTS = {"lexicon": 3.0, "money": 1.0, "large_amount": 2.0, "off_channel": 2.5, "urgency": 1.0, "rarity": 1.5}
+KEEP_FRACTION = 0.2
+THREAD_CONTEXT = 2
+
+
+def alternation(terms):
+    """
+    One alternation over every term, longest first, on word boundaries.
+    """
+    return r"\b(?:" + "|".join(sorted(terms, key=len, reverse=True)) + r")\b"
+
+
+BRIBERY_PATTERN = alternation(BRIBERY_TERMS)
+OFF_CHANNEL_PATTERN = alternation(OFF_CHANNEL_TERMS)
+URGENCY_PATTERN = alternation(URGENCY_TERMS)
+
+
+def count_matches(text, pattern):
+    """
+    Case-insensitive matches of pattern in each string of a pyarrow array, as a NumPy array.
+    """
+    return pc.count_substring_regex(text, pattern, ignore_case=True).to_numpy(zero_copy_only=False)
+
+
+def _column(emails, field):
+    if isinstance(emails, EmailStore):
+        values = emails.column(field) if field in emails.keys else [None] * len(emails)
+    else:
+        values = [email.get(field) for email in emails]
+    return pd.Series(values, dtype=object)
+
+
+def _text(emails):
+    texts = [_column(emails, field).where(lambda column: column.map(type) == str, "") for field in TEXT_FIELDS]
+    text = texts[0].str.cat(texts[1:], sep="\n") if len(texts) > 1 else texts[0]
+    return pa.array(text.tolist(), type=pa.large_string())
+
+
+def largest_amounts(text, money=None):
+    """
+    The largest money amount mentioned in each string of a pyarrow array (0 where none is).
+
+    Only the strings with a money match (money, the per-string match counts) are parsed in Python.
+    """
+    if money is None:
+        money = sum(count_matches(text, pattern) for pattern in MONEY_PATTERNS)
+    largest = np.zeros(len(text))
+    positions = np.flatnonzero(money)
+    if len(positions) == 0:
+        return largest
+    subset = pd.Series(pc.take(text, pa.array(positions)).to_pylist(), index=positions, dtype=object)
+    for pattern in MONEY_PATTERNS:
+        found = subset.str.extractall(re.compile(pattern, re.IGNORECASE))
+        if found.empty:
+            continue
+        amounts = pd.to_numeric(found["amount"].str.replace(",", ""), errors="coerce")
+        amounts *= found["scale"].str.lower().map(SCALES).fillna(1.0)
+        per_email = amounts.groupby(level=0).max()
+        largest[per_email.index] = np.maximum(largest[per_email.index], per_email.to_numpy())
+    return largest
+
+
+def _address_lists(emails, field):
+    """
+    Parsed addresses per email for one field, parsing each distinct header value once.
+    """
+    column = _column(emails, field).map(lambda value: ", ".join(value) if isinstance(value, list) else value)
+    parsed = {value: [address for _, address in parse_addresses(value)] for value in column.dropna().unique()}
+    return [parsed.get(value, []) if isinstance(value, str) else [] for value in column]
+
+
+def counterparty_rarity(emails, graph=None):
+    """
+    Rarity in [0, 1] of each email's rarest sender/recipient pair: 1 / messages between the pair.
+
+    Pair counts come from graph (a comm_graph.CommunicationGraph over the whole corpus) when
+    given, otherwise from the emails themselves.
+    """
+    senders = _address_lists(emails, "sender")
+    recipient_lists = zip(*(_address_lists(emails, field) for field in ADDRESS_FIELDS if field != "sender"))
+    pairs, owners = [], []
+    for position, (sender, recipients) in enumerate(zip(senders, recipient_lists)):
+        if not sender:
+            continue
+        for address in set().union(*recipients) - {sender[0]}:
+            pairs.append((sender[0], address))
+            owners.append(position)
+    rarity = np.zeros(len(senders))
+    if not pairs:
+        return rarity
+    if graph is not None:
+        counts = graph.messages_between([a for a, _ in pairs], [b for _, b in pairs])
+    else:
+        keys = pd.Series([min(pair) + "\0" + max(pair) for pair in pairs])
+        counts = keys.map(keys.value_counts()).to_numpy()
+    np.maximum.at(rarity, np.array(owners), 1.0 / np.maximum(counts, 1))
+    return rarity
+
+
+@traced()
+def score_emails(emails, graph=None, weights=WEIGHTS):
+    """
+    One row of triage signals per email, in order, with the weighted "score".
+    """
+    text = _text(emails)
+    money = sum(count_matches(text, pattern) for pattern in MONEY_PATTERNS)
+    amounts = largest_amounts(text, money)
+    features = pd.DataFrame(
+        {
+            "lexicon": count_matches(text, BRIBERY_PATTERN),
+            "money": money,
+            "large_amount": (amounts >= LARGE_AMOUNT).astype(int),
+            "largest_amount": amounts,
+            "off_channel": count_matches(text, OFF_CHANNEL_PATTERN),
+            "urgency": count_matches(text, URGENCY_PATTERN),
+            "rarity": counterparty_rarity(emails, graph),
+        }
+    )
+    # Counts are damped so one long email cannot outscore several distinct signals
+    damped = ("lexicon", "money", "off_channel", "urgency")
+    features["score"] = sum(
+        weight * (np.log1p(features[name]) if name in damped else features[name]) for name, weight in weights.items()
+    )
+    return features
+
+
+def email_budget(count, keep=KEEP_FRACTION, top_k=None):
+    """
+    How many of count emails may be sent: top_k, or else the keep fraction.
+    """
+    return top_k if top_k is not None else int(np.ceil(keep * count))
+
+
+def select_positions(scores, keep=KEEP_FRACTION, top_k=None, min_score=None):
+    """
+    Positions of the top-scoring emails, best first: the top_k, or else the top keep fraction,
+    of those scoring at least min_score.
+    """
+    score = scores["score"].to_numpy()
+    order = np.argsort(-score, kind="stable")[: email_budget(len(score), keep, top_k)]
+    if min_score is not None:
+        order = order[score[order] >= min_score]
+    return order
+
+
+def with_thread_context(emails, positions, context=THREAD_CONTEXT, limit=None):
+    """
+    Add up to context earlier emails from each selected email's thread (see
+    email_dedup.assign_threads), so replies are read with what they answer. Returns sorted positions.
+
+    With a limit, at most limit positions are returned: the selected emails are taken in the
+    given (best first) order, each followed by as much of its context as still fits.
+    """
+    positions = np.asarray(positions, dtype=np.int64)[:limit]
+    if context <= 0 or len(positions) == 0:
+        return np.sort(positions)
+    threads = pd.Series(assign_threads(emails))
+    earlier = {}
+    for members in threads.groupby(threads).indices.values():
+        if len(members) < 2:
+            continue
+        chosen = np.searchsorted(members, positions)
+        found = (chosen < len(members)) & (members[np.minimum(chosen, len(members) - 1)] == positions)
+        for position, hit in zip(positions[found], chosen[found]):
+            # Nearest first, so a tight budget keeps the message being answered
+            earlier[position] = members[max(hit - context, 0) : hit][::-1]
+    selected = {}
+    for position in positions:
+        for candidate in (position, *earlier.get(position, ())):
+            if limit is not None and len(selected) >= limit:
+                break
+            selected.setdefault(candidate)
+    return np.sort(np.fromiter(selected, dtype=np.int64, count=len(selected)))
+
+
+@traced()
+def triage_emails(emails, keep=KEEP_FRACTION, top_k=None, min_score=None, context=THREAD_CONTEXT, graph=None):
+    """
+    The subset of emails worth sending to the model: the top scorers and their thread context,
+    at most top_k or the keep fraction of the emails in all.
+
+    An EmailStore comes back as a subset EmailStore (rows keep their email_id), a list as a list.
+    """
+    positions = select_positions(score_emails(emails, graph), keep, top_k, min_score)
+    positions = with_thread_context(emails, positions, context, limit=email_budget(len(emails), keep, top_k))
+    if isinstance(emails, EmailStore):
+        return emails.take(positions)
+    return [emails[position] for position in positions]
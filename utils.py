@@ -1,8 +1,71 @@
 """
 Utility functions.
 """
+import random
 import re
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+
+import tiktoken
+
+EMBEDDING_ENCODING = "cl100k_base"  # tokenizer used by the text-embedding-3 models
+CHARS_PER_TOKEN = 4  # rough estimate used when the tokenizer files cannot be downloaded
+
+_encoding = None
+
+
+def get_encoding():
+    """
+    Return the shared tiktoken encoding, or None if it is unavailable offline.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding(EMBEDDING_ENCODING)
+        except Exception as e:
+            print(f"tiktoken encoding unavailable ({type(e).__name__}), estimating token counts")
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text):
+    """
+    Count the tokens in a piece of text.
+    """
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Truncate text so it encodes to at most max_tokens tokens.
+    """
+    encoding = get_encoding()
+    if encoding is None:
+        return text[: max_tokens * CHARS_PER_TOKEN]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max_tokens])
+
+
+def retry_with_backoff(fn, retry_on, max_retries=6, base_delay=1.0, max_delay=60.0, on_retry=None):
+    """
+    Call fn(), retrying with jittered exponential backoff when it raises one of retry_on.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fn()
+        except retry_on as e:
+            if attempt == max_retries:
+                raise
+            delay = min(max_delay, base_delay * 2**attempt) * random.uniform(0.5, 1.0)
+            if on_retry is not None:
+                on_retry(e, delay)
+            time.sleep(delay)
+
 
 def parse_email(raw_email):
     lines = raw_email.splitlines()
@@ -44,3 +107,69 @@ def parse_email(raw_email):
 
     email_data["body"] = "\n".join(body_lines).strip()
     return email_data
+
+
+TRANSACTION_DESCRIPTIONS = [
+    "consulting services",
+    "office supplies",
+    "software license",
+    "travel expenses",
+    "catering",
+    "marketing campaign",
+    "equipment lease",
+    "legal fees",
+]
+
+SUSPICIOUS_DESCRIPTIONS = [
+    "advisory fee",
+    "facilitation payment",
+    "gift",
+    "special arrangement",
+]
+
+PARTICIPANTS = ["Alice", "Bob", "Charlie", "Dana", "Evan", "Fiona", "Maxwell"]
+
+
+def generate_transaction(senders=None, receivers=None, label="normal", amount_range=(10, 5000), rng=random):
+    """
+    Generate a random transaction between two participants, drawing from rng (e.g. a seeded random.Random).
+    """
+    sender = rng.choice(senders or PARTICIPANTS)
+    receiver = rng.choice([r for r in (receivers or PARTICIPANTS) if r != sender] or [sender])
+    descriptions = SUSPICIOUS_DESCRIPTIONS if label == "suspicious" else TRANSACTION_DESCRIPTIONS
+    timestamp = datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(365 * 24 * 60))
+    return {
+        "sender": sender,
+        "receiver": receiver,
+        "amount": round(rng.uniform(*amount_range), 2),
+        "description": rng.choice(descriptions),
+        "label": label,
+        "timestamp": timestamp.isoformat(),
+    }
+
+
+def transaction_text(transaction):
+    """
+    Render a transaction as the sentence that gets embedded.
+    """
+    return f"{transaction['sender']} paid {transaction['receiver']} ${transaction['amount']} for {transaction['description']}"
+
+
+def text_document(path, type, **payload):
+    """
+    Read a text file into a document ready for ingestion.
+    """
+    with open(path) as f:
+        text = f.read()
+    return {"text": text, "payload": {"type": type, "source": path, "text": text, **payload}}
+
+
+def add_text(path, client, qdrant, collection_name, type="document", kwargs=None):
+    """
+    Embed a single text file and add it to Qdrant.
+    """
+    from embedding_cache import get_embedder
+    from ingest import ingest
+
+    document = text_document(path, type, **(kwargs or {}))
+    return ingest([document], get_embedder(client), qdrant, collection_name)